@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Channel fan-out benchmark: registers N users split into channels of a fixed
+size and sends messages in every channel at once. With the channel membership
+index the server CPU spent per message depends on the channel size, not on the
+number of connected users.
+
+Usage: python bench/channels.py [--users 1000 10000] [--members 10] [--messages 20]
+
+"""
+async def join_channel(members, channel):
+    for reader, writer in members:
+        writer.write(f'JOIN {channel}\r\n'.encode())
+        await writer.drain()
+        await reader.readline() # own JOIN echo
+    # Earlier members also saw everyone who joined after them
+    for position, (reader, _writer) in enumerate(members):
+        await common.read_lines(reader, len(members) - 1 - position)
+
+async def channel_traffic(members, channel, messages):
+    (_sender_reader, sender), receivers = members[0], members[1:]
+    readers = asyncio.gather(*(common.read_lines(r, messages) for r, _w in receivers))
+    for i in range(messages):
+        sender.write(f'PRIVMSG {channel} :message {i}\r\n'.encode())
+        await sender.drain()
+    return sum(await readers)
+
+async def fanout(proc, port, users, members, messages):
+    clients = await common.open_clients(port, users)
+    await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+    channels = [clients[start:start + members] for start in range(0, users, members)]
+    await asyncio.gather(*(join_channel(group, f'#c{i}') for i, group in enumerate(channels)))
+
+    cpu_started, started = common.process_cpu_seconds(proc.pid), time.perf_counter()
+    delivered = sum(await asyncio.gather(*(channel_traffic(group, f'#c{i}', messages) for i, group in enumerate(channels))))
+    elapsed, cpu = time.perf_counter() - started, common.process_cpu_seconds(proc.pid) - cpu_started
+    common.close_clients(clients)
+    sent = len(channels) * messages
+    return {
+        'channels': len(channels),
+        'messages_sent': sent,
+        'delivered': delivered,
+        'deliveries_per_second': round(delivered / elapsed),
+        'server_cpu_us_per_message': round(cpu / sent * 1e6, 1),
+    }
+
+async def run(args):
+    common.raise_fd_limit()
+    for users in args.users:
+        proc, port = common.start_server('--engine', args.engine)
+        try:
+            results = await asyncio.wait_for(fanout(proc, port, users, args.members, args.messages), args.timeout)
+            common.report('channels', engine=args.engine, users=users, members=args.members, **results)
+        finally:
+            common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--members', type=int, default=10)
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=600)
+    asyncio.run(run(parser.parse_args()))
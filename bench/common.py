@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Description:
+
+Shared helpers for the benchmark scripts: spawning a server process,
+opening many client connections and reporting machine-readable results.
+
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PATH = os.path.join(ROOT, 'server.py')
+HOST = '127.0.0.1'
+
+# Allow as many sockets as the hard limit permits (server inherits the limit)
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+# Spawn server.py in a scratch directory (keeps log files out of the repo)
+def start_server(*args, port=None, timeout=10, server_path=SERVER_PATH):
+    port = port or free_port()
+    workdir = tempfile.mkdtemp(prefix='irc-bench-')
+    proc = subprocess.Popen([sys.executable, server_path, '--port', str(port), *args], cwd=workdir)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f'Server did not start listening on port {port}')
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+# Resident memory of a process in KiB
+def process_rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+# User + system CPU time of a process in seconds
+def process_cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+# Number of times a process was scheduled off the CPU (each blocking wait counts once)
+def process_context_switches(pid):
+    switches = 0
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(('voluntary_ctxt_switches:', 'nonvoluntary_ctxt_switches:')):
+                switches += int(line.split()[1])
+    return switches
+
+# Open `count` connections in batches so the listen backlog is not overrun
+async def open_clients(port, count, batch=500):
+    clients = list()
+    for start in range(0, count, batch):
+        clients += await asyncio.gather(*(asyncio.open_connection(HOST, port) for _ in range(start, min(count, start + batch))))
+    return clients
+
+# Register NICK/USER and wait for the server to have processed it.
+# The duplicate USER produces a 462 reply which acts as a barrier
+async def register(reader, writer, nick):
+    writer.write(f'NICK {nick}\r\nUSER {nick} hostname servername :{nick}\r\nUSER {nick} hostname servername :{nick}\r\n'.encode())
+    await writer.drain()
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError(f'Server closed connection while registering {nick}')
+        if b' 462 ' in line or line.startswith(b'462'):
+            return
+
+# Read until `expected` CR-LF terminated lines have arrived
+async def read_lines(reader, expected):
+    received = 0
+    while received < expected:
+        data = await reader.read(65536)
+        if not data:
+            break
+        received += data.count(b'\r\n')
+    return received
+
+def close_clients(clients):
+    for _reader, writer in clients:
+        writer.close()
+
+def report(benchmark, **results):
+    print(json.dumps({'benchmark': benchmark, **results}, sort_keys=True))
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from compression import InboundStream
+
+"""
+Description:
+
+Bandwidth and CPU cost of zlib compressed output. For every channel size in
+--members, a server gets that many receivers in #global, either plain or
+after CAP REQ :zlib, and one sender sends --messages chat lines. Reports the
+bytes on the wire per delivered message, the server CPU time per delivered
+message and the time receivers spent inflating, for both kinds of receivers.
+
+Usage: python bench/compression.py [--members 10 100 1000] [--messages 1000] [-- server args]
+
+"""
+WORDS = ('the', 'a', 'to', 'and', 'is', 'you', 'that', 'it', 'of', 'in', 'for', 'on', 'this', 'have', 'with', 'be',
+         'not', 'are', 'but', 'what', 'just', 'so', 'can', 'we', 'do', 'was', 'lol', 'yeah', 'think', 'know', 'server',
+         'build', 'deploy', 'channel', 'message', 'tomorrow', 'meeting', 'release', 'python', 'asyncio', 'bug', 'fixed')
+
+def chat_lines(count, seed=1):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))) for _ in range(count)]
+
+"""
+Description:
+
+One receiving connection: counts wire bytes, inflates when compressed and
+counts the delivered lines.
+
+"""
+class Receiver:
+    def __init__(self, reader, writer, compress):
+        self.reader = reader
+        self.writer = writer
+        self.inbound = InboundStream()
+        self.compress = compress
+        self.wire_bytes = 0
+        self.inflate_seconds = 0
+
+    async def read(self):
+        data = await self.reader.read(65536)
+        self.wire_bytes += len(data)
+        started = time.perf_counter()
+        plain = self.inbound.decode(data)
+        self.inflate_seconds += time.perf_counter() - started
+        return data, plain
+
+    # Register, optionally negotiating compression, and wait until every reply arrived
+    async def register(self, nick):
+        requests = f'NICK {nick}\r\nUSER {nick} h s :{nick}\r\nPING :{nick}-ready\r\n'
+        if self.compress:
+            self.inbound.expect_ack()
+            requests = 'CAP REQ :zlib\r\n' + requests
+        self.writer.write(requests.encode())
+        await self.barrier(f'{nick}-ready')
+
+    async def barrier(self, token):
+        self.writer.write(f'PING :{token}\r\n'.encode())
+        received = b''
+        while token.encode() not in received:
+            data, plain = await self.read()
+            if not data:
+                raise ConnectionError('Server closed the connection')
+            received = received[-64:] + plain
+
+    async def receive(self, count):
+        self.wire_bytes = self.inflate_seconds = 0
+        received = 0
+        while received < count:
+            data, plain = await self.read()
+            if not data:
+                break
+            received += plain.count(b'\r\n')
+        return received
+
+async def measure(args, members, compress, lines):
+    proc, port = common.start_server(*args.server_args)
+    try:
+        receivers = [Receiver(reader, writer, compress) for reader, writer in await common.open_clients(port, members)]
+        for start in range(0, members, 100):
+            await asyncio.gather(*(receiver.register(f'r{i}') for i, receiver in enumerate(receivers[start:start + 100], start)))
+        sender_reader, sender_writer = await asyncio.open_connection(common.HOST, port)
+        await common.register(sender_reader, sender_writer, 'sender')
+        await asyncio.gather(*(receiver.barrier('go') for receiver in receivers))
+
+        cpu = common.process_cpu_seconds(proc.pid)
+        receiving = asyncio.gather(*(receiver.receive(len(lines)) for receiver in receivers))
+        sender_writer.write(b''.join(f'PRIVMSG #global :{line}\r\n'.encode() for line in lines))
+        delivered = sum(await asyncio.wait_for(receiving, args.timeout))
+        cpu = common.process_cpu_seconds(proc.pid) - cpu
+
+        common.close_clients([(receiver.reader, receiver.writer) for receiver in receivers] + [(sender_reader, sender_writer)])
+        return {
+            'delivered': delivered,
+            'wire_bytes_per_message': round(sum(receiver.wire_bytes for receiver in receivers) / delivered, 1),
+            'server_cpu_us_per_message': round(cpu / delivered * 1e6, 2),
+            'client_inflate_us_per_message': round(sum(receiver.inflate_seconds for receiver in receivers) / delivered * 1e6, 2),
+        }
+    finally:
+        common.stop_server(proc)
+
+async def run(args):
+    common.raise_fd_limit()
+    lines = chat_lines(args.messages)
+    for members in args.members:
+        plain = await measure(args, members, False, lines)
+        compressed = await measure(args, members, True, lines)
+        common.report(
+            'compression',
+            members=members,
+            messages=args.messages,
+            server_args=' '.join(args.server_args),
+            plain=plain,
+            zlib=compressed,
+            wire_ratio=round(compressed['wire_bytes_per_message'] / plain['wire_bytes_per_message'], 3),
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, nargs='+', default=[10, 100, 1000], help='receivers in the channel')
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('server_args', nargs=argparse.REMAINDER, help='arguments passed to server.py after --')
+    args = parser.parse_args()
+    if args.server_args[:1] == ['--']:
+        args.server_args = args.server_args[1:]
+    asyncio.run(run(args))
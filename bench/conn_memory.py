@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import gc
+import logging
+import sys
+import tracemalloc
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from framing import LineFramer
+from send_queue import SendQueue
+from server import Server
+
+"""
+Description:
+
+Memory per connection. The table measurement registers --connections handles
+with an in-process server and traces the Python memory of the client table once
+the connections are idle and once they registered with NICK/USER, without the
+file descriptor limit getting in the way. The server measurement opens
+--server-connections real connections to a server process per engine, registers
+them and reports the growth of its resident memory per connection, which also
+includes the socket objects and the poller.
+
+Usage: python bench/conn_memory.py [--connections 100000] [--server-connections 10000] [--engines select asyncio]
+
+"""
+# Python memory of the client table in bytes per connection, idle and registered
+def table(connections):
+    server = Server(['--port', '0'])
+    server.logger = logging.getLogger('conn_memory')
+    server.logger.setLevel(logging.WARNING)
+    handles = [object() for _ in range(connections)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for i, handle in enumerate(handles):
+        server._register_client(handle, (common.HOST, i), LineFramer(scratch=server.recv_scratch), SendQueue(server.sendq_high, server.sendq_low))
+    gc.collect()
+    idle = tracemalloc.get_traced_memory()[0]
+
+    for i, handle in enumerate(handles):
+        data = f'NICK u{i}\r\nUSER u{i} hostname servername :u{i}\r\n'.encode()
+        framer = server.clients[handle].framer
+        framer.get_buffer()[:len(data)] = data
+        framer.commit(len(data))
+        server._process_received(handle, len(data))
+        server._run_turn()
+    gc.collect()
+    registered = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (idle - before) / connections, (registered - before) / connections, server.metrics.registrations
+
+# Resident memory growth of a server process in bytes per registered connection
+async def server_rss(engine, connections):
+    proc, port = common.start_server('--engine', engine)
+    try:
+        before = common.process_rss_kb(proc.pid)
+        clients = await common.open_clients(port, connections)
+        await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+        after = common.process_rss_kb(proc.pid)
+        common.close_clients(clients)
+    finally:
+        common.stop_server(proc)
+    return (after - before) * 1024 / connections, after
+
+async def run(args):
+    idle, registered, registrations = table(args.connections)
+    common.report(
+        'conn_memory',
+        measurement='table',
+        connections=args.connections,
+        registered=registrations,
+        idle_bytes_per_connection=round(idle),
+        registered_bytes_per_connection=round(registered),
+    )
+
+    limit = common.raise_fd_limit()
+    connections = min(args.server_connections, limit - 100)
+    for engine in args.engines:
+        per_connection, rss_kb = await server_rss(engine, connections)
+        common.report(
+            'conn_memory',
+            measurement='server',
+            engine=engine,
+            connections=connections,
+            rss_bytes_per_connection=round(per_connection),
+            server_rss_kb=rss_kb,
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=100000, help='in-process client table size')
+    parser.add_argument('--server-connections', type=int, default=10000, help='real connections, capped by the file descriptor limit')
+    parser.add_argument('--engines', nargs='+', choices=['select', 'asyncio'], default=['select', 'asyncio'])
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Direct message latency benchmark: two clients exchange PRIVMSGs addressed to
+each other's nickname while N other registered users stay connected. With the
+nickname index the latency does not depend on the number of connected users.
+
+Usage: python bench/direct.py [--users 10 50000] [--messages 2000]
+
+"""
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def ping_pong(port, users, messages):
+    idle = await common.open_clients(port, users)
+    await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(idle)))
+    (ping_reader, ping), (pong_reader, pong) = await common.open_clients(port, 2)
+    await common.register(ping_reader, ping, 'Ping')
+    await common.register(pong_reader, pong, 'Pong')
+
+    samples = list()
+    for i in range(messages):
+        started = time.perf_counter()
+        # Casemapped target: "pong" reaches "Pong"
+        ping.write(f'PRIVMSG pong :{i}\r\n'.encode())
+        await pong_reader.readline()
+        pong.write(f'PRIVMSG ping :{i}\r\n'.encode())
+        await ping_reader.readline()
+        samples.append((time.perf_counter() - started) / 2 * 1e6)
+    common.close_clients(idle + [(ping_reader, ping), (pong_reader, pong)])
+    return sorted(samples)
+
+async def run(args):
+    limit = common.raise_fd_limit()
+    for users in args.users:
+        if users + 64 > limit:
+            print(f'Skipping {users} users, the open file limit is {limit}')
+            continue
+        proc, port = common.start_server('--engine', args.engine)
+        try:
+            samples = await asyncio.wait_for(ping_pong(port, users, args.messages), args.timeout)
+            common.report(
+                'direct',
+                engine=args.engine,
+                users=users,
+                messages=args.messages,
+                p50_us=round(percentile(samples, 0.50), 1),
+                p99_us=round(percentile(samples, 0.99), 1),
+            )
+        finally:
+            common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50000])
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--timeout', type=float, default=600)
+    asyncio.run(run(parser.parse_args()))
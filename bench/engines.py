@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Compares the select and asyncio server engines on connection churn
+(connect, register, disconnect) and broadcast fan-out throughput.
+
+Usage: python bench/engines.py [--churn 2000] [--receivers 200] [--messages 500]
+
+"""
+async def churn(port, total, concurrency):
+    remaining = iter(range(total))
+
+    async def worker():
+        for i in remaining:
+            reader, writer = await asyncio.open_connection(common.HOST, port)
+            await common.register(reader, writer, f'c{i}')
+            writer.close()
+            await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+async def fanout(port, receivers, messages):
+    clients = await common.open_clients(port, receivers + 1)
+    await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+    sender = clients[0][1]
+    started = time.perf_counter()
+    readers = asyncio.gather(*(common.read_lines(r, messages) for r, _w in clients))
+    for _ in range(messages):
+        sender.write(b'PRIVMSG #global :fan-out payload\r\n')
+        await sender.drain()
+    delivered = sum(await readers)
+    elapsed = time.perf_counter() - started
+    common.close_clients(clients)
+    return delivered / elapsed
+
+async def run(args):
+    common.raise_fd_limit()
+    for engine in args.engines:
+        proc, port = common.start_server('--engine', engine)
+        try:
+            common.report(
+                'engines',
+                engine=engine,
+                churn_connections_per_second=round(await churn(port, args.churn, args.concurrency)),
+                fanout_deliveries_per_second=round(await fanout(port, args.receivers, args.messages)),
+            )
+        finally:
+            common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engines', nargs='+', default=['select', 'asyncio'])
+    parser.add_argument('--churn', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--receivers', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,82 @@
+import argparse
+import socket
+import sys
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from send_queue import SendQueue
+
+"""
+Description:
+
+Fan-out stage microbenchmark for a single large channel. Bursts of messages are
+delivered to every member over socket pairs, comparing the original approach
+(format, encode and sendall per recipient and message) with encode-once fan-out
+(one shared bytes object queued by reference, drained with coalesced sendmsg).
+Only the server side is timed, draining the members is not.
+
+Usage: python bench/fanout.py [--members 5000] [--messages 200] [--burst 10]
+
+"""
+def drain(readers):
+    for reader in readers:
+        try:
+            while reader.recv(1 << 20):
+                pass
+        except BlockingIOError:
+            pass
+
+# Original approach kept for comparison
+def per_recipient(writers, queues, burst):
+    for i in range(burst):
+        for writer in writers:
+            response = f':sender message number {i}\r\n'.encode('utf-8')
+            writer.sendall(response)
+    return len(writers) * burst
+
+def encode_once(writers, queues, burst):
+    for i in range(burst):
+        response = f':sender message number {i}\r\n'.encode('utf-8')
+        for send_queue in queues:
+            send_queue.push(response)
+    calls = 0
+    for writer, send_queue in zip(writers, queues):
+        while send_queue:
+            send_queue.send(writer)
+            calls += 1
+    return calls
+
+def measure(deliver, members, messages, burst):
+    pairs = [socket.socketpair() for _ in range(members)]
+    writers, readers = [w for w, _r in pairs], [r for _w, r in pairs]
+    for reader in readers:
+        reader.setblocking(0)
+    queues = [SendQueue(1 << 30, 1 << 29) for _ in range(members)]
+    elapsed, calls = 0, 0
+    for _ in range(messages // burst):
+        started = time.perf_counter()
+        calls += deliver(writers, queues, burst)
+        elapsed += time.perf_counter() - started
+        drain(readers)
+    for writer, reader in pairs:
+        writer.close()
+        reader.close()
+    sent = messages // burst * burst
+    return {
+        'messages_per_second': round(sent / elapsed),
+        'deliveries_per_second': round(sent * members / elapsed),
+        'send_calls': calls,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--burst', type=int, default=10)
+    args = parser.parse_args()
+    common.raise_fd_limit()
+    common.report('fanout', members=args.members, messages=args.messages, burst=args.burst,
+        per_recipient=measure(per_recipient, args.members, args.messages, args.burst),
+        encode_once=measure(encode_once, args.members, args.messages, args.burst))
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import time
+
+import common
+import loadgen
+
+"""
+Description:
+
+Latency of well-behaved clients next to flooders. Well-behaved clients share a
+channel and send PRIVMSG at a fixed rate, like bench/loadgen.py; every flooder
+pipelines PRIVMSG to a sink client as fast as the server reads them. Runs once
+per server configuration, by default the old unbounded per-client processing,
+round-robin turns of --commands-per-turn requests and the turns plus a flood
+limit, and reports the delivery latency of the well-behaved traffic.
+
+Usage: python bench/flood.py [--clients 20] [--senders 10] [--rate 10] [--flooders 2] [--duration 5] [--engine select]
+
+"""
+CALM_CHANNEL = '#calm'
+SINK = 'sink'
+
+CONFIGURATIONS = {
+    'unbounded': ['--commands-per-turn', '1000000'],
+    'round_robin': ['--commands-per-turn', '16'],
+    'flood_limit': ['--commands-per-turn', '16', '--flood-rate', '20', '--flood-burst', '40', '--flood-penalty', 'delay'],
+}
+
+# Pipeline lines until the run ends, waiting only for the socket to accept them.
+# A throttled flooder is no longer read from, so its last drain may wait until the end
+async def flood(port, nickname, until, batch=100):
+    reader, writer = await asyncio.open_connection(common.HOST, port)
+    await common.register(reader, writer, nickname)
+    chunk = ''.join(f'PRIVMSG {SINK} :flood {i} from {nickname}\r\n' for i in range(batch)).encode()
+    sent = 0
+    while time.perf_counter_ns() < until:
+        writer.write(chunk)
+        sent += batch
+        try:
+            await asyncio.wait_for(writer.drain(), max(0, until - time.perf_counter_ns()) / 1e9)
+        except asyncio.TimeoutError:
+            break
+    writer.transport.abort()
+    return sent
+
+async def load(proc, port, args):
+    assignment = [[CALM_CHANNEL] for _ in range(args.clients)]
+    recipients = loadgen.recipients_per_channel(assignment)
+    deliveries = loadgen.Deliveries()
+    clients = await loadgen.connect(port, assignment, args.clients, deliveries)
+    loop = asyncio.get_running_loop()
+    _transport, sink = await loop.create_connection(lambda: loadgen.LoadClient(SINK, [f'#{SINK}'], False, loadgen.Deliveries()), common.HOST, port)
+    await asyncio.gather(sink.ready.wait(), *(client.ready.wait() for client in clients))
+
+    padding = 'x' * max(1, args.payload_bytes - len(loadgen.MARKER) - 20)
+    cpu_started, started = common.process_cpu_seconds(proc.pid), time.perf_counter()
+    until = time.perf_counter_ns() + round(args.duration * 1e9)
+    flooders = asyncio.gather(*(flood(port, f'f{i}', until) for i in range(args.flooders)))
+    await asyncio.gather(*(loadgen.send(clients[i].transport, assignment[i], recipients, args.rate, until, padding, deliveries) for i in range(args.senders)))
+    flooded = sum(await flooders)
+    deliveries.sending = False
+    deliveries.check_done()
+    try:
+        await asyncio.wait_for(deliveries.done.wait(), args.drain)
+    except asyncio.TimeoutError:
+        pass
+    elapsed, cpu = time.perf_counter() - started, common.process_cpu_seconds(proc.pid) - cpu_started
+
+    for client in clients + [sink]:
+        client.transport.close()
+    latency = deliveries.latency
+    return {
+        'sent': deliveries.sent,
+        'delivered': deliveries.delivered,
+        'lost': deliveries.expected - deliveries.delivered,
+        'flood_lines_written': flooded,
+        'latency_p50_seconds': latency.quantile(0.5),
+        'latency_p99_seconds': latency.quantile(0.99),
+        'latency_p999_seconds': latency.quantile(0.999),
+        'server_cpu_seconds': round(cpu, 3),
+        'seconds': round(elapsed, 3),
+    }
+
+async def run(args):
+    common.raise_fd_limit()
+    for name in args.configurations:
+        proc, port = common.start_server('--engine', args.engine, *CONFIGURATIONS[name])
+        try:
+            results = await asyncio.wait_for(load(proc, port, args), args.timeout)
+        finally:
+            common.stop_server(proc)
+        common.report('flood', configuration=name, engine=args.engine, flooders=args.flooders, **results)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=20, help='well-behaved clients, all of them record latency')
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=10, help='messages per second of every well-behaved sender')
+    parser.add_argument('--flooders', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--payload-bytes', type=int, default=64)
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--configurations', nargs='+', choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument('--drain', type=float, default=10, help='seconds to wait for late deliveries')
+    parser.add_argument('--timeout', type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
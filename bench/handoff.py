@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import common
+
+"""
+Description:
+
+Hot upgrade with many connected clients. Starts a server with --handoff,
+registers --clients clients and then starts a second server on the same handoff
+socket, which takes the listening socket and every connection over. A probe
+client keeps sending PING meanwhile; the longest wait for a PONG is the pause
+the clients see. Afterwards a message to #global has to reach every client over
+its original connection.
+
+Usage: python bench/handoff.py [--clients 10000]
+
+"""
+# PING until `done` is set. Returns the longest time between sending a PING and its PONG
+async def probe(reader, writer, done):
+    longest = 0
+    while not done.is_set():
+        started = time.perf_counter()
+        writer.write(b'PING :probe\r\n')
+        while b'PONG' not in await reader.readline():
+            pass
+        longest = max(longest, time.perf_counter() - started)
+        await asyncio.sleep(0.001)
+    return longest
+
+async def wait_exit(proc, done):
+    while proc.poll() is None:
+        await asyncio.sleep(0.001)
+    done.set()
+
+async def load(port, handoff_path, old, args):
+    clients = await common.open_clients(port, args.clients)
+    await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+    probe_reader, probe_writer = await asyncio.open_connection(common.HOST, port)
+    await common.register(probe_reader, probe_writer, 'probe')
+
+    done = asyncio.Event()
+    started = time.perf_counter()
+    probing = asyncio.ensure_future(probe(probe_reader, probe_writer, done))
+    new, _port = common.start_server('--handoff', handoff_path, port=port)
+    await wait_exit(old, done)
+    exit_seconds = time.perf_counter() - started
+    pause = await probing
+
+    # Every client still has its connection and gets the message from the new server
+    probe_writer.write(b'PRIVMSG #global :after handoff\r\n')
+    received = await asyncio.wait_for(asyncio.gather(*(common.read_lines(r, 1) for r, _w in clients)), args.timeout)
+    common.close_clients(clients + [(probe_reader, probe_writer)])
+    return new, {
+        'old_server_exit_seconds': round(exit_seconds, 3),
+        'max_ping_seconds': round(pause, 3),
+        'delivered_after_handoff': sum(received),
+        'old_server_exit_code': old.returncode,
+    }
+
+async def run(args):
+    common.raise_fd_limit()
+    directory = tempfile.mkdtemp(prefix='irc-handoff-')
+    handoff_path = os.path.join(directory, 'handoff.sock')
+    old, port = common.start_server('--handoff', handoff_path)
+    new = None
+    try:
+        new, results = await asyncio.wait_for(load(port, handoff_path, old, args), args.timeout)
+        common.report('handoff', clients=args.clients, **results)
+    finally:
+        for proc in (old, new):
+            if proc is not None:
+                common.stop_server(proc)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--timeout', type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import logging
+import sys
+import threading
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+import irc_client
+from irc_client import HeadlessClient, IRCClient
+
+"""
+Description:
+
+Messages per second one client pushes through the server. A receiver joined to
+#global counts deliveries while a single sender sends --messages lines, either
+through IRCClient.process_input, one blocking sendall per line as typed in the
+curses client, or through the pipelined HeadlessClient. Each rate is taken from
+the first request until the receiver got the last message.
+
+Usage: python bench/headless_client.py [--messages 100000] [--payload-bytes 32] [-- server args]
+
+"""
+# The global channel echoes every message back, the curses client reads it in its listening thread
+def discard(sock):
+    try:
+        while sock.recv(65536):
+            pass
+    except OSError:
+        pass
+
+# The curses client, sending from its own thread the way the UI thread does
+def send_blocking(port, count, payload):
+    client = IRCClient(common.HOST, port)
+    client.init_tcp_connection()
+    # init_tcp_connection leaves the socket non-blocking, sendall would fail on a full buffer
+    client.socket.setblocking(1)
+    threading.Thread(target=discard, args=(client.socket,), daemon=True).start()
+    client.process_input('/nick sender')
+    client.process_input('/user sender')
+    for i in range(count):
+        client.process_input(f'{i} {payload}')
+    return client
+
+async def send_pipelined(port, count, payload):
+    client = HeadlessClient(common.HOST, port, keep_messages=False)
+    await client.connect()
+    client.send_input('/nick sender')
+    client.send_input('/user sender')
+    for i in range(count):
+        client.send_input(f'{i} {payload}')
+        if client.buffered() > irc_client.constants.CLIENT_SEND_HIGH_WATER:
+            await client.drain()
+    await client.sync()
+    return client
+
+async def measure(port, args, mode):
+    reader, writer = await asyncio.open_connection(common.HOST, port)
+    await common.register(reader, writer, 'receiver')
+    payload = 'x' * args.payload_bytes
+    started = time.perf_counter()
+    receiving = asyncio.ensure_future(common.read_lines(reader, args.messages))
+    if mode == 'blocking':
+        sender = await asyncio.to_thread(send_blocking, port, args.messages, payload)
+    else:
+        sender = await send_pipelined(port, args.messages, payload)
+    received = await asyncio.wait_for(receiving, args.timeout)
+    seconds = time.perf_counter() - started
+    writer.close()
+    if mode == 'blocking':
+        sender.close()
+    else:
+        await sender.close()
+    return {f'{mode}_received': received, f'{mode}_msgs_per_second': round(received / seconds)}
+
+async def run(args):
+    # Same level as the headless command line, so only the per-request INFO logs of process_input are written
+    irc_client.logger.setLevel(logging.INFO)
+    results = dict()
+    for mode in ('blocking', 'pipelined'):
+        proc, port = common.start_server(*args.server_args)
+        try:
+            results.update(await measure(port, args, mode))
+        finally:
+            common.stop_server(proc)
+    common.report('headless_client', messages=args.messages, payload_bytes=args.payload_bytes, **results)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--payload-bytes', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('server_args', nargs=argparse.REMAINDER, help='arguments passed to server.py after --')
+    args = parser.parse_args()
+    if args.server_args[:1] == ['--']:
+        args.server_args = args.server_args[1:]
+    asyncio.run(run(args))
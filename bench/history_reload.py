@@ -0,0 +1,89 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from history import ChannelHistory, HistoryLog
+
+"""
+Description:
+
+Startup cost of the persistent channel history. Records --messages channel
+messages spread over --channels channels into a HistoryLog, then measures
+reloading them into fresh history rings in-process and the time until a server
+started on the same log accepts connections, next to a server without history.
+Also reports the cost of recording a line and of building one replay.
+
+Usage: python bench/history_reload.py [--messages 1000000] [--channels 100] [--lines 50] [--payload-bytes 64]
+
+"""
+def record(directory, args):
+    rng = random.Random(1)
+    channels = [f'#c{i}' for i in range(args.channels)]
+    payload = 'x' * args.payload_bytes
+    history = ChannelHistory(args.lines)
+    history.attach(HistoryLog(directory))
+    lines = [(channel, f':u{i % 1000} PRIVMSG {channel} :{payload}\r\n'.encode()) for i, channel in enumerate(rng.choices(channels, k=args.messages))]
+    started = time.perf_counter()
+    for channel, line in lines:
+        history.record(channel, line)
+    seconds = time.perf_counter() - started
+    history.close()
+    return seconds / args.messages
+
+def reload(directory, args):
+    history = ChannelHistory(args.lines)
+    started = time.perf_counter()
+    records = history.attach(HistoryLog(directory))
+    seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    replayed = sum(len(history.replay(channel)) for channel in list(history.rings))
+    replay_seconds = (time.perf_counter() - started) / len(history)
+    history.close()
+    return records, seconds, replay_seconds, replayed
+
+# Seconds from spawning a server until it accepts connections
+def server_startup(*args):
+    started = time.perf_counter()
+    proc, _port = common.start_server(*args)
+    seconds = time.perf_counter() - started
+    common.stop_server(proc)
+    return seconds
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix='irc-history-')
+    try:
+        record_seconds = record(directory, args)
+        log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        records, reload_seconds, replay_seconds, replayed = reload(directory, args)
+        common.report(
+            'history_reload',
+            messages=args.messages,
+            channels=args.channels,
+            lines=args.lines,
+            records_loaded=records,
+            replayed_bytes=replayed,
+            log_bytes=log_bytes,
+            record_us=round(record_seconds * 1e6, 3),
+            reload_seconds=round(reload_seconds, 3),
+            replay_us=round(replay_seconds * 1e6, 2),
+            server_startup_seconds=round(server_startup('--history-lines', str(args.lines), '--history-dir', directory), 3),
+            server_startup_no_history_seconds=round(server_startup(), 3),
+        )
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--channels', type=int, default=100)
+    parser.add_argument('--lines', type=int, default=50, help='history lines per channel')
+    parser.add_argument('--payload-bytes', type=int, default=64)
+    run(parser.parse_args())
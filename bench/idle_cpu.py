@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Idle server benchmark: connects and registers clients that stay silent,
+then samples the server CPU usage and wakeups per second.
+
+Usage: python bench/idle_cpu.py [--clients 1000] [--duration 5] [--engine select]
+
+"""
+async def run(args):
+    common.raise_fd_limit()
+    proc, port = common.start_server('--engine', args.engine)
+    try:
+        clients = await common.open_clients(port, args.clients)
+        await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+
+        cpu_before = common.process_cpu_seconds(proc.pid)
+        switches_before = common.process_context_switches(proc.pid)
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - started
+        cpu = common.process_cpu_seconds(proc.pid) - cpu_before
+        switches = common.process_context_switches(proc.pid) - switches_before
+
+        common.report(
+            'idle_cpu',
+            engine=args.engine,
+            clients=len(clients),
+            duration_seconds=round(elapsed, 3),
+            cpu_percent=round(100 * cpu / elapsed, 2),
+            wakeups_per_second=round(switches / elapsed, 2),
+        )
+        common.close_clients(clients)
+    finally:
+        common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    asyncio.run(run(parser.parse_args()))
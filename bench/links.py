@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import common
+
+"""
+Description:
+
+Server linking benchmark: runs a chain of 1..N linked servers, sends broadcasts
+from a client on the first server and measures delivery latency at a client on
+the last one. Every message carries its send timestamp. The servers share a
+link password.
+
+Usage: python bench/links.py [--servers 1 2 3] [--messages 2000] [--engine select]
+
+"""
+LINK_PASSWORD = 'bench-link'
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def latency(ports, messages):
+    (sender_reader, sender), = await common.open_clients(ports[0], 1)
+    (receiver, receiver_writer), = await common.open_clients(ports[-1], 1)
+    await common.register(sender_reader, sender, 'sender')
+    await common.register(receiver, receiver_writer, 'receiver')
+    # The sender is known on the last server once a broadcast makes it through
+    while True:
+        sender.write(b'PRIVMSG #global :warmup\r\n')
+        await sender.drain()
+        try:
+            await asyncio.wait_for(receiver.readuntil(b'warmup\r\n'), 0.5)
+            break
+        except asyncio.TimeoutError:
+            pass
+
+    samples = list()
+    for _ in range(messages):
+        sender.write(f'PRIVMSG #global :{time.perf_counter_ns()}\r\n'.encode())
+        await sender.drain()
+        line = await receiver.readline()
+        while line.endswith(b'warmup\r\n'): # late warmup copies
+            line = await receiver.readline()
+        samples.append((time.perf_counter_ns() - int(line.rsplit(b' ', 1)[1])) / 1000)
+    common.close_clients([(sender_reader, sender), (receiver, receiver_writer)])
+    return sorted(samples)
+
+async def run(args):
+    for servers in args.servers:
+        procs, ports = list(), list()
+        try:
+            for i in range(servers):
+                link = ['--link', f'{common.HOST}:{ports[-1]}'] if ports else []
+                proc, port = common.start_server('--engine', args.engine, '--server-name', f'bench{i}.local', '--link-password', LINK_PASSWORD, *link)
+                procs.append(proc)
+                ports.append(port)
+            samples = await asyncio.wait_for(latency(ports, args.messages), args.timeout)
+            common.report(
+                'links',
+                engine=args.engine,
+                servers=servers,
+                messages=args.messages,
+                p50_us=round(percentile(samples, 0.50), 1),
+                p99_us=round(percentile(samples, 0.99), 1),
+                mean_us=round(statistics.fmean(samples), 1),
+            )
+        finally:
+            for proc in procs:
+                common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--servers', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Connection scale load test: holds many idle connections open while a set of
+registered clients broadcast to each other, all against a single server process.
+
+Usage: python bench/load_connections.py [--idle 10000] [--active 1000] [--poller default]
+
+"""
+async def run(args):
+    common.raise_fd_limit()
+    proc, port = common.start_server('--poller', args.poller)
+    try:
+        started = time.perf_counter()
+        idle = await common.open_clients(port, args.idle)
+        connect_time = time.perf_counter() - started
+
+        active = await common.open_clients(port, args.active)
+        await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(active)))
+
+        # Every active client broadcasts once and receives everyone's message (own echo included)
+        started = time.perf_counter()
+        for _reader, writer in active:
+            writer.write(b'PRIVMSG #global :hello\r\n')
+        received = await asyncio.wait_for(
+            asyncio.gather(*(common.read_lines(r, args.active) for r, _w in active)), args.timeout)
+        fanout_time = time.perf_counter() - started
+
+        common.report(
+            'load_connections',
+            poller=args.poller,
+            idle_connections=len(idle),
+            active_connections=len(active),
+            connect_seconds=round(connect_time, 3),
+            fanout_seconds=round(fanout_time, 3),
+            delivered=sum(received),
+            server_rss_kb=common.process_rss_kb(proc.pid),
+        )
+        common.close_clients(idle + active)
+    finally:
+        common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--idle', type=int, default=10000)
+    parser.add_argument('--active', type=int, default=1000)
+    parser.add_argument('--poller', default='default')
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
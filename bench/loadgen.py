@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from metrics import LatencyHistogram
+
+"""
+Description:
+
+End-to-end load generator. Starts a server, opens thousands of synthetic asyncio
+clients, registers them with NICK/USER, joins them to channels of a configurable
+shape and drives PRIVMSG traffic at a fixed per-sender rate for a fixed time.
+Every payload carries its scheduled send time; the first --probes receivers
+turns it into a delivery latency recorded in an HDR-style histogram, the others
+only count deliveries. Latency is measured from the scheduled time, so a
+saturated server (or load generator, see loadgen_cpu_seconds) shows up as
+latency instead of silently lowering the offered rate.
+
+Channel shapes:
+    --channels 0              every client talks on #global
+    --channels N --joins K    every client joins K of N named channels, picked
+                              uniformly or with Zipf popularity (--shape zipf)
+
+The JSON result can be appended to a file with --output and compared to an
+earlier result with --baseline; regressions beyond --tolerance make the exit
+status 1. Arguments after `--` are passed to server.py.
+
+Usage: python bench/loadgen.py [--clients 1000] [--senders 100] [--rate 10] [--duration 10]
+                               [--channels 0] [--joins 1] [--shape {uniform,zipf}] [--payload-bytes 64] [--probes 100]
+                               [--server PATH] [--output FILE] [--baseline FILE] [--tolerance 0.1] [-- SERVER ARGS]
+
+"""
+MARKER = b'LT='
+GLOBAL_CHANNEL = '#global'
+
+"""
+Description:
+
+Totals shared by the senders and the receivers of one run. `done` is set once
+sending stopped and every expected delivery arrived.
+
+"""
+class Deliveries:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.sent = 0
+        self.expected = 0
+        self.delivered = 0
+        self.sending = True
+        self.done = asyncio.Event()
+
+    def check_done(self):
+        if not self.sending and self.delivered >= self.expected:
+            self.done.set()
+
+"""
+Description:
+
+Synthetic client. Registers and joins its channels as soon as it is connected;
+the 462 reply to a repeated USER marks the end of its setup. After that every
+received chunk is only scanned for payload markers, probes also parse the
+send times. Callbacks instead of stream reader tasks keep the load generator
+cheaper than the server it measures.
+
+"""
+class LoadClient(asyncio.Protocol):
+    def __init__(self, nickname, channels, probe, deliveries):
+        self.nickname = nickname
+        self.channels = channels
+        self.probe = probe
+        self.deliveries = deliveries
+        self.transport = None
+        self.ready = asyncio.Event()
+        self.pending = b'' # incomplete line, or the tail that may hold part of a marker
+
+    def connection_made(self, transport):
+        self.transport = transport
+        setup = f'NICK {self.nickname}\r\nUSER {self.nickname} hostname servername :{self.nickname}\r\n'
+        if self.channels != [GLOBAL_CHANNEL]:
+            setup += f'JOIN {",".join(self.channels)}\r\n'
+        setup += f'USER {self.nickname} hostname servername :{self.nickname}\r\n'
+        transport.write(setup.encode())
+
+    def data_received(self, data):
+        deliveries = self.deliveries
+        # Keepalive of long runs. Any reply counts, so the token is not needed
+        if b'PING :' in data:
+            self.transport.write(b'PONG :loadgen\r\n')
+        # Setup replies. Traffic only starts once every client is ready
+        if not self.ready.is_set():
+            lines = (self.pending + data).split(b'\r\n')
+            self.pending = lines.pop()
+            if any(b' 462 ' in line for line in lines):
+                self.ready.set()
+                self.pending = b''
+            return
+        if self.probe:
+            lines = (self.pending + data).split(b'\r\n')
+            self.pending = lines.pop()
+            received_at = time.perf_counter_ns()
+            for line in lines:
+                start = line.find(MARKER)
+                if start >= 0:
+                    start += len(MARKER)
+                    deliveries.latency.record(max(0, received_at - int(line[start:line.index(b' ', start)])))
+                    deliveries.delivered += 1
+        else:
+            # A marker split between two chunks is counted once with the carried tail
+            deliveries.delivered += (self.pending + data).count(MARKER)
+            self.pending = data[1 - len(MARKER):]
+        if deliveries.delivered >= deliveries.expected:
+            deliveries.check_done()
+
+# Channels of every client. Zipf makes the first channels the most popular ones
+def assign_channels(clients, channels, joins, shape, seed):
+    if channels == 0:
+        return [[GLOBAL_CHANNEL] for _ in range(clients)]
+    rng = random.Random(seed)
+    names = [f'#load{i}' for i in range(channels)]
+    weights = [1 / (rank + 1) for rank in range(channels)] if shape == 'zipf' else None
+    joins = min(joins, channels)
+    assignment = list()
+    for _ in range(clients):
+        chosen = set()
+        while len(chosen) < joins:
+            chosen.add(rng.choices(names, weights)[0])
+        assignment.append(sorted(chosen))
+    return assignment
+
+# Deliveries of one message: #global echoes to the sender, named channels do not
+def recipients_per_channel(assignment):
+    members = dict()
+    for channels in assignment:
+        for channel in channels:
+            members[channel] = members.get(channel, 0) + 1
+    return {channel: count if channel == GLOBAL_CHANNEL else count - 1 for channel, count in members.items()}
+
+async def send(transport, targets, recipients, rate, until, padding, deliveries):
+    interval_ns = round(1e9 / rate)
+    scheduled = time.perf_counter_ns()
+    for i in range(sys.maxsize):
+        if scheduled >= until:
+            return
+        target = targets[i % len(targets)]
+        transport.write(f'PRIVMSG {target} :{MARKER.decode()}{scheduled} {padding}\r\n'.encode())
+        deliveries.sent += 1
+        deliveries.expected += recipients[target]
+        scheduled += interval_ns
+        await asyncio.sleep(max(0, scheduled - time.perf_counter_ns()) / 1e9)
+
+# Connect in batches so the listen backlog is not overrun
+async def connect(port, assignment, probes, deliveries, batch=500):
+    loop = asyncio.get_running_loop()
+    clients = list()
+    for first in range(0, len(assignment), batch):
+        connections = await asyncio.gather(*(
+            loop.create_connection(lambda i=i: LoadClient(f'l{i}', assignment[i], i < probes, deliveries), common.HOST, port)
+            for i in range(first, min(len(assignment), first + batch))))
+        clients += [protocol for _transport, protocol in connections]
+    return clients
+
+async def load(proc, port, args):
+    assignment = assign_channels(args.clients, args.channels, args.joins, args.shape, args.seed)
+    recipients = recipients_per_channel(assignment)
+    deliveries = Deliveries()
+    clients = await connect(port, assignment, args.probes, deliveries)
+    await asyncio.gather(*(client.ready.wait() for client in clients))
+
+    padding = 'x' * max(1, args.payload_bytes - len(MARKER) - 20)
+    senders = random.Random(args.seed).sample(range(args.clients), min(args.senders, args.clients))
+    cpu_started, started, loadgen_cpu_started = common.process_cpu_seconds(proc.pid), time.perf_counter(), time.process_time()
+    until = time.perf_counter_ns() + round(args.duration * 1e9)
+    await asyncio.gather(*(send(clients[i].transport, assignment[i], recipients, args.rate, until, padding, deliveries) for i in senders))
+    deliveries.sending = False
+    deliveries.check_done()
+    try:
+        await asyncio.wait_for(deliveries.done.wait(), args.drain)
+    except asyncio.TimeoutError:
+        pass
+    elapsed, cpu = time.perf_counter() - started, common.process_cpu_seconds(proc.pid) - cpu_started
+    loadgen_cpu = time.process_time() - loadgen_cpu_started
+
+    for client in clients:
+        client.transport.close()
+    latency = deliveries.latency
+    return {
+        'clients': args.clients,
+        'senders': len(senders),
+        'rate_per_sender': args.rate,
+        'channels': args.channels,
+        'joins': args.joins if args.channels else 1,
+        'shape': args.shape if args.channels else 'global',
+        'payload_bytes': args.payload_bytes,
+        'seconds': round(elapsed, 3),
+        'sent': deliveries.sent,
+        'expected_deliveries': deliveries.expected,
+        'delivered': deliveries.delivered,
+        'lost': deliveries.expected - deliveries.delivered,
+        'messages_per_second': round(deliveries.sent / elapsed),
+        'deliveries_per_second': round(deliveries.delivered / elapsed),
+        'latency_p50_seconds': latency.quantile(0.5),
+        'latency_p99_seconds': latency.quantile(0.99),
+        'latency_p999_seconds': latency.quantile(0.999),
+        'server_cpu_seconds': round(cpu, 3),
+        'server_rss_kb': common.process_rss_kb(proc.pid),
+        'loadgen_cpu_seconds': round(loadgen_cpu, 3),
+    }
+
+# Lower throughput or higher latency than the baseline by more than `tolerance`
+def regressions(results, baseline, tolerance):
+    found = list()
+    for key in ('messages_per_second', 'deliveries_per_second'):
+        if key in baseline and results[key] < baseline[key] * (1 - tolerance):
+            found.append(f'{key} {results[key]} < {baseline[key]}')
+    for key in ('latency_p50_seconds', 'latency_p99_seconds', 'latency_p999_seconds'):
+        if key in baseline and results[key] > baseline[key] * (1 + tolerance):
+            found.append(f'{key} {results[key]} > {baseline[key]}')
+    if results['lost'] > baseline.get('lost', 0):
+        found.append(f'lost {results["lost"]} > {baseline.get("lost", 0)}')
+    return found
+
+# Last result line of a file written with --output
+def read_baseline(path):
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1])
+
+async def run(args):
+    common.raise_fd_limit()
+    proc, port = common.start_server(*args.server_args, server_path=args.server)
+    try:
+        results = await asyncio.wait_for(load(proc, port, args), args.timeout)
+    finally:
+        common.stop_server(proc)
+    if args.baseline:
+        results['regressions'] = regressions(results, read_baseline(args.baseline), args.tolerance)
+    common.report('loadgen', server_args=' '.join(args.server_args), **results)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps({'benchmark': 'loadgen', 'server_args': ' '.join(args.server_args), **results}, sort_keys=True) + '\n')
+    return 1 if results.get('regressions') else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--senders', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=10, help='messages per second of every sender')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of traffic')
+    parser.add_argument('--channels', type=int, default=0, help='named channels, 0 sends everything to #global')
+    parser.add_argument('--joins', type=int, default=1, help='named channels joined by every client')
+    parser.add_argument('--shape', choices=['uniform', 'zipf'], default='uniform', help='channel popularity')
+    parser.add_argument('--payload-bytes', type=int, default=64)
+    parser.add_argument('--probes', type=int, default=100, help='receivers that record delivery latency')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--drain', type=float, default=10, help='seconds to wait for late deliveries')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--server', default=common.SERVER_PATH, help='server.py to run, e.g. of another checkout')
+    parser.add_argument('--output', help='append the JSON result to this file')
+    parser.add_argument('--baseline', help='compare with the last result in this file')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('server_args', nargs=argparse.REMAINDER, help='arguments for server.py after --')
+    args = parser.parse_args()
+    if args.server_args[:1] == ['--']:
+        args.server_args = args.server_args[1:]
+    sys.exit(asyncio.run(run(args)))
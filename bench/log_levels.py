@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import os
+import time
+
+import common
+
+"""
+Description:
+
+Logging overhead benchmark: runs the pipelined PRIVMSG workload with the server
+at each --log-level and reports requests per second and how many bytes of log
+the run produced. DEBUG logs every request plus a sample of the deliveries.
+
+Usage: python bench/log_levels.py [--levels DEBUG INFO] [--batch 500] [--batches 40] [--receivers 10]
+
+"""
+async def pipelined(port, batch, batches, receivers):
+    clients = await common.open_clients(port, receivers + 1)
+    await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+    sender_writer = clients[0][1]
+    payload = b'PRIVMSG #global :pipelined message\r\n' * batch
+    total = batch * batches
+    started = time.perf_counter()
+    readers = asyncio.gather(*(common.read_lines(r, total) for r, _w in clients))
+    for _ in range(batches):
+        sender_writer.write(payload)
+        await sender_writer.drain()
+    await readers
+    elapsed = time.perf_counter() - started
+    common.close_clients(clients)
+    return total, elapsed
+
+async def run(args):
+    for level in args.levels:
+        proc, port = common.start_server('--log-level', level)
+        log_path = os.path.join(os.readlink(f'/proc/{proc.pid}/cwd'), 'log-server.log')
+        try:
+            total, elapsed = await asyncio.wait_for(pipelined(port, args.batch, args.batches, args.receivers), args.timeout)
+        finally:
+            common.stop_server(proc)
+        common.report(
+            'log_levels',
+            level=level,
+            seconds=round(elapsed, 3),
+            requests_per_second=round(total / elapsed),
+            log_bytes=os.path.getsize(log_path),
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', nargs='+', default=['DEBUG', 'INFO'])
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--batches', type=int, default=40)
+    parser.add_argument('--receivers', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import sys
+import time
+import timeit
+from types import SimpleNamespace
+
+import common
+
+sys.path.insert(0, common.ROOT)
+import constants
+from metrics import Metrics
+
+"""
+Description:
+
+Metrics benchmark: runs the pipelined PRIVMSG workload against a server with
+--metrics, then scrapes the endpoint. Reports the server side PRIVMSG latency
+quantiles of the sampled requests and event loop lag, the scrape time, and the
+share of the server CPU per request spent in the metrics hooks (hook cost timed
+in-process with timeit).
+
+Usage: python bench/metrics.py [--engine select] [--batch 500] [--batches 40] [--receivers 10]
+
+"""
+def timed_nanoseconds(statement, namespace, number=100000):
+    return min(timeit.repeat(statement, globals=namespace, number=number, repeat=5)) / number * 1e9
+
+# Statements the server runs per PRIVMSG request on a fan-out to `receivers` members.
+# The latency of one request in METRICS_LATENCY_SAMPLE_RATE is recorded
+def hook_nanoseconds(receivers):
+    metrics = Metrics(['PRIVMSG'])
+    members = set(range(receivers + 1))
+    server = SimpleNamespace(latency_countdown=constants.METRICS_LATENCY_SAMPLE_RATE, latency_samples=list())
+    namespace = {'metrics': metrics, 'members': members, 'server': server, 'time': time, 'received_at': time.perf_counter_ns(), 'rate': constants.METRICS_LATENCY_SAMPLE_RATE}
+    per_request = (
+        'server.latency_countdown -= 1\nif not server.latency_countdown: server.latency_countdown = rate',
+        'recipients = len(members) - (None in members); metrics.messages_sent += recipients; metrics.sent_bytes += recipients * 40',
+    )
+    per_sample = "server.latency_samples.append(('PRIVMSG', received_at)); metrics.command_latency['PRIVMSG'].record(time.perf_counter_ns() - received_at); server.latency_samples.clear()"
+    return sum(timed_nanoseconds(hook, namespace) for hook in per_request) + timed_nanoseconds(per_sample, namespace) / constants.METRICS_LATENCY_SAMPLE_RATE
+
+async def scrape(port):
+    reader, writer = await asyncio.open_connection(common.HOST, port)
+    writer.write(b'GET /metrics HTTP/1.0\r\n\r\n')
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    samples = dict()
+    for line in response.decode().split('\r\n\r\n', 1)[1].splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+async def run(args):
+    metrics_port = common.free_port()
+    proc, port = common.start_server('--engine', args.engine, '--metrics', str(metrics_port))
+    try:
+        clients = await common.open_clients(port, args.receivers + 1)
+        await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+        sender_writer = clients[0][1]
+        batch = b'PRIVMSG #global :pipelined message\r\n' * args.batch
+        total = args.batch * args.batches
+        cpu_before = common.process_cpu_seconds(proc.pid)
+        started = time.perf_counter()
+        readers = asyncio.gather(*(common.read_lines(r, total) for r, _w in clients))
+        for _ in range(args.batches):
+            sender_writer.write(batch)
+            await sender_writer.drain()
+        await asyncio.wait_for(readers, args.timeout)
+        elapsed = time.perf_counter() - started
+        cpu_per_request = (common.process_cpu_seconds(proc.pid) - cpu_before) / total * 1e9
+
+        scrape_started = time.perf_counter()
+        samples = await scrape(metrics_port)
+        scrape_seconds = time.perf_counter() - scrape_started
+        hooks = hook_nanoseconds(args.receivers)
+        common.report(
+            'metrics',
+            engine=args.engine,
+            requests_per_second=round(total / elapsed),
+            privmsg_samples=int(samples['ircchat_command_latency_seconds_count{command="PRIVMSG"}']),
+            **{f'privmsg_{name}_seconds': samples[f'ircchat_command_latency_quantile_seconds{{command="PRIVMSG",quantile="{q}"}}'] for name, q in (('p50', '0.5'), ('p99', '0.99'), ('p999', '0.999'))},
+            event_loop_lag_seconds_mean=round(samples['ircchat_event_loop_lag_seconds_sum'] / max(1, samples['ircchat_event_loop_lag_seconds_count']), 6),
+            scrape_seconds=round(scrape_seconds, 4),
+            hook_ns_per_request=round(hooks),
+            cpu_ns_per_request=round(cpu_per_request),
+            instrumentation_share=round(hooks / cpu_per_request, 4),
+        )
+        common.close_clients(clients)
+    finally:
+        common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--batches', type=int, default=40)
+    parser.add_argument('--receivers', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
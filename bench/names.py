@@ -0,0 +1,125 @@
+import argparse
+import sys
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+import constants
+from channel_replies import ChannelReplies, encode_line
+from channels import ChannelIndex
+
+"""
+Description:
+
+Cost of NAMES, WHO and LIST replies on a large channel. Compares rebuilding a
+reply by walking every client, which is what answering them without a cache
+takes, with the cached reply blocks: a repeated request, a request after one
+member joined and a request after one member changed its nickname.
+
+Usage: python bench/names.py [--members 10000] [--channels 10000] [--repeat 200]
+
+"""
+SERVER_NAME = 'irc.bench.local'
+CHANNEL = '#big'
+
+# NAMES built from scratch: every client is checked for membership, nicknames are packed into 512 byte lines
+def rebuild_names(clients, memberships, channel):
+    prefix = f':{SERVER_NAME} 353 = {channel} :'
+    lines, names, size = list(), list(), 0
+    for member, (nickname, _username, _host) in clients.items():
+        if channel not in memberships[member]:
+            continue
+        if size + len(nickname) + 1 > constants.COMMAND_MAX_LENGTH - 2 - len(prefix):
+            lines.append(encode_line(prefix + ' '.join(names)))
+            names, size = list(), 0
+        names.append(nickname)
+        size += len(nickname) + 1
+    lines.append(encode_line(prefix + ' '.join(names)))
+    lines.append(encode_line(f':{SERVER_NAME} 366 {channel} :End of NAMES list'))
+    return b''.join(lines)
+
+def rebuild_who(clients, memberships, channel):
+    lines = [encode_line(f':{SERVER_NAME} 352 {channel} {username} {host} {SERVER_NAME} {nickname} H :0 {username}')
+             for member, (nickname, username, host) in clients.items() if channel in memberships[member]]
+    lines.append(encode_line(f':{SERVER_NAME} 315 {channel} :End of WHO list'))
+    return b''.join(lines)
+
+def listed_names(block):
+    return sorted(name for line in block.split(b'\r\n') if b' 353 ' in line for name in line.split(b' :', 1)[1].split())
+
+def timed(repeat, function, *args):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return (time.perf_counter() - started) / repeat * 1e6, result
+
+# Time `request` right after `change`, only the request is counted
+def timed_after(repeat, change, request):
+    total = 0
+    for i in range(repeat):
+        change(i)
+        started = time.perf_counter()
+        request()
+        total += time.perf_counter() - started
+    return total / repeat * 1e6
+
+def run(args):
+    clients = {member: (f'u{member}', f'user{member}', '127.0.0.1') for member in range(args.members)}
+    memberships = {member: {CHANNEL} for member in clients}
+    members = set(clients)
+    replies = ChannelReplies(SERVER_NAME, clients.__getitem__)
+
+    rebuild_names_us, names_block = timed(args.repeat, rebuild_names, clients, memberships, CHANNEL)
+    rebuild_who_us, _block = timed(args.repeat, rebuild_who, clients, memberships, CHANNEL)
+    first_names_us, _block = timed(1, replies.names_block, CHANNEL, members)
+    cached_names_us, cached_block = timed(args.repeat, replies.names_block, CHANNEL, members)
+    replies.who_block(CHANNEL, members)
+    cached_who_us, _block = timed(args.repeat, replies.who_block, CHANNEL, members)
+
+    # One member leaves and comes back before every request
+    def rejoin(i):
+        member = i % args.members
+        replies.part(CHANNEL, member)
+        replies.join(CHANNEL, member)
+    join_names_us = timed_after(args.repeat, rejoin, lambda: replies.names_block(CHANNEL, members))
+    join_who_us = timed_after(args.repeat, rejoin, lambda: replies.who_block(CHANNEL, members))
+
+    def rename(i):
+        member = i % args.members
+        clients[member] = (f'r{i}', *clients[member][1:])
+        replies.rename(member, (CHANNEL,))
+    rename_names_us = timed_after(args.repeat, rename, lambda: replies.names_block(CHANNEL, members))
+
+    channels = ChannelIndex()
+    for i in range(args.channels):
+        channels.join(i, f'#c{i}')
+    rebuild_list_us, _block = timed(args.repeat, lambda: b''.join(encode_line(f':{SERVER_NAME} 322 {channel} {len(m)} :') for channel, m in channels.items()))
+    replies.list_reply(channels)
+    cached_list_us, _block = timed(args.repeat, replies.list_reply, channels)
+
+    common.report(
+        'names',
+        members=args.members,
+        channels=args.channels,
+        names_bytes=len(cached_block),
+        names_lines=cached_block.count(b'\r\n'),
+        same_names=listed_names(cached_block) == listed_names(names_block),
+        names_rebuild_us=round(rebuild_names_us, 1),
+        names_first_us=round(first_names_us, 1),
+        names_cached_us=round(cached_names_us, 2),
+        names_after_join_us=round(join_names_us, 1),
+        names_after_rename_us=round(rename_names_us, 1),
+        who_rebuild_us=round(rebuild_who_us, 1),
+        who_cached_us=round(cached_who_us, 2),
+        who_after_join_us=round(join_who_us, 1),
+        list_rebuild_us=round(rebuild_list_us, 1),
+        list_cached_us=round(cached_list_us, 2),
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--channels', type=int, default=10000, help='channels listed by LIST')
+    parser.add_argument('--repeat', type=int, default=200)
+    run(parser.parse_args())
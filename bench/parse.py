@@ -0,0 +1,87 @@
+import argparse
+import sys
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from message import Message
+
+"""
+Description:
+
+Request parsing benchmark on a typical client mix (PRIVMSG heavy, some NICK,
+USER and JOIN). Compares the original ServerUtil string helpers, called the way
+the server used them (command lookup, then a new search of the line for every
+field), with the single-pass Message.parse.
+
+Usage: python bench/parse.py [--lines 200000]
+
+"""
+LINES = [
+    'PRIVMSG #global :hello everybody, how is it going?',
+    'PRIVMSG #global :short',
+    'PRIVMSG #global :a somewhat longer message with more words in it to look like real chat',
+    ':alice PRIVMSG #global :message with a prefix',
+    'NICK alice',
+    'USER alice hostname servername :Alice Liddell',
+    'JOIN #python',
+    'PRIVMSG #global :another chat line',
+]
+
+# Original approach kept for comparison
+def get_command_type(request):
+    request_split = request.split()
+    return request_split[1] if ':' in request_split[0] else request_split[0]
+
+def get_broadcast_message(request):
+    return request[request.find(':', 1) + 1:].strip()
+
+def get_word_after(request, command):
+    index = request.index(command) + len(command)
+    end = request.find(' ', index + 1)
+    return request[index:end if end != -1 else len(request)].strip()
+
+def split_message(request):
+    prefix = ''
+    if request.startswith(':'):
+        prefix, _, request = request[1:].partition(' ')
+    request, trailing_delim, trailing = request.partition(' :')
+    params = request.split()
+    command = params.pop(0) if params else ''
+    if trailing_delim:
+        params.append(trailing)
+    return prefix, command, params
+
+def parse_server_util(request):
+    command = get_command_type(request)
+    if command == 'NICK':
+        return command, get_word_after(request, 'NICK')
+    if command == 'USER':
+        return command, get_word_after(request, 'USER') if len(request.split()) >= 5 else ''
+    _prefix, _command, params = split_message(request) # target of PRIVMSG/JOIN
+    if command == 'JOIN':
+        return command, params[0]
+    return command, get_broadcast_message(request)
+
+def parse_message(request):
+    message = Message.parse(request)
+    if message.command == 'PRIVMSG':
+        return message.command, message.param(1)
+    return message.command, message.param(0)
+
+def measure(parse, lines):
+    started = time.perf_counter()
+    for line in lines:
+        parse(line)
+    elapsed = time.perf_counter() - started
+    return {'seconds': round(elapsed, 3), 'lines_per_second': round(len(lines) / elapsed)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=200000)
+    args = parser.parse_args()
+    lines = (LINES * (args.lines // len(LINES) + 1))[:args.lines]
+    common.report('parse', lines=args.lines,
+        server_util=measure(parse_server_util, lines),
+        message=measure(parse_message, lines))
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import random
+import string
+import sys
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from message import Message
+
+"""
+Description:
+
+Parser property checks. Verifies the expected parse of every line in
+tests/parse_corpus.jsonl, then fuzzes Message.parse with random well-formed messages
+(parse(to_line(m)) == m) and random garbage (parsing never raises).
+Exits with status 1 on the first mismatch.
+
+Usage: python bench/parse_fuzz.py [--cases 100000] [--seed 1]
+
+"""
+CORPUS_PATH = os.path.join(common.ROOT, 'tests', 'parse_corpus.jsonl')
+WORD_CHARS = string.ascii_letters + string.digits + '#&[]\\`^{}|-_.!@*,:é✓'
+TEXT_CHARS = WORD_CHARS + ' :'
+
+def word(rng, first_chars=WORD_CHARS):
+    return rng.choice(first_chars.replace(':', '')) + ''.join(rng.choice(WORD_CHARS) for _ in range(rng.randrange(12)))
+
+def random_message(rng):
+    prefix = word(rng) if rng.random() < 0.5 else ''
+    command = rng.choice(['PRIVMSG', 'NOTICE', 'NICK', 'USER', 'JOIN', 'PART', 'SERVER', '001', '433'])
+    params = [word(rng) for _ in range(rng.randrange(Message.MAX_PARAMS))]
+    trailing = ''.join(rng.choice(TEXT_CHARS) for _ in range(rng.randrange(40))) if rng.random() < 0.7 else None
+    return Message(prefix, command, params, trailing)
+
+def fail(kind, line, expected, parsed):
+    print(json.dumps({'failure': kind, 'line': line, 'expected': repr(expected), 'parsed': repr(parsed)}, ensure_ascii=False))
+    sys.exit(1)
+
+def check_corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as corpus:
+        cases = [json.loads(line) for line in corpus]
+    for case in cases:
+        expected = Message(case['prefix'], case['command'], case['params'], case['trailing'])
+        parsed = Message.parse(case['line'])
+        if parsed != expected:
+            fail('corpus', case['line'], expected, parsed)
+    return len(cases)
+
+def check_round_trip(rng, cases):
+    for _ in range(cases):
+        message = random_message(rng)
+        parsed = Message.parse(message.to_line())
+        if parsed != message:
+            fail('round_trip', message.to_line(), message, parsed)
+
+def check_garbage(rng, cases):
+    for _ in range(cases):
+        line = ''.join(rng.choice(TEXT_CHARS + '\t\x00\x07') for _ in range(rng.randrange(80)))
+        parsed = Message.parse(line)
+        if parsed.param_count() > Message.MAX_PARAMS + 1 or parsed.command != parsed.command.upper():
+            fail('garbage', line, None, parsed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    corpus_cases = check_corpus()
+    check_round_trip(rng, args.cases)
+    check_garbage(rng, args.cases)
+    common.report('parse_fuzz', corpus_cases=corpus_cases, round_trip_cases=args.cases, garbage_cases=args.cases, seed=args.seed)
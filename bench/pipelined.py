@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Pipelined client benchmark: a single client writes batches of PRIVMSG requests
+in one TCP write and waits for all of them to be echoed back.
+Reports requests processed per second.
+
+Usage: python bench/pipelined.py [--batch 500] [--batches 40] [--receivers 10]
+
+"""
+async def run(args):
+    proc, port = common.start_server()
+    try:
+        clients = await common.open_clients(port, args.receivers + 1)
+        await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+        sender_reader, sender_writer = clients[0]
+        batch = b'PRIVMSG #global :pipelined message\r\n' * args.batch
+
+        total = args.batch * args.batches
+        started = time.perf_counter()
+        readers = asyncio.gather(*(common.read_lines(r, total) for r, _w in clients))
+        for _ in range(args.batches):
+            sender_writer.write(batch)
+            await sender_writer.drain()
+        received = await asyncio.wait_for(readers, args.timeout)
+        elapsed = time.perf_counter() - started
+
+        common.report(
+            'pipelined',
+            batch=args.batch,
+            batches=args.batches,
+            receivers=args.receivers,
+            seconds=round(elapsed, 3),
+            requests_per_second=round(total / elapsed),
+            delivered=sum(received),
+        )
+        common.close_clients(clients)
+    finally:
+        common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--batches', type=int, default=40)
+    parser.add_argument('--receivers', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
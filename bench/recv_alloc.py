@@ -0,0 +1,72 @@
+import argparse
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from framing import LineFramer
+
+"""
+Description:
+
+Receive path allocation benchmark. Pushes a burst of pipelined messages through a
+socket pair and compares the original str buffer approach (recv + decode + str
+concatenation + slicing one message at a time) with LineFramer (recv_into a
+preallocated bytearray + memoryview line splitting). Reports tracemalloc peak
+memory and throughput.
+
+Usage: python bench/recv_alloc.py [--messages 100000]
+
+"""
+MESSAGE = 'PRIVMSG #global :café message payload\r\n'
+
+# Original approach kept for comparison
+def receive_str_buffer(sock, expected):
+    buffer, received = '', 0
+    while received < expected:
+        buffer += sock.recv(4096).decode('utf-8')
+        while '\r\n' in buffer:
+            delim = buffer.index('\r\n') + 2
+            _line, buffer = buffer[:delim], buffer[delim:]
+            received += 1
+    return received
+
+def receive_line_framer(sock, expected):
+    framer, received = LineFramer(), 0
+    while received < expected:
+        framer.recv_into(sock)
+        received += len(framer.lines())
+    return received
+
+def measure(receive, messages):
+    reader, writer = socket.socketpair()
+    burst = (MESSAGE * messages).encode()
+    sender = threading.Thread(target=writer.sendall, args=(burst,))
+    tracemalloc.start()
+    started = time.perf_counter()
+    sender.start()
+    received = receive(reader, messages)
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sender.join()
+    reader.close()
+    writer.close()
+    return {
+        'received': received,
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(received / elapsed),
+        'peak_traced_bytes': peak,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+    common.report('recv_alloc', messages=args.messages,
+        str_buffer=measure(receive_str_buffer, args.messages),
+        line_framer=measure(receive_line_framer, args.messages))
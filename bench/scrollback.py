@@ -0,0 +1,100 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from scrollback import Scrollback
+
+"""
+Description:
+
+Cost of the client scrollback as history grows. Appends --messages messages to
+a Scrollback of --capacity messages and reports the memory it holds, the
+append cost, and the render cost of a --rows x --cols screen at the newest
+message, after paging far back and right after a resize, for a short and for
+the full history. Searching walks the whole history and is reported as well.
+
+Usage: python bench/scrollback.py [--messages 1000000] [--capacity 20000] [--rows 50] [--cols 120]
+
+"""
+def message(i):
+    return f'[user{i % 100}]: message {i} ' + 'lorem ipsum ' * (i % 20)
+
+def timed(repeat, function, *args):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(*args)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+# Render costs in µs: at the newest message, one page further back each time, after alternating resizes
+def render_costs(scrollback, args):
+    tail_us = timed(args.repeat, scrollback.render, args.rows, args.cols)
+    paged_us = 0
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        scrollback.page_up(args.rows, args.cols)
+        scrollback.render(args.rows, args.cols)
+        paged_us += (time.perf_counter() - started) / args.repeat * 1e6
+    scrollback.follow()
+    resized_us = 0
+    for i in range(args.repeat):
+        started = time.perf_counter()
+        scrollback.render(args.rows, args.cols - 1 - i % 2)
+        resized_us += (time.perf_counter() - started) / args.repeat * 1e6
+    return round(tail_us, 1), round(paged_us, 1), round(resized_us, 1)
+
+# Bytes held by a scrollback after every message was appended, measured in a separate pass
+def memory(args):
+    tracemalloc.start()
+    scrollback = Scrollback(args.capacity)
+    for i in range(args.messages):
+        scrollback.append(message(i))
+    scrollback.render(args.rows, args.cols)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak
+
+def run(args):
+    scrollback = Scrollback(args.capacity)
+    short = min(1000, args.messages)
+    for i in range(short):
+        scrollback.append(message(i))
+    short_costs = render_costs(scrollback, args)
+
+    started = time.perf_counter()
+    for i in range(short, args.messages):
+        scrollback.append(message(i))
+    append_us = (time.perf_counter() - started) / max(1, args.messages - short) * 1e6
+    full_costs = render_costs(scrollback, args)
+
+    started = time.perf_counter()
+    found = scrollback.search('no such text')
+    search_ms = (time.perf_counter() - started) * 1e3
+    current, peak = memory(args)
+
+    common.report(
+        'scrollback',
+        messages=args.messages,
+        capacity=args.capacity,
+        kept=len(scrollback),
+        memory_bytes=current,
+        peak_memory_bytes=peak,
+        append_us=round(append_us, 2),
+        render_tail_us=dict(zip(('short', 'full'), (short_costs[0], full_costs[0]))),
+        render_paged_us=dict(zip(('short', 'full'), (short_costs[1], full_costs[1]))),
+        render_resized_us=dict(zip(('short', 'full'), (short_costs[2], full_costs[2]))),
+        search_miss_ms=round(search_ms, 1),
+        search_found=found,
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--capacity', type=int, default=20000, help='messages kept')
+    parser.add_argument('--rows', type=int, default=50)
+    parser.add_argument('--cols', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=200)
+    run(parser.parse_args())
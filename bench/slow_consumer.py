@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import time
+
+import common
+
+"""
+Description:
+
+Slow consumer benchmark: one registered client never reads while a sender floods
+the channel. Reports fan-out time for the healthy clients and whether the slow
+client was evicted (disconnect policy) or had messages dropped (drop policy).
+
+Usage: python bench/slow_consumer.py [--clients 50] [--messages 10000] [--policy disconnect] [--engine select]
+
+"""
+async def run(args):
+    common.raise_fd_limit()
+    proc, port = common.start_server('--engine', args.engine, '--sendq-high', str(args.sendq_high), '--sendq-low', str(args.sendq_high // 4), '--sendq-policy', args.policy)
+    try:
+        clients = await common.open_clients(port, args.clients + 1)
+        await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(clients)))
+        slow_reader, _slow_writer = clients.pop()
+        sender_writer = clients[0][1]
+
+        payload = 'x' * args.size
+        started = time.perf_counter()
+        readers = asyncio.gather(*(common.read_lines(r, args.messages) for r, _w in clients))
+        for _ in range(args.messages):
+            sender_writer.write(f'PRIVMSG #global :{payload}\r\n'.encode())
+            await sender_writer.drain()
+        received = await asyncio.wait_for(readers, args.timeout)
+        fanout_time = time.perf_counter() - started
+
+        # Drain whatever the slow client was sent before it was cut off
+        slow_received = 0
+        try:
+            while True:
+                data = await asyncio.wait_for(slow_reader.read(65536), 1)
+                if not data:
+                    break
+                slow_received += data.count(b'\r\n')
+        except asyncio.TimeoutError:
+            pass
+
+        common.report(
+            'slow_consumer',
+            engine=args.engine,
+            policy=args.policy,
+            clients=len(clients),
+            messages=args.messages,
+            fanout_seconds=round(fanout_time, 3),
+            messages_per_second=round(args.messages * len(clients) / fanout_time),
+            healthy_delivered=sum(received),
+            slow_client_delivered=slow_received,
+            slow_client_evicted=slow_reader.at_eof(),
+        )
+        common.close_clients(clients)
+    finally:
+        common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--size', type=int, default=400)
+    parser.add_argument('--sendq-high', type=int, default=256 * 1024)
+    parser.add_argument('--policy', choices=['drop', 'disconnect'], default='disconnect')
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
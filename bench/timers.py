@@ -0,0 +1,80 @@
+import argparse
+import random
+import sys
+import time
+
+import common
+
+sys.path.insert(0, common.ROOT)
+from timer_wheel import TimerWheel
+
+"""
+Description:
+
+Connection timeout bookkeeping for many connections. Every connection gets a
+check after a random share of the ping interval, like connections that were
+last active at different times. The clock then runs through one ping interval,
+one tick at a time. Compares the TimerWheel with scanning every connection's
+deadline on every tick, and reports the cost of one tick and of scheduling a timer.
+
+Usage: python bench/timers.py [--connections 10000 100000] [--interval 120] [--tick 0.5]
+
+"""
+def wheel(connections, interval, tick, deadlines):
+    clock = [0.0]
+    timers = TimerWheel(tick, lambda: clock[0])
+    fired = [0]
+
+    def check(_connection):
+        fired[0] += 1
+
+    started = time.perf_counter()
+    for connection, deadline in enumerate(deadlines):
+        timers.schedule(deadline, check, connection)
+    schedule_seconds = time.perf_counter() - started
+
+    ticks = int(interval / tick)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        clock[0] += tick
+        timers.advance(clock[0])
+    return schedule_seconds / connections, (time.perf_counter() - started) / ticks, fired[0]
+
+# Deadlines in a list, every tick compares all of them
+def scan(connections, interval, tick, deadlines):
+    deadlines = list(deadlines)
+    fired = 0
+    ticks = int(interval / tick)
+    now = 0.0
+    started = time.perf_counter()
+    for _ in range(ticks):
+        now += tick
+        for connection in range(connections):
+            if deadlines[connection] <= now:
+                deadlines[connection] = float('inf')
+                fired += 1
+    return (time.perf_counter() - started) / ticks, fired
+
+def run(args):
+    rng = random.Random(1)
+    for connections in args.connections:
+        deadlines = [rng.uniform(0, args.interval) for _ in range(connections)]
+        schedule_seconds, wheel_tick_seconds, wheel_fired = wheel(connections, args.interval, args.tick, deadlines)
+        scan_tick_seconds, scan_fired = scan(connections, args.interval, args.tick, deadlines)
+        common.report(
+            'timers',
+            connections=connections,
+            ticks=int(args.interval / args.tick),
+            schedule_us=round(schedule_seconds * 1e6, 3),
+            wheel_tick_us=round(wheel_tick_seconds * 1e6, 1),
+            scan_tick_us=round(scan_tick_seconds * 1e6, 1),
+            fired=wheel_fired,
+            scan_fired=scan_fired,
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--interval', type=float, default=120, help='seconds, spread of the deadlines')
+    parser.add_argument('--tick', type=float, default=0.5)
+    run(parser.parse_args())
@@ -0,0 +1,93 @@
+import argparse
+import fcntl
+import os
+import pty
+import select
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+
+import common
+
+"""
+Description:
+
+Responsiveness of the curses client. Runs irc_client.py in a pseudo-terminal
+of --rows x --cols and measures the delay until a typed key is echoed, the time
+until a burst of --messages channel messages is drawn and how often the client
+wakes up and how much CPU it uses while nothing happens.
+
+Usage: python bench/view.py [--messages 2000] [--keys 50] [--idle 5] [--rows 40] [--cols 120]
+
+"""
+CLIENT_PATH = os.path.join(common.ROOT, 'irc_client.py')
+
+# Read terminal output until it has been quiet for `quiet` seconds. Returns the time of the last output
+def read_until_quiet(master, quiet, limit=30):
+    started = last = time.perf_counter()
+    while time.perf_counter() - last < quiet and time.perf_counter() - started < limit:
+        if select.select([master], [], [], 0.01)[0]:
+            os.read(master, 65536)
+            last = time.perf_counter()
+    return last
+
+def type_keys(master, keys):
+    delays = list()
+    for _ in range(keys):
+        started = time.perf_counter()
+        os.write(master, b'x')
+        select.select([master], [], [], 5)
+        delays.append(time.perf_counter() - started)
+        read_until_quiet(master, 0.02)
+    return delays
+
+def run(args):
+    proc, port = common.start_server()
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', args.rows, args.cols, 0, 0))
+    client = subprocess.Popen([sys.executable, CLIENT_PATH, '--port', str(port)], stdin=slave, stdout=slave, stderr=slave,
+                              cwd=tempfile.mkdtemp(prefix='irc-bench-'), env=dict(os.environ, TERM='xterm'))
+    sender = None
+    try:
+        read_until_quiet(master, 0.5)
+        os.write(master, b'/nick viewer\n/user viewer\n')
+        read_until_quiet(master, 0.3)
+        delays = sorted(type_keys(master, args.keys))
+
+        sender = socket.create_connection((common.HOST, port))
+        sender.sendall(b'NICK sender\r\nUSER sender h s :sender\r\n')
+        read_until_quiet(master, 0.3)
+        started = time.perf_counter()
+        sender.sendall(b''.join(b'PRIVMSG #global :message %d\r\n' % i for i in range(args.messages)))
+        drawn = read_until_quiet(master, 0.5) - started
+
+        cpu, switches = common.process_cpu_seconds(client.pid), common.process_context_switches(client.pid)
+        read_until_quiet(master, args.idle + 1, limit=args.idle)
+        common.report(
+            'view',
+            messages=args.messages,
+            key_echo_median_ms=round(delays[len(delays) // 2] * 1e3, 2),
+            key_echo_max_ms=round(delays[-1] * 1e3, 2),
+            burst_drawn_seconds=round(drawn, 3),
+            idle_seconds=args.idle,
+            idle_wakeups=common.process_context_switches(client.pid) - switches,
+            idle_cpu_seconds=round(common.process_cpu_seconds(client.pid) - cpu, 3),
+        )
+    finally:
+        if sender is not None:
+            sender.close()
+        client.kill()
+        common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--keys', type=int, default=50, help='typed keys timed until their echo')
+    parser.add_argument('--idle', type=float, default=5, help='seconds without input or messages')
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--cols', type=int, default=120)
+    run(parser.parse_args())
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import os
+import time
+
+import common
+
+"""
+Description:
+
+Multi-process scale-out benchmark: runs the server with 1..N SO_REUSEPORT workers
+and measures broadcast deliveries per second with several concurrent senders.
+Scaling needs at least as many free cores as workers.
+
+Usage: python bench/workers.py [--workers 1 2 4] [--clients 400] [--senders 8] [--messages 100]
+
+"""
+async def broadcast(port, clients, senders, messages):
+    connections = await common.open_clients(port, clients)
+    await asyncio.gather(*(common.register(r, w, f'u{i}') for i, (r, w) in enumerate(connections)))
+    expected = senders * messages
+    started = time.perf_counter()
+    readers = asyncio.gather(*(common.read_lines(r, expected) for r, _w in connections))
+
+    async def send(writer):
+        for _ in range(messages):
+            writer.write(b'PRIVMSG #global :scale-out payload\r\n')
+            await writer.drain()
+
+    await asyncio.gather(*(send(w) for _r, w in connections[:senders]))
+    delivered = sum(await readers)
+    elapsed = time.perf_counter() - started
+    common.close_clients(connections)
+    return delivered, elapsed
+
+async def run(args):
+    common.raise_fd_limit()
+    for workers in args.workers:
+        proc, port = common.start_server('--workers', str(workers), '--engine', args.engine)
+        try:
+            delivered, elapsed = await asyncio.wait_for(broadcast(port, args.clients, args.senders, args.messages), args.timeout)
+            common.report(
+                'workers',
+                engine=args.engine,
+                workers=workers,
+                cpus=os.cpu_count(),
+                delivered=delivered,
+                seconds=round(elapsed, 3),
+                deliveries_per_second=round(delivered / elapsed),
+            )
+        finally:
+            common.stop_server(proc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select')
+    parser.add_argument('--clients', type=int, default=400)
+    parser.add_argument('--senders', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
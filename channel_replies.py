@@ -0,0 +1,226 @@
+import constants
+import replies
+from util_server import ServerUtil
+
+DELIM = constants.COMMAND_END_DELIM.encode(constants.COMMAND_ENCODING)
+MAX_LINE_BYTES = constants.COMMAND_MAX_LENGTH - len(DELIM)
+
+# Encode a reply line, cut to the 512 byte limit without splitting a character
+def encode_line(line):
+    data = line.encode(constants.COMMAND_ENCODING)
+    if len(data) > MAX_LINE_BYTES:
+        data = data[:MAX_LINE_BYTES].decode(constants.COMMAND_ENCODING, 'ignore').encode(constants.COMMAND_ENCODING)
+    return data + DELIM
+
+"""
+Description:
+
+Nicknames of one RPL_NAMREPLY line and the line once it is serialized.
+
+"""
+class NamesChunk:
+    __slots__ = ('names', 'size', 'line')
+
+    def __init__(self):
+        self.names = dict() # member -> encoded nickname
+        self.size = 0 # bytes of the nicknames and their separators
+        self.line = None # serialized line, None after a change
+
+"""
+Description:
+
+NAMES reply of one channel, kept as RPL_NAMREPLY lines that each hold as many
+nicknames as fit in 512 bytes. Every member knows its chunk, so a join appends
+to the last chunk and a part or a nickname change only serializes the chunk of
+that member again. The whole reply is one bytes object, rebuilt by joining the
+serialized chunks only after a change.
+
+"""
+class NamesReply:
+    def __init__(self, prefix, end):
+        self.prefix = prefix # encoded RPL_NAMREPLY line up to the nicknames
+        self.end = end # encoded RPL_ENDOFNAMES line
+        self.capacity = MAX_LINE_BYTES - len(prefix)
+        self.chunks = list()
+        self.chunk_of = dict() # member -> NamesChunk
+        self.block = None
+
+    def __len__(self):
+        return len(self.chunk_of)
+
+    def add(self, member, nickname):
+        name = nickname.encode(constants.COMMAND_ENCODING)
+        chunk = self.chunks[-1] if self.chunks else None
+        if chunk is None or chunk.size + len(name) + 1 > self.capacity:
+            chunk = NamesChunk()
+            self.chunks.append(chunk)
+        chunk.names[member] = name
+        chunk.size += len(name) + 1
+        chunk.line = None
+        self.chunk_of[member] = chunk
+        self.block = None
+
+    def remove(self, member):
+        chunk = self.chunk_of.pop(member)
+        chunk.size -= len(chunk.names.pop(member)) + 1
+        chunk.line = None
+        if not chunk.names:
+            self.chunks.remove(chunk)
+        self.block = None
+
+    # Change a nickname in place, or move it to the last chunk if it no longer fits
+    def rename(self, member, nickname):
+        chunk = self.chunk_of[member]
+        name = nickname.encode(constants.COMMAND_ENCODING)
+        size = chunk.size - len(chunk.names[member]) + len(name)
+        if size > self.capacity:
+            self.remove(member)
+            self.add(member, nickname)
+            return
+        chunk.names[member] = name
+        chunk.size = size
+        chunk.line = None
+        self.block = None
+
+    def get_block(self):
+        if self.block is None:
+            for chunk in self.chunks:
+                if chunk.line is None:
+                    chunk.line = self.prefix + b' '.join(chunk.names.values()) + DELIM
+            self.block = b''.join([chunk.line for chunk in self.chunks] + [self.end])
+        return self.block
+
+"""
+Description:
+
+WHO reply of one channel: one serialized RPL_WHOREPLY line per member and the
+whole reply as one bytes object, rebuilt by joining the lines only after a change.
+
+"""
+class WhoReply:
+    def __init__(self, end):
+        self.end = end # encoded RPL_ENDOFWHO line
+        self.lines = dict() # member -> encoded RPL_WHOREPLY line
+        self.block = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def set(self, member, line):
+        self.lines[member] = line
+        self.block = None
+
+    def remove(self, member):
+        del self.lines[member]
+        self.block = None
+
+    def get_block(self):
+        if self.block is None:
+            self.block = b''.join([*self.lines.values(), self.end])
+        return self.block
+
+"""
+Description:
+
+Pre-serialized NAMES, WHO and LIST replies of the local channels.
+The replies of a channel are built the first time they are asked for and then
+patched on every join, part and nickname change, so repeating them costs at
+most one join of cached lines instead of a walk over the members. Numeric
+replies carry the server prefix but no target nickname, like the other replies
+of this server, so one block serves every client that asks. Replies are keyed
+by the casefolded channel name and carry the name they were built with.
+`describe(member)` returns the (nickname, username, host) of a channel member.
+
+"""
+class ChannelReplies:
+    def __init__(self, server_name, describe):
+        self.server_name = server_name
+        self.describe = describe
+        self.names = dict() # casefolded channel -> NamesReply, only for channels asked about
+        self.who = dict() # casefolded channel -> WhoReply, only for channels asked about
+        self.list_lines = dict() # casefolded channel -> encoded RPL_LIST line
+        self.list_block = None # full LIST reply, None after any join or part
+
+    def __line(self, code, text):
+        return encode_line(f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {code} {text}')
+
+    def __who_line(self, channel, member):
+        nickname, username, host = self.describe(member)
+        return self.__line(replies.RPL_WHOREPLY_CODE, f'{channel} {username} {host} {self.server_name} {nickname} H {constants.COMMAND_MESSAGE_DELIM}0 {username}')
+
+    def names_block(self, channel, members):
+        key = ServerUtil.casefold_channel(channel)
+        reply = self.names.get(key)
+        if reply is None:
+            end = self.__line(replies.RPL_ENDOFNAMES_CODE, f'{channel} {replies.RPL_ENDOFNAMES_MESSAGE}')
+            if not members:
+                return end
+            prefix = f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {replies.RPL_NAMREPLY_CODE} = {channel} {constants.COMMAND_MESSAGE_DELIM}'
+            reply = self.names[key] = NamesReply(prefix.encode(constants.COMMAND_ENCODING), end)
+            for member in members:
+                reply.add(member, self.describe(member)[0])
+        return reply.get_block()
+
+    def who_block(self, channel, members):
+        key = ServerUtil.casefold_channel(channel)
+        reply = self.who.get(key)
+        if reply is None:
+            end = self.__line(replies.RPL_ENDOFWHO_CODE, f'{channel} {replies.RPL_ENDOFWHO_MESSAGE}')
+            if not members:
+                return end
+            reply = self.who[key] = WhoReply(end)
+            for member in members:
+                reply.set(member, self.__who_line(channel, member))
+        return reply.get_block()
+
+    def __list_line(self, channel, members):
+        key = ServerUtil.casefold_channel(channel)
+        line = self.list_lines.get(key)
+        if line is None:
+            line = self.list_lines[key] = self.__line(replies.RPL_LIST_CODE, f'{channel} {len(members)} {constants.COMMAND_MESSAGE_DELIM}')
+        return line
+
+    # LIST of the given channel names, or of every channel of `channels` (ChannelIndex)
+    def list_reply(self, channels, names=None):
+        if names is None and self.list_block is not None:
+            return self.list_block
+        lines = [self.__line(replies.RPL_LISTSTART_CODE, replies.RPL_LISTSTART_MESSAGE)]
+        listed = channels.items() if names is None else ((channels.name(name), channels.members(name)) for name in names)
+        for channel, members in listed:
+            if members:
+                lines.append(self.__list_line(channel, members))
+        lines.append(self.__line(replies.RPL_LISTEND_CODE, replies.RPL_LISTEND_MESSAGE))
+        block = b''.join(lines)
+        if names is None:
+            self.list_block = block
+        return block
+
+    def join(self, channel, member):
+        key = ServerUtil.casefold_channel(channel)
+        if key in self.names:
+            self.names[key].add(member, self.describe(member)[0])
+        if key in self.who:
+            self.who[key].set(member, self.__who_line(channel, member))
+        self.list_lines.pop(key, None)
+        self.list_block = None
+
+    # Replies of a channel are dropped together with its last member
+    def part(self, channel, member):
+        key = ServerUtil.casefold_channel(channel)
+        for cache in (self.names, self.who):
+            reply = cache.get(key)
+            if reply is not None:
+                reply.remove(member)
+                if not reply:
+                    del cache[key]
+        self.list_lines.pop(key, None)
+        self.list_block = None
+
+    def rename(self, member, channels):
+        nickname = self.describe(member)[0]
+        for channel in channels:
+            key = ServerUtil.casefold_channel(channel)
+            if key in self.names:
+                self.names[key].rename(member, nickname)
+            if key in self.who:
+                self.who[key].set(member, self.__who_line(channel, member))
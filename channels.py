@@ -0,0 +1,80 @@
+from util_server import ServerUtil
+
+"""
+Description:
+
+Channel membership index. Keeps channel -> members and the reverse
+member -> channels mapping, so delivering to a channel costs O(members) and
+forgetting a connection costs O(channels it joined).
+Members are connection handles of local clients. Channel names are
+case-insensitive like nicknames: they are keyed by their casefolded form and
+a channel keeps the name it was created with.
+
+"""
+class ChannelIndex:
+    def __init__(self):
+        self.channels = dict() # casefolded channel name -> set of members
+        self.names = dict() # casefolded channel name -> channel name as created
+        self.memberships = dict() # member -> set of casefolded channel names
+
+    def __len__(self):
+        return len(self.channels)
+
+    # Add member to a channel. Returns False if it already was a member
+    def join(self, member, channel):
+        key = ServerUtil.casefold_channel(channel)
+        members = self.channels.get(key)
+        if members is None:
+            members = self.channels[key] = set()
+            self.names[key] = channel
+        if member in members:
+            return False
+        members.add(member)
+        self.memberships.setdefault(member, set()).add(key)
+        return True
+
+    # Remove member from a channel. Returns False if it was not a member
+    def part(self, member, channel):
+        key = ServerUtil.casefold_channel(channel)
+        members = self.channels.get(key)
+        if members is None or member not in members:
+            return False
+        self.__discard(member, key, members)
+        joined = self.memberships[member]
+        joined.discard(key)
+        if not joined:
+            del self.memberships[member]
+        return True
+
+    # Remove member from every channel. Returns the names of the channels it was on
+    def remove_member(self, member):
+        joined = self.memberships.pop(member, ())
+        names = [self.names[key] for key in joined]
+        for key in joined:
+            self.__discard(member, key, self.channels[key])
+        return names
+
+    def members(self, channel):
+        return self.channels.get(ServerUtil.casefold_channel(channel), ())
+
+    def channels_of(self, member):
+        return [self.names[key] for key in self.memberships.get(member, ())]
+
+    def is_member(self, member, channel):
+        return member in self.channels.get(ServerUtil.casefold_channel(channel), ())
+
+    # Name a channel was created with, `channel` itself for a channel without members
+    def name(self, channel):
+        return self.names.get(ServerUtil.casefold_channel(channel), channel)
+
+    # (name, members) of every channel
+    def items(self):
+        names = self.names
+        return ((names[key], members) for key, members in self.channels.items())
+
+    # Empty channels are dropped
+    def __discard(self, member, key, members):
+        members.discard(member)
+        if not members:
+            del self.channels[key]
+            del self.names[key]
@@ -1,3 +1,28 @@
 NICKNAME = 'NICK'
 USERNAME = 'USER'
-BROADCAST = 'PRIVMSG'
\ No newline at end of file
+BROADCAST = 'PRIVMSG'
+NOTICE = 'NOTICE'
+JOIN = 'JOIN'
+PART = 'PART'
+PING = 'PING'
+PONG = 'PONG'
+NAMES = 'NAMES'
+WHO = 'WHO'
+LIST = 'LIST'
+CAP = 'CAP'
+
+# CAP subcommands
+CAP_LS = 'LS'
+CAP_LIST = 'LIST'
+CAP_REQ = 'REQ'
+CAP_ACK = 'ACK'
+CAP_NAK = 'NAK'
+CAP_END = 'END'
+
+# Server to server
+SERVER = 'SERVER'
+PASS = 'PASS'
+QUIT = 'QUIT'
+SQUIT = 'SQUIT'
+KILL = 'KILL'
+ERROR = 'ERROR'
\ No newline at end of file
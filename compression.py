@@ -0,0 +1,85 @@
+import zlib
+
+import commands
+import constants
+from message import Message
+
+"""
+Description:
+
+Stream compression of server output, negotiated with the `zlib` capability
+(CAP REQ :zlib). Everything the server sends after its CAP ACK line is one raw
+deflate stream, zlib without a header, so a compressor started later can
+continue a stream that another one began, as a hot upgrade does. The server
+compresses whatever is queued for a connection when it writes to it and
+flushes with Z_SYNC_FLUSH, so every line sent can be decoded right away and
+one flush serves a whole batch of lines. Requests of the client stay plain
+text. Each compressed connection holds its own compressor for its whole life,
+so the window is kept small.
+
+"""
+CAPABILITY = 'zlib'
+DELIM = constants.COMMAND_END_DELIM.encode(constants.COMMAND_ENCODING)
+
+def new_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, -constants.COMPRESSION_WINDOW_BITS, constants.COMPRESSION_MEM_LEVEL)
+
+# Compress `data` and flush, so the receiver can decode everything sent so far
+def compress(compressor, data):
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+"""
+Description:
+
+Bytes received from a server by a client that requested the capability.
+They stay plain until the CAP ACK line and turn into a deflate stream right
+after it, possibly in the middle of a read, so while the answer is awaited
+the received lines are checked one by one. A CAP NAK leaves the stream plain.
+
+"""
+class InboundStream:
+    def __init__(self):
+        self.inflater = None
+        self.awaiting_ack = False
+        self.tail = b'' # incomplete line received while awaiting the answer
+
+    @property
+    def compressed(self):
+        return self.inflater is not None
+
+    # Call before sending CAP REQ
+    def expect_ack(self):
+        self.awaiting_ack = True
+
+    # Plain bytes of received `data`
+    def decode(self, data):
+        if self.inflater is not None:
+            return self.inflater.decompress(data)
+        if not self.awaiting_ack:
+            return data
+        buffered = self.tail + data
+        start = 0
+        while (end := buffered.find(DELIM, start)) != -1:
+            end += len(DELIM)
+            acknowledged = self.__cap_answer(buffered[start:end])
+            start = end
+            if acknowledged is None:
+                continue
+            self.awaiting_ack = False
+            self.tail = b''
+            if not acknowledged:
+                return data
+            self.inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            boundary = end - (len(buffered) - len(data))
+            return data[:boundary] + self.inflater.decompress(data[boundary:])
+        self.tail = buffered[start:]
+        return data
+
+    # True for the CAP ACK of the capability, False for its CAP NAK, None for any other line
+    def __cap_answer(self, line):
+        message = Message.parse(line[:-len(DELIM)].decode(constants.COMMAND_ENCODING, 'replace'))
+        if message.command != commands.CAP or CAPABILITY not in message.param(2).split():
+            return None
+        if message.param(1) == commands.CAP_ACK:
+            return True
+        return False if message.param(1) == commands.CAP_NAK else None
@@ -1,5 +1,16 @@
 # Channels
 GLOBAL_CHANNEL = '#global'
+CHANNEL_PREFIXES = '#&'
+CHANNEL_MAX_LENGTH = 50
+CHANNEL_LIST_DELIM = ','
+
+# Nicknames
+NICKNAME_MAX_LENGTH = 9
+NICKNAME_INVALID_CHARS = ' ,*!@' # would break message targets and prefixes
+
+# Server links
+SERVER_INFO = 'IRC-Chat server'
+LINK_REFUSED_REASON = 'Link refused'
 
 # Command structs
 COMMAND_END_DELIM = '\r\n'
@@ -7,8 +18,51 @@ COMMAND_PREFIX_DELIM = ':'
 COMMAND_MESSAGE_DELIM = ':'
 COMMAND_REALNAME_DELIM = ':'
 COMMAND_ENCODING = 'utf-8'
+COMMAND_MAX_LENGTH = 512 # bytes, CR-LF included
+RECV_BUFFER_SIZE = 4096 # bytes, preallocated per connection
+
+# Logging
+LOG_DELIVERY_SAMPLE_RATE = 100 # one per-recipient DEBUG log per this many deliveries
+
+# Metrics
+METRICS_LAG_PROBE_INTERVAL = 0.25 # seconds between event loop lag probes of the asyncio engine
+METRICS_LATENCY_SAMPLE_RATE = 16 # one request in this many is timed until its output is written
+
+# Connections
+QUIT_REASON = 'Client Quit' # QUIT without a reason
+
+# Flood control
+TURN_REQUEST_BUDGET = 512 # queued requests processed in round-robin turns before polling again
+FLOOD_QUIT_REASON = 'Excess Flood'
+
+# Timeouts
+TIMER_WHEEL_TICK = 0.5 # seconds, resolution of ping and registration timeouts
+PING_TIMEOUT_REASON = 'Ping timeout'
+REGISTRATION_TIMEOUT_REASON = 'Registration timeout'
+
+# Hot upgrade
+HANDOFF_TIMEOUT = 10 # seconds for each step of a listening socket and connection handoff
+
+# Channel history
+HISTORY_MAX_CHANNELS = 10000 # channels with a history ring, the longest quiet one is dropped first
+HISTORY_SEGMENT_BYTES = 32 * 1024 * 1024 # size of one memory-mapped history log segment
+HISTORY_SEGMENTS = 4 # newest log segments kept on disk
+
+# Compression
+COMPRESSION_LEVEL = 6 # zlib level of compressed connections, --compression-level
+COMPRESSION_WINDOW_BITS = 12 # 4 KiB window, about 32 KiB of compressor state per compressed connection
+COMPRESSION_MEM_LEVEL = 5
+
+# Headless client
+CLIENT_SEND_HIGH_WATER = 256 * 1024 # bytes queued for the socket before a sender waits
+CLIENT_READ_SIZE = 65536 # bytes read from the server at once
+CLIENT_INPUT_BATCH = 256 # script lines sent before letting received messages through
 
 # UI
 UI_QUIT = '/quit'
 UI_NICK = '/nick'
 UI_USER = '/user'
+UI_COMMAND_PREFIX = '/' # other /commands are sent as raw IRC commands
+UI_FRAME_INTERVAL = 0.02 # seconds, at most one terminal update per interval
+UI_SCROLLBACK_MESSAGES = 20000 # messages kept for scrolling back, the oldest one is dropped first
+UI_SEARCH = '/search' # shown with the next older message containing the text, handled by the client
@@ -8,6 +8,10 @@ ERR_NICKNAMEINUSE_MESSAGE = ':Nickname is already in use'
 ERR_NICKCOLLISION_CODE = '436'
 ERR_NICKCOLLISION_MESSAGE = ':Nickname collision KILL'
 
+# PING Errors
+ERR_NOORIGIN_CODE = '409'
+ERR_NOORIGIN_MESSAGE = ':No origin specified'
+
 # USER Errors
 ERR_NEEDMOREPARAMS_CODE = '461'
 ERR_NEEDMOREPARAMS_MESSAGE = ':Not enough parameters'
@@ -15,7 +19,29 @@ ERR_ALREADYREGISTRED_CODE = '462'
 ERR_ALREADYREGISTRED_MESSAGE = ':You may not reregister'
 
 # PRIVMSG Errors
+ERR_NORECIPIENT_CODE = '411'
+ERR_NORECIPIENT_MESSAGE = ':No recipient given'
+ERR_NOTEXTTOSEND_CODE = '412'
+ERR_NOTEXTTOSEND_MESSAGE = ':No text to send'
 ERR_NOSUCHNICK_CODE = '401'
 ERR_NOSUCHNICK_MESSAGE = ':No such nick/channel'
 ERR_CANNOTSENDTOCHAN_CODE = '404'
 ERR_CANNOTSENDTOCHAN_MESSAGE = ':Cannot send to channel'
+
+# JOIN/PART Errors
+ERR_NOSUCHCHANNEL_CODE = '403'
+ERR_NOSUCHCHANNEL_MESSAGE = ':No such channel'
+ERR_NOTONCHANNEL_CODE = '442'
+ERR_NOTONCHANNEL_MESSAGE = ":You're not on that channel"
+ERR_UNAVAILRESOURCE_CODE = '437'
+ERR_UNAVAILRESOURCE_MESSAGE = ':Nick/channel is temporarily unavailable'
+ERR_NOTREGISTERED_CODE = '451'
+ERR_NOTREGISTERED_MESSAGE = ':You have not registered'
+
+# CAP Errors
+ERR_INVALIDCAPCMD_CODE = '410'
+ERR_INVALIDCAPCMD_MESSAGE = ':Invalid CAP command'
+
+# Generic Errors
+ERR_UNKNOWNCOMMAND_CODE = '421'
+ERR_UNKNOWNCOMMAND_MESSAGE = ':Unknown command'
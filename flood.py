@@ -0,0 +1,50 @@
+"""
+Description:
+
+Token bucket. Holds up to `capacity` tokens and refills at `rate` tokens per
+second, refilling lazily whenever it is asked for tokens.
+
+"""
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    # Take `amount` tokens if available. Returns 0, or the seconds until they are
+    def take(self, amount, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0
+        return (min(amount, self.capacity) - self.tokens) / self.rate
+
+"""
+Description:
+
+Flood control of a single client connection: one bucket for requests and one for
+request bytes. A rate of 0 disables the corresponding bucket.
+
+"""
+class FloodGate:
+    __slots__ = ('messages', 'bytes')
+
+    def __init__(self, message_rate, message_burst, byte_rate, byte_burst, now):
+        self.messages = TokenBucket(message_rate, message_burst, now) if message_rate else None
+        self.bytes = TokenBucket(byte_rate, byte_burst, now) if byte_rate else None
+
+    # Admit a request of `size` bytes. Returns 0, or the seconds until it would be admitted.
+    # Nothing is taken from either bucket unless both admit the request
+    def admit(self, size, now):
+        wait = self.messages.take(1, now) if self.messages is not None else 0
+        if wait:
+            return wait
+        if self.bytes is not None:
+            wait = self.bytes.take(size, now)
+            if wait and self.messages is not None:
+                self.messages.tokens += 1
+        return wait
@@ -0,0 +1,140 @@
+import constants
+
+"""
+Description:
+
+Message framing shared by the server and the client.
+Data is received straight into a preallocated bytearray (recv_into) and the
+region holding every complete CR-LF terminated line is decoded with a single
+call on a memoryview, then split. Incomplete lines are never decoded, so a
+multi-byte UTF-8 character split across two reads cannot break decoding.
+Enforces the RFC 1459 limit of 512 bytes per message (CR-LF included).
+
+Given a `scratch` bytearray shared by many framers, a framer owns no buffer while
+it holds no partial line: it receives into the scratch buffer, and only an
+incomplete line left over by `lines` is copied into a buffer of its own, which is
+released again once the line is complete. `lines` has to be called after every
+read into the scratch buffer, before any other framer reads into it.
+
+"""
+class LineFramer:
+    DELIM = constants.COMMAND_END_DELIM.encode(constants.COMMAND_ENCODING)
+    MAX_LINE_BYTES = constants.COMMAND_MAX_LENGTH - len(DELIM)
+
+    __slots__ = ('capacity', 'scratch', 'data', 'view', 'start', 'end', 'discarding', 'truncated_lines')
+
+    def __init__(self, capacity=constants.RECV_BUFFER_SIZE, scratch=None):
+        self.capacity = capacity
+        self.scratch = scratch # shared receive buffer, None to always own a buffer
+        self.data = bytearray(capacity) if scratch is None else None
+        self.view = memoryview(self.data) if scratch is None else None
+        self.start = 0 # first unconsumed byte
+        self.end = 0 # end of received bytes
+        self.discarding = False # dropping the tail of an oversized line
+        self.truncated_lines = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    # Writable region for the next read. Compacts the unconsumed bytes when the buffer is full
+    def get_buffer(self):
+        if self.data is None:
+            self.data = self.scratch
+            self.view = memoryview(self.scratch)
+        if self.end == len(self.data):
+            self.__compact()
+        return self.view[self.end:]
+
+    # Account for `nbytes` written into the region returned by get_buffer
+    def commit(self, nbytes):
+        self.end += nbytes
+
+    # Receive from a socket without intermediate bytes objects. Returns 0 on EOF
+    def recv_into(self, sock):
+        nbytes = sock.recv_into(self.get_buffer())
+        self.commit(nbytes)
+        return nbytes
+
+    # Copy bytes that were not read through get_buffer. Returns the complete lines
+    def feed(self, data):
+        lines = list()
+        data = memoryview(data)
+        while data:
+            region = self.get_buffer()
+            nbytes = min(len(region), len(data))
+            region[:nbytes] = data[:nbytes]
+            self.commit(nbytes)
+            data = data[nbytes:]
+            lines += self.lines()
+        return lines
+
+    # Unconsumed bytes, the start of a line that is not complete yet
+    def pending(self):
+        return bytes(self.data[self.start:self.end]) if self.data is not None else b''
+
+    # Split every complete line out of the buffer. Returns decoded lines without CR-LF
+    def lines(self):
+        lines = list()
+        start, end = self.start, self.end
+        last_delim = self.data.rfind(self.DELIM, start, end)
+        if last_delim != -1:
+            # The tail of an oversized line ends at the first CR-LF
+            if self.discarding:
+                start = self.data.find(self.DELIM, start, end) + len(self.DELIM)
+                self.discarding = False
+            if last_delim > start:
+                lines = self.__split(start, last_delim)
+            start = last_delim + len(self.DELIM)
+
+        # Incomplete line is already too long: keep its head, drop the rest.
+        # The last byte is kept in case CR-LF is split between two reads
+        if end - start > self.MAX_LINE_BYTES:
+            if not self.discarding:
+                lines.append(self.__truncate(str(self.view[start:end], constants.COMMAND_ENCODING, 'replace')))
+            self.discarding = True
+            start = end - 1
+
+        if start == end:
+            start = end = 0
+        self.start, self.end = start, end
+        if self.scratch is not None:
+            self.__settle()
+        return lines
+
+    # Keep a partial line out of the scratch buffer, own no buffer without one
+    def __settle(self):
+        if self.start == self.end:
+            self.data = self.view = None
+        elif self.data is self.scratch:
+            pending = self.end - self.start
+            data = bytearray(self.capacity)
+            data[:pending] = self.view[self.start:self.end]
+            self.data, self.view = data, memoryview(data)
+            self.start, self.end = 0, pending
+
+    # Decode complete lines in one call. CR-LF is ASCII so it never splits a character
+    def __split(self, start, end):
+        text = str(self.view[start:end], constants.COMMAND_ENCODING, 'replace')
+        lines = [line for line in text.split(constants.COMMAND_END_DELIM) if line]
+        if end - start > self.MAX_LINE_BYTES and self.__has_oversized_line(text, lines):
+            lines = [self.__truncate(line) for line in lines]
+        return lines
+
+    # Character count equals byte count for ASCII, otherwise a character is at most 4 bytes
+    def __has_oversized_line(self, text, lines):
+        if text.isascii():
+            return max(map(len, lines), default=0) > self.MAX_LINE_BYTES
+        return any(len(line) > self.MAX_LINE_BYTES // 4 and len(line.encode(constants.COMMAND_ENCODING)) > self.MAX_LINE_BYTES for line in lines)
+
+    def __truncate(self, line):
+        raw_line = line.encode(constants.COMMAND_ENCODING)
+        if len(raw_line) <= self.MAX_LINE_BYTES:
+            return line
+        self.truncated_lines += 1
+        return raw_line[:self.MAX_LINE_BYTES].decode(constants.COMMAND_ENCODING, 'ignore')
+
+    # Move unconsumed bytes to the front of the buffer
+    def __compact(self):
+        pending = self.end - self.start
+        self.data[:pending] = self.data[self.start:self.end]
+        self.start, self.end = 0, pending
@@ -0,0 +1,67 @@
+import json
+import socket
+import struct
+
+"""
+Description:
+
+Wire protocol of a hot upgrade. The running server listens on a Unix socket
+and a newly started server connects to it to take over. The running server
+sends, in this order:
+
+    header      HEADER: bytes of the JSON state, number of file descriptors
+    state       JSON with the registration state and pending buffers of every client
+    fds         one byte per batch of up to MAX_FDS descriptors, carried with SCM_RIGHTS:
+                the listening socket first, then the client connections in state order
+
+The new server answers ACK once it holds every descriptor. From then on the old
+server must not touch the connections; it exits, which closes the handoff
+connection and tells the new server that the old one released its resources.
+
+"""
+HEADER = struct.Struct('!II')
+ACK = b'A'
+FDS_MARKER = b'F'
+MAX_FDS = 253 # SCM_MAX_FD, descriptors per message
+PEERCRED = struct.Struct('3i') # pid, uid, gid
+
+# Process id and user id of the process on the other end of a Unix socket
+def peer_credentials(sock):
+    pid, uid, _gid = PEERCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, PEERCRED.size))
+    return pid, uid
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Handoff connection closed early')
+        data += chunk
+    return bytes(data)
+
+# Old server side. Returns once the new server acknowledged every descriptor
+def send_state(sock, state, fds):
+    data = json.dumps(state, separators=(',', ':')).encode()
+    sock.sendall(HEADER.pack(len(data), len(fds)) + data)
+    for start in range(0, len(fds), MAX_FDS):
+        socket.send_fds(sock, [FDS_MARKER], fds[start:start + MAX_FDS])
+    if sock.recv(len(ACK)) != ACK:
+        raise ConnectionError('Handoff was not acknowledged')
+
+# New server side. Returns the state and the received descriptors
+def receive_state(sock):
+    length, count = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    state = json.loads(_recv_exactly(sock, length))
+    fds = list()
+    while len(fds) < count:
+        _data, received, _flags, _address = socket.recv_fds(sock, len(FDS_MARKER), MAX_FDS)
+        if not received:
+            raise ConnectionError(f'Handoff connection closed after {len(fds)} of {count} descriptors')
+        fds += received
+    sock.sendall(ACK)
+    return state, fds
+
+# Block until the old server closed its end
+def wait_closed(sock):
+    while sock.recv(4096):
+        pass
@@ -0,0 +1,168 @@
+import mmap
+import os
+from collections import OrderedDict, deque
+
+import constants
+from util_server import ServerUtil
+
+DELIM = constants.COMMAND_END_DELIM.encode(constants.COMMAND_ENCODING)
+
+"""
+Description:
+
+Append-only log of channel history in memory-mapped segment files. A record is
+the channel name, a space and the encoded line with its CR-LF, so the records of
+a segment come back with a single split. Segments are created at full size and
+mapped once; appending copies the record into the mapping and the kernel writes
+it back, without a write call per message. Unused space stays zero-filled and
+the data of a segment ends at its last CR-LF, which also drops a record torn by
+a crash. Only the newest `segments` segments are kept.
+
+"""
+class HistoryLog:
+    PREFIX = 'history-'
+    SUFFIX = '.log'
+
+    def __init__(self, directory, segment_bytes=constants.HISTORY_SEGMENT_BYTES, segments=constants.HISTORY_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segments = segments
+        self.sequence = 0 # sequence number of the segment being appended to
+        self.fd = None
+        self.map = None
+        self.offset = 0 # end of the data in the current segment
+        os.makedirs(directory, exist_ok=True)
+
+    def __path(self, sequence):
+        return os.path.join(self.directory, f'{self.PREFIX}{sequence:08d}{self.SUFFIX}')
+
+    # Sequence numbers of the segments on disk, oldest first
+    def __sequences(self):
+        sequences = list()
+        for name in os.listdir(self.directory):
+            number = name[len(self.PREFIX):-len(self.SUFFIX)]
+            if name.startswith(self.PREFIX) and name.endswith(self.SUFFIX) and number.isdigit():
+                sequences.append(int(number))
+        return sorted(sequences)
+
+    # Used region of every segment on disk, newest first. Appending continues in the newest one
+    def read(self):
+        sequences = self.__sequences()
+        if sequences:
+            self.sequence = sequences[-1]
+        for sequence in reversed(sequences):
+            with open(self.__path(sequence), 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    last = mapped.rfind(DELIM)
+                    end = last + len(DELIM) if last != -1 else 0
+                    data = mapped[:end]
+            if sequence == self.sequence:
+                self.offset = end
+            yield data
+
+    # Map a segment for appending, creating it at full size
+    def __map(self, sequence):
+        self.sequence = sequence
+        self.fd = os.open(self.__path(sequence), os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < self.segment_bytes:
+            os.ftruncate(self.fd, self.segment_bytes)
+        self.map = mmap.mmap(self.fd, self.segment_bytes)
+
+    # Continue in a new segment and delete the ones beyond the retained count
+    def __rotate(self):
+        self.close()
+        self.offset = 0
+        self.__map(self.sequence + 1)
+        for sequence in self.__sequences():
+            if sequence <= self.sequence - self.segments:
+                os.remove(self.__path(sequence))
+
+    def append(self, record):
+        if self.map is None:
+            self.__map(self.sequence)
+        end = self.offset + len(record)
+        if end > self.segment_bytes:
+            self.__rotate()
+            end = len(record)
+        self.map[self.offset:end] = record
+        self.offset = end
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            os.close(self.fd)
+            self.map = self.fd = None
+
+"""
+Description:
+
+Bounded history of every channel: a ring of the last `lines` encoded lines per
+channel, exactly as they were sent to the members. A replay is one contiguous
+bytes object, queued to the joining client as a single write. At most
+`channels` rings are kept; the channel that was quiet the longest is dropped
+first. Channels are keyed by their casefolded name. An attached HistoryLog
+persists every recorded line.
+
+"""
+class ChannelHistory:
+    def __init__(self, lines, channels=constants.HISTORY_MAX_CHANNELS):
+        self.lines = lines
+        self.channels = channels
+        self.rings = OrderedDict() # casefolded channel -> deque of encoded lines, least recently used first
+        self.log = None
+
+    def __len__(self):
+        return len(self.rings)
+
+    def __ring(self, key):
+        ring = self.rings.get(key)
+        if ring is None:
+            if len(self.rings) >= self.channels:
+                self.rings.popitem(last=False)
+            ring = self.rings[key] = deque(maxlen=self.lines)
+        else:
+            self.rings.move_to_end(key)
+        return ring
+
+    # Keep an encoded line sent to a channel. The log records the casefolded channel name
+    def record(self, channel, line):
+        key = ServerUtil.casefold_channel(channel)
+        self.__ring(key).append(line)
+        if self.log is not None:
+            self.log.append(b'%s %s' % (key.encode(constants.COMMAND_ENCODING), line))
+
+    # Every kept line of a channel, oldest first, as one bytes object
+    def replay(self, channel):
+        ring = self.rings.get(ServerUtil.casefold_channel(channel))
+        return b''.join(ring) if ring else b''
+
+    # Fill the rings from a log and persist new lines to it. Returns the number of records read.
+    # Records are scanned newest first, so a channel is skipped once its ring is full
+    def attach(self, log):
+        records = 0
+        loaded = dict() # encoded channel -> newest lines first, most recently used channel first
+        for data in log.read():
+            lines = data.split(DELIM)
+            lines.pop()
+            records += len(lines)
+            for record in reversed(lines):
+                space = record.find(b' ')
+                channel = record[:space]
+                newest = loaded.get(channel)
+                if newest is None:
+                    if len(loaded) >= self.channels:
+                        continue
+                    newest = loaded[channel] = list()
+                elif len(newest) >= self.lines:
+                    continue
+                newest.append(record[space + 1:] + DELIM)
+        for channel, newest in reversed(loaded.items()):
+            self.__ring(ServerUtil.casefold_channel(channel.decode(constants.COMMAND_ENCODING, 'replace'))).extend(reversed(newest))
+        self.log = log
+        return records
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
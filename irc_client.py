@@ -10,19 +10,25 @@
 Description:
 
 """
+import argparse
 import asyncio
+import itertools
 import logging
+import os
 import socket
 import select
+import stat
 import threading
 import queue
 import patterns
-import view
 import sys
 import commands
+import compression
 import constants
+from compression import InboundStream
+from framing import LineFramer
+from message import Message
 
-logging.basicConfig(filename='log-client.log', filemode='w+', level=logging.DEBUG)
 logger = logging.getLogger()
 
 class RequestBuilder:
@@ -41,11 +47,30 @@ class RequestBuilder:
             request = f'{commands.BROADCAST} {constants.GLOBAL_CHANNEL} {constants.COMMAND_MESSAGE_DELIM}{msg}'
 
         request += constants.COMMAND_END_DELIM
-        logger.info(f'RequestBuilder prepared request {repr(request)}')
+        logger.debug('RequestBuilder prepared request %r', request)
         return request.encode(constants.COMMAND_ENCODING)
 
+    # Request for a line of user input, None for /quit.
+    # Any other /command is sent as a raw IRC command, plain text goes to the global channel
+    def build_input(self, msg):
+        lowered = msg.lower()
+        if lowered.startswith(constants.UI_QUIT):
+            return None
+        elif lowered.startswith(constants.UI_NICK):
+            return self.build(msg, commands.NICKNAME)
+        elif lowered.startswith(constants.UI_USER):
+            return self.build(msg, commands.USERNAME)
+        elif msg.startswith(constants.UI_COMMAND_PREFIX):
+            return f'{msg[len(constants.UI_COMMAND_PREFIX):]}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING)
+        return self.build(msg, commands.BROADCAST)
+
+# CAP REQ for compressed server output. `inbound` has to know before the answer arrives
+def compression_request(inbound):
+    inbound.expect_ack()
+    return f'{commands.CAP} {commands.CAP_REQ} {constants.COMMAND_MESSAGE_DELIM}{compression.CAPABILITY}'
+
 class IRCClient(patterns.Subscriber):
-    def __init__(self, host, port):
+    def __init__(self, host, port, compress=False):
         super().__init__()
         self.nick = ''
         self._run = True
@@ -53,7 +78,9 @@ class IRCClient(patterns.Subscriber):
         self.port = port
         self.socket = None
         self.request_builder = RequestBuilder()
-        self.buffer = ''
+        self.buffer = LineFramer()
+        self.compress = compress
+        self.inbound = InboundStream()
 
     def set_view(self, view):
         self.view = view
@@ -64,6 +91,8 @@ class IRCClient(patterns.Subscriber):
     def init_tcp_connection(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.connect((self.host, self.port))
+        if self.compress:
+            self.socket.sendall(f'{compression_request(self.inbound)}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
         self.socket.setblocking(0)
 
     def update(self, msg):
@@ -75,15 +104,9 @@ class IRCClient(patterns.Subscriber):
         self.process_input(msg)
 
     def process_input(self, msg):
-        request = ""
-        if msg.lower().startswith(constants.UI_QUIT):
+        request = self.request_builder.build_input(msg)
+        if request is None:
             raise KeyboardInterrupt
-        elif msg.lower().startswith(constants.UI_NICK):
-            request = self.request_builder.build(msg, commands.NICKNAME)
-        elif msg.lower().startswith(constants.UI_USER):
-            request = self.request_builder.build(msg, commands.USERNAME)
-        else:
-            request = self.request_builder.build(msg, commands.BROADCAST)
         
         logger.info(f'Sending request {repr(request)}')
         self.socket.sendall(request)
@@ -96,7 +119,7 @@ class IRCClient(patterns.Subscriber):
             prefix = server_message[1: msg_start].strip()
             self.nick = prefix
         # Process message
-        message = server_message[msg_start:server_message.index(constants.COMMAND_END_DELIM)].strip()
+        message = server_message[msg_start:].strip()
         return message
     
     # Listen for server input
@@ -112,16 +135,17 @@ class IRCClient(patterns.Subscriber):
             
                 # Receive messages from the server
                 if read_sockets:
-                    data = self.socket.recv(4096).decode(constants.COMMAND_ENCODING)
-                    self.buffer += data
-                    if constants.COMMAND_END_DELIM not in self.buffer:
-                        logger.warning('Buffer does not contain CR-LF termination. Processing later.')
-                    else:
-                        message_delim = self.buffer.index(constants.COMMAND_END_DELIM) + len(constants.COMMAND_END_DELIM)
-                        server_message = self.buffer[:message_delim]
-                        self.buffer = self.buffer[message_delim:] # update buffer
-
+                    server_messages = self.__receive()
+                    if server_messages is None:
+                        logger.warning('Server closed the connection')
+                        break
+                    # Display every complete message received so far
+                    for server_message in server_messages:
                         logger.info(f'Client received message from the server {repr(server_message)}')
+                        # Keepalive, answered without showing it
+                        if server_message.startswith(commands.PING):
+                            self.socket.sendall(f'{commands.PONG}{server_message[len(commands.PING):]}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+                            continue
                         server_message = self.__process_server_message(server_message) # Process msg
 
                         logger.info(f'Displaying response "{server_message}"')
@@ -131,27 +155,253 @@ class IRCClient(patterns.Subscriber):
             logger.warning(f'Thread: Listening Error {e}')
         
 
+    # Complete lines received, None once the server closed the connection. Only data received
+    # while the answer to CAP REQ is pending or after compression started goes through `inbound`,
+    # everything else is received straight into the framer's buffer
+    def __receive(self):
+        if self.inbound.awaiting_ack or self.inbound.compressed:
+            data = self.socket.recv(constants.RECV_BUFFER_SIZE)
+            return self.buffer.feed(self.inbound.decode(data)) if data else None
+        if not self.buffer.recv_into(self.socket):
+            return None
+        return self.buffer.lines()
+
     def close(self):
         # Terminate connection
         logger.debug(f"Closing IRC Client object")
         self.socket.close()
 
-def fetch_server_info(args):
-    host = '127.0.0.1'
-    port = 6667
-    if(len(args) != 0 and (len(args) != 4 or args[0] != '--server' or args[2] != '--port' or not args[3].isnumeric())):
-        print('Invalid argument list. Usage: irc_client.py [--server SERVER] [--port PORT]')
-        sys.exit()
-    if(len(args) == 4):
-        host, port = args[1], int(args[3])
-    return host, port
+"""
+Description:
+
+IRC client without a user interface, for bots, relays and scripts, built on
+asyncio streams. Requests are pipelined: `send` only queues a line, and every
+line queued during one pass of the event loop goes out in a single write, so a
+sender never waits for the server between requests. Callers that queue faster
+than the connection drains check `buffered()` and await `drain()`. `sync()`
+waits until the server processed everything sent before it.
+With `compress`, the client asks for compressed server output right after
+connecting (CAP REQ :zlib) and inflates it if the server agrees.
+Messages from the server are read as parsed `Message` objects with
+`async for message in client`, or as raw lines with `client.lines()`; PING is
+answered without showing it. Received lines are buffered until they are read,
+unless `keep_messages` is False.
+
+"""
+class HeadlessClient:
+    def __init__(self, host, port, keep_messages=True, compress=False):
+        self.host = host
+        self.port = port
+        self.keep_messages = keep_messages
+        self.compress = compress
+        self.inbound = InboundStream()
+        self.request_builder = RequestBuilder()
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self.outgoing = list() # encoded requests not written yet
+        self.outgoing_bytes = 0
+        self.flush_scheduled = False
+        self.received = asyncio.Queue() # lists of received lines, None after the connection closed
+        self.syncs = dict() # PING token -> future resolved by its PONG
+        self.sync_tokens = itertools.count()
+        self.receiving = None
+        self.closed = False
+
+    async def connect(self):
+        self.loop = asyncio.get_running_loop()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.transport.set_write_buffer_limits(constants.CLIENT_SEND_HIGH_WATER)
+        if self.compress:
+            self.send(compression_request(self.inbound))
+        self.receiving = asyncio.ensure_future(self.__receive())
+        logger.info(f'Headless client connected to {self.host}:{self.port}')
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Queue a raw IRC line, without CR-LF
+    def send(self, line):
+        self.__queue(f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+
+    # Queue the request for a line of user input. Returns False for /quit
+    def send_input(self, msg):
+        request = self.request_builder.build_input(msg)
+        if request is None:
+            return False
+        self.__queue(request)
+        return True
+
+    def __queue(self, request):
+        self.outgoing.append(request)
+        self.outgoing_bytes += len(request)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.__flush)
+
+    # Write every queued request at once
+    def __flush(self):
+        self.flush_scheduled = False
+        if not self.outgoing:
+            return
+        if not self.closed:
+            self.writer.write(b''.join(self.outgoing))
+        self.outgoing.clear()
+        self.outgoing_bytes = 0
+
+    # Bytes queued or written but not yet sent
+    def buffered(self):
+        return self.outgoing_bytes + self.writer.transport.get_write_buffer_size()
+
+    # Write the queued requests and wait until the socket takes more
+    async def drain(self):
+        self.__flush()
+        await self.writer.drain()
+
+    # Wait until the server answered a PING sent after every queued request
+    async def sync(self):
+        token = f'sync{next(self.sync_tokens)}'
+        pong = self.syncs[token] = self.loop.create_future()
+        self.send(f'{commands.PING} {constants.COMMAND_MESSAGE_DELIM}{token}')
+        await self.drain()
+        await pong
+
+    async def __receive(self):
+        framer = LineFramer()
+        try:
+            while data := await self.reader.read(constants.CLIENT_READ_SIZE):
+                lines = list()
+                for line in framer.feed(self.inbound.decode(data)):
+                    # Keepalive, answered without showing it
+                    if line.startswith(commands.PING):
+                        self.send(f'{commands.PONG}{line[len(commands.PING):]}')
+                    elif self.syncs and self.__is_sync_reply(line):
+                        continue
+                    elif self.keep_messages:
+                        lines.append(line)
+                if lines:
+                    self.received.put_nowait(lines)
+        except ConnectionError as e:
+            logger.warning(f'Headless client lost the connection: {e}')
+        finally:
+            self.closed = True
+            for pong in self.syncs.values():
+                if not pong.done():
+                    pong.set_exception(ConnectionError('Server closed the connection'))
+            self.syncs.clear()
+            self.received.put_nowait(None)
+            logger.info('Server closed the connection')
+
+    # Resolve the sync() waiting for this PONG
+    def __is_sync_reply(self, line):
+        message = Message.parse(line)
+        if message.command != commands.PONG or message.trailing not in self.syncs:
+            return False
+        self.syncs.pop(message.trailing).set_result(None)
+        return True
+
+    def __aiter__(self):
+        return self.messages()
+
+    # Server lines without CR-LF until the connection closes
+    async def lines(self):
+        while True:
+            lines = await self.received.get()
+            if lines is None:
+                self.received.put_nowait(None)
+                return
+            for line in lines:
+                yield line
+
+    # Parsed server messages until the connection closes
+    async def messages(self):
+        async for line in self.lines():
+            yield Message.parse(line)
+
+    async def close(self):
+        if self.writer is None:
+            return
+        self.__flush()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        if self.receiving is not None:
+            await self.receiving
+
+# Lines of a script or of stdin. A pipe or terminal is read without blocking the event loop,
+# a regular file is read directly and hands control back every CLIENT_INPUT_BATCH lines
+async def read_input(source):
+    if stat.S_ISREG(os.fstat(source.fileno()).st_mode):
+        for count, line in enumerate(source, 1):
+            yield line.rstrip('\r\n')
+            if count % constants.CLIENT_INPUT_BATCH == 0:
+                await asyncio.sleep(0)
+        return
+    reader = asyncio.StreamReader()
+    await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), source)
+    while line := await reader.readline():
+        yield line.decode(constants.COMMAND_ENCODING, 'replace').rstrip('\r\n')
+
+async def print_lines(client):
+    async for line in client.lines():
+        sys.stdout.write(f'{line}\n')
+    sys.stdout.flush()
+
+# Send every input line as fast as the connection takes it and print what the server sends.
+# Stops at the end of the input or at /quit, once the server processed everything sent
+async def run_headless(host, port, source, compress):
+    async with HeadlessClient(host, port, compress=compress) as client:
+        printing = asyncio.ensure_future(print_lines(client))
+        sent = 0
+        async for msg in read_input(source):
+            if client.closed or not client.send_input(msg):
+                break
+            sent += 1
+            if client.buffered() > constants.CLIENT_SEND_HIGH_WATER:
+                await client.drain()
+        if not client.closed:
+            await client.sync()
+        logger.info(f'Headless client sent {sent} requests')
+    await printing
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog='irc_client.py')
+    parser.add_argument('--server', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--headless', action='store_true', help='no user interface: send the lines of --script or stdin and print server messages')
+    parser.add_argument('--script', type=argparse.FileType('r'), help='input lines for --headless instead of stdin')
+    parser.add_argument('--compress', action='store_true', help='ask the server for zlib compressed output')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO')
+    parsed = parser.parse_args(args)
+    if parsed.script is not None and not parsed.headless:
+        parser.error('--script requires --headless')
+    return parsed
 
 
 def main(args):
-    host, port = fetch_server_info(args)
+    args = parse_args(args)
+    host, port = args.server, args.port
+    logging.basicConfig(filename='log-client.log', filemode='w+', level=args.log_level)
+
+    if args.headless:
+        try:
+            asyncio.run(run_headless(host, port, args.script or sys.stdin, args.compress))
+        except ConnectionRefusedError:
+            conn_err = f'Server is not listening on {host}:{port}'
+            logger.warning(conn_err)
+            sys.exit(conn_err)
+        except KeyboardInterrupt:
+            logger.debug(f"Signifies end of process")
+        return
 
     # Pass args
-    client = IRCClient(host, port)
+    client = IRCClient(host, port, args.compress)
     logger.info(f"Client object created")
 
     # Attempt connection with the server
@@ -164,8 +414,9 @@ def main(args):
         print(conn_err)
         sys.exit()
 
-    # Connect to View
+    # Connect to View. Curses is only loaded for the terminal interface
     logger.info(f'Successfully connected to {host}:{port}')
+    import view
     with view.View() as v:
         logger.info(f"Entered the context of a View object")
         client.set_view(v)
@@ -0,0 +1,60 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+"""
+Description:
+
+Queue handler that hands records over unformatted. The stock QueueHandler formats
+every message in the calling thread; here %-style arguments are only formatted by
+the listener thread, and only for records that passed the level check.
+Arguments must not be mutated after the call (strings, bytes, numbers and tuples).
+
+"""
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+"""
+Description:
+
+Logging pipeline of a server process. The event loop only puts records on an
+in-memory queue, a QueueListener thread formats them and writes the log file.
+The level can be changed at runtime.
+
+"""
+class LogPipeline:
+    LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+    def __init__(self, log_file, level='INFO', mode='w+'):
+        self.level = level
+        self.queue = queue.SimpleQueue()
+        self.file_handler = logging.FileHandler(log_file, mode=mode)
+        self.file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        self.listener = QueueListener(self.queue, self.file_handler)
+        self.running = False
+
+    # Route the root logger through the queue and start the writer thread
+    def start(self):
+        logger = logging.getLogger()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(DeferredQueueHandler(self.queue))
+        logger.setLevel(self.level)
+        self.listener.start()
+        self.running = True
+        atexit.register(self.stop)
+        return logger
+
+    def set_level(self, level):
+        self.level = level
+        logging.getLogger().setLevel(level)
+
+    # Write out the queued records and stop the writer thread
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.listener.stop()
+        self.file_handler.close()
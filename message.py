@@ -0,0 +1,69 @@
+import constants
+
+"""
+Description:
+
+Parsed IRC message (RFC 1459/2812):
+
+    [:prefix] COMMAND [middle params ...] [:trailing]
+
+`parse` makes a single pass over the line with str.partition/str.split, which run
+in C, instead of searching the line again for every field. Commands are upper-cased.
+At most 15 parameters are kept, the last one takes the rest of the line.
+
+"""
+class Message:
+    __slots__ = ('prefix', 'command', 'params', 'trailing')
+
+    MAX_PARAMS = 15
+    TRAILING_DELIM = f' {constants.COMMAND_MESSAGE_DELIM}'
+
+    def __init__(self, prefix, command, params, trailing=None):
+        self.prefix = prefix
+        self.command = command
+        self.params = params # middle parameters
+        self.trailing = trailing # None when the line has no trailing parameter
+
+    @staticmethod
+    def parse(line):
+        # Fields are set directly, skipping the __init__ call on the hot path
+        message = Message.__new__(Message)
+        if line.startswith(constants.COMMAND_PREFIX_DELIM):
+            message.prefix, _, line = line[1:].partition(' ')
+        else:
+            message.prefix = ''
+        line, trailing_delim, trailing = line.partition(Message.TRAILING_DELIM)
+        params = line.split(None, Message.MAX_PARAMS)
+        message.command = params.pop(0).upper() if params else ''
+        message.params = params
+        message.trailing = trailing if trailing_delim else None
+        return message
+
+    # Parameter by position, the trailing parameter counts as the last one
+    def param(self, index, default=''):
+        if index < len(self.params):
+            return self.params[index]
+        if index == len(self.params) and self.trailing is not None:
+            return self.trailing
+        return default
+
+    def param_count(self):
+        return len(self.params) + (self.trailing is not None)
+
+    # Every parameter, trailing included
+    def arguments(self):
+        return self.params if self.trailing is None else self.params + [self.trailing]
+
+    def to_line(self):
+        parts = [f'{constants.COMMAND_PREFIX_DELIM}{self.prefix}'] if self.prefix else []
+        parts.append(self.command)
+        parts += self.params
+        if self.trailing is not None:
+            parts.append(f'{constants.COMMAND_MESSAGE_DELIM}{self.trailing}')
+        return ' '.join(parts)
+
+    def __eq__(self, other):
+        return isinstance(other, Message) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f'Message({self.prefix!r}, {self.command!r}, {self.params!r}, {self.trailing!r})'
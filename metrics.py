@@ -0,0 +1,219 @@
+import os
+import socket
+import stat
+import threading
+
+"""
+Description:
+
+Latency histogram with HDR-style log-linear buckets. Values are recorded in whole
+nanoseconds (perf_counter_ns differences): every power of two range is split into
+SUB_BUCKETS linear buckets, so any recorded value is known within 1 / SUB_BUCKETS
+of its size while the whole range up to ~18 minutes fits in a few hundred counters.
+Longer values are counted in the top bucket. Recording is integer arithmetic and
+a list increment, no floats on the hot path.
+
+"""
+class LatencyHistogram:
+    SUB_BUCKET_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    MAX_SHIFT = 36 # top bucket ends at 2^40 ns
+    BUCKET_COUNT = (MAX_SHIFT + 2) * SUB_BUCKETS
+    EXPORTED_OCTAVES = range(10, 38) # `le` bounds 2^10 ns (~1 us) .. 2^37 ns (~2 minutes)
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKET_COUNT
+        self.sum = 0 # nanoseconds
+
+    @classmethod
+    def bucket_index(cls, nanos):
+        shift = nanos.bit_length() - cls.SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            return nanos
+        return min((shift << cls.SUB_BUCKET_BITS) + (nanos >> shift), cls.BUCKET_COUNT - 1)
+
+    # Exclusive upper bound of a bucket in nanoseconds
+    @classmethod
+    def bucket_limit(cls, index):
+        shift = max(0, (index >> cls.SUB_BUCKET_BITS) - 1)
+        return (index - (shift << cls.SUB_BUCKET_BITS) + 1) << shift
+
+    # Hot path, bucket_index is inlined for SUB_BUCKET_BITS = 3
+    def record(self, nanos):
+        shift = nanos.bit_length() - 4
+        index = nanos if shift <= 0 else (shift << 3) + (nanos >> shift)
+        if index >= self.BUCKET_COUNT:
+            index = self.BUCKET_COUNT - 1
+        self.counts[index] += 1
+        self.sum += nanos
+
+    def count(self):
+        return sum(self.counts)
+
+    # Upper bound in seconds of the bucket holding the given quantile, 0 when empty
+    def quantile(self, q):
+        rank = max(1, round(q * self.count()))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bucket_limit(index) / 1000000000
+        return 0.0
+
+    # Cumulative counts at power of two nanosecond bounds, as (bound in seconds, count)
+    def cumulative(self):
+        counts = self.counts
+        buckets, seen, index = list(), 0, 0
+        for octave in self.EXPORTED_OCTAVES:
+            limit = 1 << octave
+            end = self.bucket_index(limit)
+            seen += sum(counts[index:end])
+            index = end
+            buckets.append((limit / 1000000000, seen))
+        return buckets
+
+"""
+Description:
+
+Server counters and histograms, rendered in the Prometheus text exposition format.
+Counters are plain attributes bumped by the event loop. Gauges are callables
+evaluated only when the metrics are rendered.
+
+"""
+class Metrics:
+    PREFIX = 'ircchat'
+    QUANTILES = (0.5, 0.99, 0.999)
+    COUNTERS = (
+        ('connections_accepted', 'Accepted client and server link connections'),
+        ('registrations', 'Clients that completed NICK/USER registration'),
+        ('messages_received', 'Complete requests received'),
+        ('received_bytes', 'Bytes received from connections'),
+        ('messages_sent', 'Messages queued for delivery, dropped_messages included'),
+        ('sent_bytes', 'Bytes queued for delivery, dropped_messages included'),
+        ('evictions', 'Slow consumers disconnected'),
+        ('dropped_messages', 'Messages dropped for slow consumers'),
+        ('flood_penalties', 'Requests over the flood limits of a client'),
+        ('timeouts', 'Connections closed for registration or PING timeouts'),
+        ('history_replays', 'Channel histories replayed to joining clients'),
+        ('compression_input_bytes', 'Bytes compressed for connections that negotiated zlib'),
+        ('compression_output_bytes', 'Compressed bytes written for connections that negotiated zlib'),
+    )
+
+    def __init__(self, commands):
+        for name, _help in self.COUNTERS:
+            setattr(self, name, 0)
+        self.gauges = list() # (name, help, callable)
+        self.command_latency = {command: LatencyHistogram() for command in commands}
+        self.event_loop_lag = LatencyHistogram()
+
+    def add_gauge(self, name, help_text, value):
+        self.gauges.append((name, help_text, value))
+
+    def __format_value(self, value):
+        return repr(value) if isinstance(value, float) else str(value)
+
+    def __render_histogram(self, lines, name, histogram, labels=''):
+        separator = ',' if labels else ''
+        for limit, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{self.__format_value(limit)}"}} {count}')
+        count = histogram.count()
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.__format_value(histogram.sum / 1000000000)}')
+        lines.append(f'{name}_count{suffix} {count}')
+
+    def render(self):
+        lines = list()
+        for name, help_text in self.COUNTERS:
+            lines.append(f'# HELP {self.PREFIX}_{name}_total {help_text}')
+            lines.append(f'# TYPE {self.PREFIX}_{name}_total counter')
+            lines.append(f'{self.PREFIX}_{name}_total {getattr(self, name)}')
+        for name, help_text, value in self.gauges:
+            lines.append(f'# HELP {self.PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {self.PREFIX}_{name} gauge')
+            lines.append(f'{self.PREFIX}_{name} {self.__format_value(value())}')
+
+        name = f'{self.PREFIX}_command_latency_seconds'
+        lines.append(f'# HELP {name} Time from receiving a request to writing its output, for a sample of the requests')
+        lines.append(f'# TYPE {name} histogram')
+        for command, histogram in self.command_latency.items():
+            self.__render_histogram(lines, name, histogram, f'command="{command}"')
+        name = f'{self.PREFIX}_command_latency_quantile_seconds'
+        lines.append(f'# HELP {name} Request latency quantiles within the histogram precision')
+        lines.append(f'# TYPE {name} gauge')
+        for command, histogram in self.command_latency.items():
+            for q in self.QUANTILES:
+                lines.append(f'{name}{{command="{command}",quantile="{q}"}} {self.__format_value(histogram.quantile(q))}')
+
+        name = f'{self.PREFIX}_event_loop_lag_seconds'
+        lines.append(f'# HELP {name} Delay before the event loop gets back to waiting for I/O')
+        lines.append(f'# TYPE {name} histogram')
+        self.__render_histogram(lines, name, self.event_loop_lag)
+        lines.append('')
+        return '\n'.join(lines)
+
+"""
+Description:
+
+Local metrics endpoint. A daemon thread accepts connections on a TCP address or
+a Unix socket path, answers each one with a plain HTTP response holding the
+rendered metrics and closes it, so it can be scraped by Prometheus or read with
+curl. The event loop never touches these sockets.
+
+"""
+class MetricsEndpoint:
+    READ_TIMEOUT = 1.0 # seconds to wait for the request of a scraper
+
+    def __init__(self, address, metrics):
+        self.address = address # (host, port) or Unix socket path
+        self.metrics = metrics
+        self.socket = None
+        self.thread = None
+
+    def start(self):
+        if isinstance(self.address, str):
+            # Socket file left behind by a previous run
+            if os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.listen(16)
+        self.thread = threading.Thread(target=self.__serve, name='metrics', daemon=True)
+        self.thread.start()
+
+    def __respond(self, connection):
+        connection.settimeout(self.READ_TIMEOUT)
+        try:
+            connection.recv(4096)
+        except socket.timeout:
+            pass
+        body = self.metrics.render().encode('utf-8')
+        header = f'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\n\r\n'
+        connection.sendall(header.encode('utf-8') + body)
+
+    def __serve(self):
+        while True:
+            try:
+                connection, _addr = self.socket.accept()
+            except OSError:
+                return # endpoint stopped
+            with connection:
+                try:
+                    self.__respond(connection)
+                except OSError:
+                    pass
+
+    def stop(self):
+        if self.socket is None:
+            return
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR) # wakes up the blocked accept
+        except OSError:
+            pass
+        self.socket.close()
+        self.socket = None
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
@@ -0,0 +1,81 @@
+from util_server import ServerUtil
+
+"""
+Description:
+
+View of the rest of the IRC network as seen by this server through its links.
+Servers form a spanning tree: every remote server is reached through exactly one
+direct link, so forwarding a message to every link except the one it came from
+delivers it once to every server.
+
+"""
+class RemoteServer:
+    def __init__(self, name, hopcount, info, link, uplink):
+        self.name = name
+        self.hopcount = hopcount
+        self.info = info
+        self.link = link # direct link connection the server is reached through
+        self.uplink = uplink # name of the server that introduced it
+
+class RemoteUser:
+    def __init__(self, nickname, server_name, hopcount):
+        self.nickname = nickname
+        self.username = ''
+        self.server_name = server_name
+        self.hopcount = hopcount
+
+class Network:
+    def __init__(self, name):
+        self.name = name # this server
+        self.servers = dict() # name -> RemoteServer
+        self.users = dict() # casefolded nickname -> RemoteUser
+        self.links = dict() # link connection -> directly linked server name
+
+    def has_server(self, name):
+        return name == self.name or name in self.servers
+
+    def add_link(self, link, name, hopcount, info):
+        self.links[link] = name
+        self.add_server(name, hopcount, info, link, self.name)
+
+    def add_server(self, name, hopcount, info, link, uplink):
+        self.servers[name] = RemoteServer(name, hopcount, info, link, uplink)
+
+    # Forget a direct link and everything behind it. Returns (server name, removed nicknames)
+    def remove_link(self, link):
+        name = self.links.pop(link, None)
+        if name is None:
+            return None, list()
+        return name, self.remove_server(name)
+
+    # Forget a server with its subtree. Returns the nicknames that were on it
+    def remove_server(self, name):
+        removed_servers = {name}
+        # Servers are introduced after their uplink, so one ordered pass finds the whole subtree
+        for server in list(self.servers.values()):
+            if server.uplink in removed_servers:
+                removed_servers.add(server.name)
+        for server_name in removed_servers:
+            self.servers.pop(server_name, None)
+        removed_users = [key for key, user in self.users.items() if user.server_name in removed_servers]
+        return [self.users.pop(key).nickname for key in removed_users]
+
+    def get_user(self, nickname):
+        return self.users.get(ServerUtil.casefold_nickname(nickname))
+
+    def add_user(self, nickname, server_name, hopcount):
+        self.users[ServerUtil.casefold_nickname(nickname)] = RemoteUser(nickname, server_name, hopcount)
+
+    def rename_user(self, old_nickname, nickname):
+        user = self.users.pop(ServerUtil.casefold_nickname(old_nickname))
+        user.nickname = nickname
+        self.users[ServerUtil.casefold_nickname(nickname)] = user
+
+    def remove_user(self, nickname):
+        return self.users.pop(ServerUtil.casefold_nickname(nickname), None)
+
+    # Direct link a remote user is reached through
+    def link_of_user(self, nickname):
+        user = self.get_user(nickname)
+        server = self.servers.get(user.server_name) if user is not None else None
+        return server.link if server is not None else None
@@ -0,0 +1,89 @@
+import selectors
+
+"""
+Description:
+
+I/O readiness backend for the server event loop.
+Every socket is registered once and its interest mask is only modified on demand,
+instead of rebuilding O(N) fd sets on every iteration like select.select does.
+
+"""
+class Poller:
+    READ = selectors.EVENT_READ
+    WRITE = selectors.EVENT_WRITE
+
+    # Backend name -> selector class (None when the platform does not provide it)
+    BACKENDS = {
+        'default': selectors.DefaultSelector,
+        'select': selectors.SelectSelector,
+        'poll': getattr(selectors, 'PollSelector', None),
+        'epoll': getattr(selectors, 'EpollSelector', None),
+        'kqueue': getattr(selectors, 'KqueueSelector', None),
+    }
+
+    def __init__(self, backend='default'):
+        selector_class = self.BACKENDS.get(backend)
+        if selector_class is None:
+            raise ValueError(f'I/O backend "{backend}" is not available on this platform')
+        self.backend = backend
+        self.selector = selector_class()
+        self.parked = dict() # socket -> data, registered sockets without any interest
+
+    # Start watching a socket for the given interest mask
+    def register(self, sock, mask, data=None):
+        self.selector.register(sock, mask, data)
+
+    # Change the interest mask, skipping the syscall if nothing changed.
+    # Selectors reject an empty mask, so a socket without interest is parked outside the selector
+    def modify(self, sock, mask):
+        if sock in self.parked:
+            if mask:
+                self.selector.register(sock, mask, self.parked.pop(sock))
+            return
+        key = self.selector.get_key(sock)
+        if key.events == mask:
+            return
+        if mask:
+            self.selector.modify(sock, mask, key.data)
+        else:
+            self.selector.unregister(sock)
+            self.parked[sock] = key.data
+
+    def events(self, sock):
+        return 0 if sock in self.parked else self.selector.get_key(sock).events
+
+    # Toggle write interest, keeping the read interest as it is
+    def want_write(self, sock, enabled):
+        events = self.events(sock)
+        self.modify(sock, events | self.WRITE if enabled else events & ~self.WRITE)
+
+    # Toggle read interest, keeping the write interest as it is
+    def want_read(self, sock, enabled):
+        events = self.events(sock)
+        self.modify(sock, events | self.READ if enabled else events & ~self.READ)
+
+    # Stop watching a socket. Safe to call for unknown or already closed sockets
+    def unregister(self, sock):
+        if sock in self.parked:
+            del self.parked[sock]
+            return
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def is_registered(self, sock):
+        if sock in self.parked:
+            return True
+        try:
+            self.selector.get_key(sock)
+            return True
+        except (KeyError, ValueError):
+            return False
+
+    # Wait for readiness. Returns a list of (socket, event mask) pairs
+    def poll(self, timeout=None):
+        return [(key.fileobj, events) for key, events in self.selector.select(timeout)]
+
+    def close(self):
+        self.selector.close()
@@ -0,0 +1,16 @@
+# NAMES Replies
+RPL_NAMREPLY_CODE = '353'
+RPL_ENDOFNAMES_CODE = '366'
+RPL_ENDOFNAMES_MESSAGE = ':End of NAMES list'
+
+# WHO Replies
+RPL_WHOREPLY_CODE = '352'
+RPL_ENDOFWHO_CODE = '315'
+RPL_ENDOFWHO_MESSAGE = ':End of WHO list'
+
+# LIST Replies
+RPL_LISTSTART_CODE = '321'
+RPL_LISTSTART_MESSAGE = 'Channel :Users  Name'
+RPL_LIST_CODE = '322'
+RPL_LISTEND_CODE = '323'
+RPL_LISTEND_MESSAGE = ':End of LIST'
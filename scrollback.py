@@ -0,0 +1,140 @@
+import constants
+
+"""
+Description:
+
+One message of the scrollback and its rows wrapped for the last width asked for.
+
+"""
+class ScrollbackEntry:
+    __slots__ = ('text', 'width', 'rows')
+
+    def __init__(self, text):
+        self.text = text
+        self.width = 0 # width `rows` were wrapped for, 0 before the first wrap
+        self.rows = None
+
+    # Rows of the message at `width` columns, wrapped again only after a resize
+    def wrap(self, width):
+        if width != self.width:
+            self.rows = [line[start:start + width] for line in self.text.split('\n') for start in range(0, len(line) or 1, width)]
+            self.width = width
+        return self.rows
+
+"""
+Description:
+
+Bounded message history of the client window. Messages live in a ring of
+`capacity` slots, numbered by a sequence that keeps growing, so the oldest one
+is overwritten once the ring is full and memory stays bounded. The viewport is
+anchored to the message shown on the bottom row and to how many of its rows
+are hidden below it; while `following`, the anchor is the newest message.
+Rendering walks up from the anchor and wraps only the messages it shows, so
+its cost depends on the screen height, never on the history size, and a resize
+wraps messages again only when they become visible.
+
+"""
+class Scrollback:
+    def __init__(self, capacity=constants.UI_SCROLLBACK_MESSAGES):
+        self.capacity = capacity
+        self.entries = [None] * capacity
+        self.total = 0 # messages appended so far, the next sequence number
+        self.anchor = None # sequence of the message on the bottom row, None to follow the newest one
+        self.hidden_rows = 0 # rows of the anchor message below the bottom row
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def oldest(self):
+        return self.total - len(self)
+
+    @property
+    def following(self):
+        return self.anchor is None
+
+    # Messages newer than the bottom row
+    def newer(self):
+        return 0 if self.anchor is None else self.total - 1 - self.anchor
+
+    def append(self, text):
+        self.entries[self.total % self.capacity] = ScrollbackEntry(text)
+        self.total += 1
+        # A viewport on a message that was overwritten moves to the oldest one left
+        if self.anchor is not None and self.anchor < self.oldest:
+            self.anchor, self.hidden_rows = self.oldest, 0
+
+    def __entry(self, sequence):
+        return self.entries[sequence % self.capacity]
+
+    # Rows of the viewport from top to bottom, at most `height`.
+    # A viewport near the oldest message is filled up with newer rows
+    def render(self, height, width):
+        lines = self.__rows_up(height, width)
+        sequence = self.anchor
+        if len(lines) < height and sequence is not None:
+            rows = self.__entry(sequence).wrap(width)
+            below = rows[len(rows) - self.hidden_rows:]
+            while len(below) < height - len(lines) and sequence < self.total - 1:
+                sequence += 1
+                below += self.__entry(sequence).wrap(width)
+            lines += below[:height - len(lines)]
+        return lines
+
+    # Rows ending at the bottom row, from top to bottom, at most `height`
+    def __rows_up(self, height, width):
+        if not self.total:
+            return []
+        sequence = self.total - 1 if self.anchor is None else self.anchor
+        rows = self.__entry(sequence).wrap(width)
+        visible = rows[:len(rows) - self.hidden_rows] if self.anchor is not None else rows
+        lines = list(reversed(visible[-height:]))
+        while len(lines) < height and sequence > self.oldest:
+            sequence -= 1
+            rows = self.__entry(sequence).wrap(width)
+            lines += reversed(rows[-(height - len(lines)):])
+        lines.reverse()
+        return lines
+
+    # Move the viewport `rows` rows up (older), or down (newer) when negative.
+    # Stops once the oldest row reaches the top of a `height` rows screen
+    def scroll(self, rows, height, width):
+        if not self.total:
+            return
+        sequence, hidden = (self.total - 1, 0) if self.anchor is None else (self.anchor, self.hidden_rows)
+        hidden += rows
+        while hidden < 0 and sequence < self.total - 1:
+            sequence += 1
+            hidden += len(self.__entry(sequence).wrap(width))
+        while hidden >= len(self.__entry(sequence).wrap(width)) and sequence > self.oldest:
+            hidden -= len(self.__entry(sequence).wrap(width))
+            sequence -= 1
+        hidden = max(0, min(hidden, len(self.__entry(sequence).wrap(width)) - 1))
+        if sequence == self.total - 1 and hidden == 0:
+            self.follow()
+            return
+        self.anchor, self.hidden_rows = sequence, hidden
+        shown = len(self.__rows_up(height, width))
+        if shown < height:
+            self.scroll(shown - height, height, width)
+
+    # One screen minus a row of context
+    def page_up(self, height, width):
+        self.scroll(max(1, height - 1), height, width)
+
+    def page_down(self, height, width):
+        self.scroll(-max(1, height - 1), height, width)
+
+    def follow(self):
+        self.anchor, self.hidden_rows = None, 0
+
+    # Bring the next older message containing `text` (case-insensitive) to the bottom row.
+    # Returns False when no older message matches, the viewport stays put then
+    def search(self, text):
+        text = text.casefold()
+        start = self.total - 1 if self.anchor is None else self.anchor - 1
+        for sequence in range(start, self.oldest - 1, -1):
+            if text in self.__entry(sequence).text.casefold():
+                self.anchor, self.hidden_rows = sequence, 0
+                return True
+        return False
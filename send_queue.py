@@ -0,0 +1,126 @@
+from collections import deque
+from itertools import islice
+
+import compression
+
+"""
+Description:
+
+Bounded outbound queue of a single connection.
+Responses are queued by reference and drained when the socket becomes writable,
+so one encoded broadcast is shared by every recipient queue. Several pending
+responses leave in a single sendmsg (writev) call.
+Once the queued bytes reach the high watermark the queue is marked as over the limit
+and it stays that way until it drains below the low watermark.
+The chunk deque only exists while something is queued, an idle connection keeps
+just the counters.
+On a compressed connection the chunks queued since the last write are replaced
+by their compressed form right before writing; `sealed` chunks at the front are
+sent as they are.
+
+"""
+class SendQueue:
+    MAX_BATCH_CHUNKS = 64 # iovec entries per sendmsg call, well below IOV_MAX
+
+    __slots__ = ('high_watermark', 'low_watermark', 'chunks', 'head_offset', 'queued_bytes', 'sent_bytes',
+                 'send_calls', 'dropped_messages', 'dropped_bytes', 'over_limit', 'sealed')
+
+    def __init__(self, high_watermark, low_watermark):
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.chunks = None # deque of queued chunks, None while empty
+        self.head_offset = 0 # bytes of the first chunk already sent
+        self.queued_bytes = 0
+        self.sent_bytes = 0
+        self.send_calls = 0
+        self.dropped_messages = 0
+        self.dropped_bytes = 0
+        self.over_limit = False
+        self.sealed = 0 # chunks at the front that are not compressed again
+
+    def __len__(self):
+        return self.queued_bytes
+
+    def __bool__(self):
+        return self.queued_bytes > 0
+
+    # Queue data. Returns False (and counts the drop) if the queue is over the limit
+    def push(self, data):
+        if self.over_limit:
+            self.dropped_messages += 1
+            self.dropped_bytes += len(data)
+            return False
+        if self.chunks is None:
+            self.chunks = deque()
+        self.chunks.append(data)
+        self.queued_bytes += len(data)
+        if self.queued_bytes >= self.high_watermark:
+            self.over_limit = True
+        return True
+
+    # Send the head of the queue, coalescing the following chunks into the same call.
+    # Returns the number of bytes written.
+    # BlockingIOError and connection errors propagate to the caller
+    def send(self, sock):
+        head = self.chunks[0]
+        if self.head_offset:
+            head = memoryview(head)[self.head_offset:]
+        if len(self.chunks) == 1 or not hasattr(sock, 'sendmsg'):
+            sent = sock.send(head)
+        else:
+            sent = sock.sendmsg([head, *islice(self.chunks, 1, self.MAX_BATCH_CHUNKS)])
+        self.send_calls += 1
+        self.__consume(sent)
+        return sent
+
+    # Send every queued chunk as it is, output queued before compression was enabled stays plain
+    def seal(self):
+        self.sealed = len(self.chunks) if self.chunks else 0
+
+    # Compress the chunks queued after the sealed ones into one sealed chunk.
+    # Returns the plain and the compressed size
+    def compress(self, compressor):
+        if not self.chunks or self.sealed == len(self.chunks):
+            return 0, 0
+        plain = b''.join(islice(self.chunks, self.sealed, None))
+        data = compression.compress(compressor, plain)
+        for _ in range(len(self.chunks) - self.sealed):
+            self.chunks.pop()
+        self.chunks.append(data)
+        self.sealed = len(self.chunks)
+        self.queued_bytes += len(data) - len(plain)
+        if self.over_limit and self.queued_bytes <= self.low_watermark:
+            self.over_limit = False
+        return len(plain), len(data)
+
+    # Every queued byte as one bytes object. The queue is left as it is
+    def pending(self):
+        if not self.chunks:
+            return b''
+        return b''.join([memoryview(self.chunks[0])[self.head_offset:], *islice(self.chunks, 1, None)])
+
+    def clear(self):
+        self.chunks = None
+        self.head_offset = 0
+        self.queued_bytes = 0
+        self.over_limit = False
+        self.sealed = 0
+
+    # Drop `sent` bytes from the front of the queue
+    def __consume(self, sent):
+        self.sent_bytes += sent
+        self.queued_bytes -= sent
+        while sent:
+            remaining = len(self.chunks[0]) - self.head_offset
+            if sent < remaining:
+                self.head_offset += sent
+                break
+            sent -= remaining
+            self.chunks.popleft()
+            self.head_offset = 0
+            if self.sealed:
+                self.sealed -= 1
+        if not self.queued_bytes:
+            self.chunks = None
+        if self.over_limit and self.queued_bytes <= self.low_watermark:
+            self.over_limit = False
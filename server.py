@@ -1,33 +1,82 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import os
+import signal
 import socket
-import select
+import stat
 import sys
+import time
 import logging
 import commands
+import compression
 import constants
 import errors
+import handoff
+import hmac
+from channel_replies import ChannelReplies
+from channels import ChannelIndex
+from collections import deque
+from flood import FloodGate
+from itertools import islice
+from framing import LineFramer
+from history import ChannelHistory, HistoryLog
+from log_pipeline import LogPipeline
+from message import Message
+from metrics import Metrics, MetricsEndpoint
+from network import Network
+from poller import Poller
+from send_queue import SendQueue
+from timer_wheel import TimerWheel
 from util_server import ServerUtil
+from worker_bus import BusClient, BusHub
 
 """
 Description:
 
-Client object encapsulation
+Client object encapsulation. Holds all per-connection state of the server apart
+from the poller registration and channel memberships. Slots instead of a __dict__
+and buffers that only exist while in use keep an idle connection small.
 
 """
 class Client:
-    def __init__(self, addr):
+    __slots__ = ('addr', 'nickname', 'username', 'server_name', 'link_initiated', 'framer', 'send_queue', 'requests',
+                 'scheduled', 'reading', 'flood', 'last_active', 'ping_sent', 'timer', 'compressor', 'password')
+
+    def __init__(self, addr, framer, send_queue=None, flood=None):
         self.addr = addr
         self.nickname = ''
         self.username = ''
+        self.server_name = '' # set once the connection is a server link
+        self.link_initiated = False # this side connected to the peer server
+        self.framer = framer # LineFramer
+        self.send_queue = send_queue # SendQueue, None when the asyncio transport buffers writes
+        self.requests = None # deque of received (request, received_at) pairs waiting for their turn, None while empty
+        self.scheduled = False # in the round-robin queue or waiting for a flood delay
+        self.reading = True
+        self.flood = flood # FloodGate, None when not rate limited
+        self.last_active = time.monotonic() # last time anything was received
+        self.ping_sent = 0 # time.monotonic() of the unanswered PING, 0 when none is pending
+        self.timer = None # registration or ping timeout Timer
+        self.compressor = None # zlib compressor of the output once the client negotiated compression
+        self.password = None # PASS received before SERVER, checked and dropped by the handshake
     
-    # Set nickname and username
+    # Set nickname, username or server name
     def register(self, property_value, property_type):
         if property_type == commands.NICKNAME:
             self.nickname = property_value
         if property_type == commands.USERNAME:
             self.username = property_value
+        if property_type == commands.SERVER:
+            self.server_name = property_value
+            self.flood = None # server links are not rate limited
     
     def registration_status(self):
         return self.nickname and self.username
+
+    def is_link(self):
+        return bool(self.server_name)
     
     def get_nickname(self):
         return self.nickname
@@ -38,6 +87,73 @@ class Client:
     def get_addr(self):
         return self.addr
 
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog='server.py', description='IRC Server')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--engine', choices=['select', 'asyncio'], default='select', help='event loop implementation')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes sharing the port with SO_REUSEPORT')
+    parser.add_argument('--server-name', help='name of this server in the network (default: irc.PORT.local)')
+    parser.add_argument('--link', action='append', default=list(), metavar='HOST:PORT', help='server to link with, can be repeated')
+    parser.add_argument('--link-password', metavar='SECRET', help='shared password of the server links, required to accept links from other servers')
+    parser.add_argument('--poller', choices=sorted(Poller.BACKENDS), default='default', help='I/O readiness backend of the select engine')
+    parser.add_argument('--sendq-high', type=int, default=256 * 1024, help='per-client queued bytes that mark a slow consumer')
+    parser.add_argument('--sendq-low', type=int, default=64 * 1024, help='queued bytes below which a slow consumer recovers')
+    parser.add_argument('--sendq-policy', choices=['drop', 'disconnect'], default='disconnect', help='what to do with messages for a slow consumer')
+    parser.add_argument('--log-level', choices=LogPipeline.LEVELS, default='INFO', help='per-message logs are DEBUG, SIGUSR1 toggles DEBUG at runtime')
+    parser.add_argument('--metrics', metavar='ADDRESS', help='serve Prometheus metrics on PORT, HOST:PORT or a Unix socket path')
+    parser.add_argument('--ping-interval', type=float, default=120, help='seconds of silence before a connection is sent PING, 0 disables PING')
+    parser.add_argument('--ping-timeout', type=float, default=60, help='seconds to wait for any reply to PING')
+    parser.add_argument('--registration-timeout', type=float, default=60, help='seconds to complete NICK/USER, 0 disables the limit')
+    parser.add_argument('--commands-per-turn', type=int, default=16, help='requests of one client processed before the next client gets its turn')
+    parser.add_argument('--flood-rate', type=float, default=0, help='requests per second of a client, 0 disables the limit')
+    parser.add_argument('--flood-burst', type=int, default=10, help='requests a client may send at once')
+    parser.add_argument('--flood-bytes', type=float, default=0, help='request bytes per second of a client, 0 disables the limit')
+    parser.add_argument('--flood-bytes-burst', type=int, default=4096, help='request bytes a client may send at once')
+    parser.add_argument('--flood-penalty', choices=['delay', 'drop', 'disconnect'], default='delay', help='what to do with requests over the flood limits')
+    parser.add_argument('--history-lines', type=int, default=0, help='channel messages replayed on JOIN and registration, 0 disables the history')
+    parser.add_argument('--history-dir', help='directory of the memory-mapped history log that survives restarts')
+    parser.add_argument('--handoff', metavar='PATH', help='Unix socket to take over a running server from and to hand over to the next one')
+    parser.add_argument('--compression-level', type=int, default=constants.COMPRESSION_LEVEL, help='zlib level for clients that negotiate compression, 0 does not offer it')
+    parsed = parser.parse_args(args)
+    if parsed.sendq_low > parsed.sendq_high:
+        parser.error('--sendq-low must not exceed --sendq-high')
+    if parsed.workers < 1:
+        parser.error('--workers must be at least 1')
+    if parsed.ping_interval < 0 or parsed.registration_timeout < 0:
+        parser.error('--ping-interval and --registration-timeout must not be negative')
+    if parsed.ping_timeout <= 0:
+        parser.error('--ping-timeout must be positive')
+    if parsed.commands_per_turn < 1:
+        parser.error('--commands-per-turn must be at least 1')
+    if parsed.flood_rate < 0 or parsed.flood_bytes < 0:
+        parser.error('--flood-rate and --flood-bytes must not be negative')
+    if parsed.flood_burst < 1:
+        parser.error('--flood-burst must be at least 1')
+    if parsed.flood_bytes_burst < constants.COMMAND_MAX_LENGTH:
+        parser.error(f'--flood-bytes-burst must fit a {constants.COMMAND_MAX_LENGTH} byte request')
+    if parsed.history_lines < 0:
+        parser.error('--history-lines must not be negative')
+    if parsed.history_lines * 2 * constants.COMMAND_MAX_LENGTH > parsed.sendq_high:
+        parser.error('--history-lines replays must fit in half of --sendq-high')
+    if parsed.history_dir is not None and not parsed.history_lines:
+        parser.error('--history-dir requires --history-lines')
+    if parsed.link and parsed.workers > 1:
+        parser.error('--link cannot be combined with --workers')
+    if not 0 <= parsed.compression_level <= 9:
+        parser.error('--compression-level must be between 0 and 9')
+    if parsed.handoff is not None and (parsed.workers > 1 or parsed.engine != 'select'):
+        parser.error('--handoff requires a single process with --engine select')
+    try:
+        parsed.link = [(host, int(port)) for host, port in (target.rsplit(':', 1) for target in parsed.link)]
+    except ValueError:
+        parser.error('--link expects HOST:PORT')
+    if parsed.metrics is not None and os.sep not in parsed.metrics:
+        host, _, port = parsed.metrics.rpartition(':')
+        if not port.isdigit():
+            parser.error('--metrics expects PORT, HOST:PORT or a Unix socket path')
+        parsed.metrics = (host or '127.0.0.1', int(port))
+    return parsed
+
 """
 Description:
 
@@ -47,39 +163,131 @@ IRC Server
 class Server:
     def __init__(self, args):
         self.host = '127.0.0.1'
-        self.port = self.__fetch_port(args)
+        args = parse_args(args)
+        self.port = args.port
+        self.backend = args.poller
+        self.sendq_high = args.sendq_high
+        self.sendq_low = args.sendq_low
+        self.sendq_policy = args.sendq_policy
+        self.workers = args.workers
+        self.worker_id = None # set in worker processes
+        self.bus = None # BusClient in worker processes
+        self.server_name = args.server_name or f'irc.{self.port}.local'
+        self.link_targets = args.link
+        self.link_password = args.link_password # required from links this server did not initiate
+        self.network = Network(self.server_name)
         self.socket = None
-        self.input_sources = list()
-        self.output_sources = list()
+        self.poller = None
+        self.handoff_path = args.handoff
+        self.handoff_socket = None # Unix socket a new server process connects to for taking over
+        self.handoff_peer = None # connection to the new server, kept open until this process exits
         self.clients = dict() # socket -> Client
-        self.nicknames = set()
-        self.buffer = dict() # socket -> message str
+        self.nicknames = dict() # casefolded nickname -> socket
+        self.channels = ChannelIndex() # casefolded channel -> local member sockets
+        self.replies = ChannelReplies(self.server_name, self.__describe_member) # cached NAMES/WHO/LIST replies
+        self.recv_scratch = bytearray(constants.RECV_BUFFER_SIZE) # receive buffer shared by every LineFramer
+        self.slow_consumers = set() # sockets to evict at the end of the loop iteration
+        self.queued_bytes = 0 # pending outbound bytes across all clients
+        self.flushing = list() # sockets whose send queue filled up since the last flush
+        self.commands_per_turn = args.commands_per_turn
+        self.flood_limits = (args.flood_rate, args.flood_burst, args.flood_bytes, args.flood_bytes_burst)
+        self.flood_penalty = args.flood_penalty
+        self.runnable = deque() # sockets with queued requests, in round-robin order
+        self.throttled = dict() # socket -> time.monotonic() at which its flood delay ends
+        self.wakeups = list() # heap of (time, sequence, socket) flood delay ends
+        self.wakeup_sequence = itertools.count()
+        self.ping_interval = args.ping_interval
+        self.ping_timeout = args.ping_timeout
+        self.registration_timeout = args.registration_timeout
+        self.timers = TimerWheel(constants.TIMER_WHEEL_TICK)
+        self.history = ChannelHistory(args.history_lines) if args.history_lines else None
+        self.history_dir = args.history_dir
+        self.deliveries = 0 # messages queued to recipients, drives log sampling
+        self.compression_level = args.compression_level
+        self.capabilities = (compression.CAPABILITY,) if args.compression_level else () # offered in CAP LS
+        self.log_level = args.log_level
+        self.log_pipeline = None
         self.logger = None
+        self.handlers = { # command -> handler of a request from a local client
+            commands.NICKNAME: self.__handle_nickname,
+            commands.USERNAME: self.__handle_username,
+            commands.BROADCAST: self.__handle_broadcast,
+            commands.NOTICE: self.__handle_broadcast,
+            commands.JOIN: self.__handle_join,
+            commands.PART: self.__handle_part,
+            commands.PING: self.__handle_ping,
+            commands.PONG: self.__handle_pong,
+            commands.NAMES: self.__handle_names,
+            commands.WHO: self.__handle_who,
+            commands.LIST: self.__handle_list,
+            commands.CAP: self.__handle_cap,
+            commands.PASS: self.__handle_pass,
+            commands.QUIT: self.__handle_quit,
+        }
+        self.metrics = Metrics(self.handlers)
+        self.latency_samples = list() # (command, received_at) of sampled requests until their output is written
+        self.latency_countdown = constants.METRICS_LATENCY_SAMPLE_RATE # requests until the next sample
+        self.metrics.add_gauge('connections', 'Open client and server link connections', lambda: len(self.clients))
+        self.metrics.add_gauge('outbound_queued_bytes', 'Bytes waiting to be written to connections', self._queued_bytes)
+        self.metrics_address = args.metrics
+        self.metrics_endpoint = None
     
-    def __fetch_port(self, args):
-        port = 6667
-        if len(args) != 0 and (len(args) != 2 or args[0] != '--port' or not args[1].isnumeric()):
-            print('Invalid argument list. Usage: server.py [--port PORT]')
-            sys.exit()
-        if len(args) == 2:
-            port = int(args[1])
-        return port
-
     def __init_logger(self):
-        logging.basicConfig(filename='log-server.log', filemode='w+', level=logging.DEBUG)
-        self.logger = logging.getLogger()
+        log_file = 'log-server.log' if self.worker_id is None else f'log-server-{self.worker_id}.log'
+        # Servers handing over to each other share the log, each one appends to it
+        self.log_pipeline = LogPipeline(log_file, self.log_level, 'a' if self.handoff_path is not None else 'w+')
+        self.logger = self.log_pipeline.start()
         self.logger.info('Logger is online')
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.__toggle_debug_logging)
+        # Exit through serve() so the queued log records get written
+        signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+
+    # SIGUSR1 switches between the configured log level and DEBUG
+    def __toggle_debug_logging(self, _signum, _frame):
+        level = self.log_level if self.log_pipeline.level == 'DEBUG' else 'DEBUG'
+        self.log_pipeline.set_level(level)
+        self.logger.warning(f'Log level set to {level}')
+
+    # Serve the metrics endpoint. Workers add their id to the port or to the socket path
+    def __start_metrics(self):
+        if self.metrics_address is None:
+            return
+        address = self.metrics_address
+        if self.worker_id is not None:
+            address = f'{address}.{self.worker_id}' if isinstance(address, str) else (address[0], address[1] + self.worker_id)
+        self.metrics_endpoint = MetricsEndpoint(address, self.metrics)
+        self.metrics_endpoint.start()
+        self.logger.info(f'Metrics are served on {address}')
+
+    def _queued_bytes(self):
+        return self.queued_bytes
+
+    # Reload the channel history from its log. Workers keep a log each
+    def __load_history(self):
+        if self.history_dir is None:
+            return
+        directory = self.history_dir if self.worker_id is None else os.path.join(self.history_dir, f'worker-{self.worker_id}')
+        started = time.perf_counter()
+        records = self.history.attach(HistoryLog(directory))
+        self.logger.info(f'Loaded {records} history lines of {len(self.history)} channels from "{directory}" in {time.perf_counter() - started:.3f} seconds')
 
     def __listen(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.workers > 1:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.socket.setblocking(0)
         self.socket.bind((self.host, self.port))
-        self.socket.listen()
+        self.socket.listen(socket.SOMAXCONN)
         self.logger.info(f'Server is listening on port {self.port}')
 
-    def __prepare_select(self):
-        self.input_sources.append(self.socket)
-        self.logger.info(f'Server is ready to accept messages from {len(self.input_sources)} sources')
+    def _prepare_io(self):
+        self.poller = Poller(self.backend)
+        self.poller.register(self.socket, Poller.READ)
+        if self.bus is not None:
+            self.poller.register(self.bus.socket, Poller.READ)
+        self.logger.info(f'Server is ready to accept connections using the "{self.backend}" I/O backend')
 
     def __get_client_addr(self, client_socket):
         return self.clients[client_socket].get_addr() if client_socket in self.clients else 'Address no longer available'
@@ -90,16 +298,53 @@ class Server:
     def __get_client_username(self, client_socket):
         return self.clients[client_socket].get_username() if client_socket in self.clients else ''
     
+    # Nickname, username and host of a channel member, as listed by NAMES and WHO
+    def __describe_member(self, client_socket):
+        client = self.clients[client_socket]
+        return client.nickname, client.username, client.addr[0]
+
     def __get_client_registration_status(self, client_socket):
         return self.clients[client_socket].registration_status() if client_socket in self.clients else False
 
+    # Client currently owns its nickname in the index
+    def __owns_nickname(self, client_socket):
+        nickname = self.__get_client_nickname(client_socket)
+        return bool(nickname) and self.nicknames.get(ServerUtil.casefold_nickname(nickname)) is client_socket
+
     def __remove_nickname(self, client_socket):
-        self.nicknames.discard(self.__get_client_nickname(client_socket))
+        nickname = self.__get_client_nickname(client_socket)
+        if self.__owns_nickname(client_socket):
+            del self.nicknames[ServerUtil.casefold_nickname(nickname)]
+            if self.bus is not None:
+                self.bus.release(nickname)
+
+    # Point the index at the client's new nickname in one step
+    def __index_nickname(self, client_socket, nickname):
+        old_nickname = self.__get_client_nickname(client_socket)
+        if ServerUtil.casefold_nickname(old_nickname) != ServerUtil.casefold_nickname(nickname):
+            self.__remove_nickname(client_socket)
+        self.nicknames[ServerUtil.casefold_nickname(nickname)] = client_socket
+        self.clients[client_socket].register(nickname, commands.NICKNAME)
+
+    # Check the local nicknames, then claim through the worker bus.
+    # A granted claim is already registered with the other workers
+    def __claim_nickname(self, client_socket, nickname):
+        owner = self.nicknames.get(ServerUtil.casefold_nickname(nickname))
+        # Client only changes the case of its own nickname
+        if owner is client_socket and nickname != self.__get_client_nickname(client_socket):
+            return True
+        if owner is not None or self.network.get_user(nickname) is not None:
+            return False
+        if self.bus is None:
+            return True
+        granted = self.bus.claim(nickname)
+        self.__deliver_relays() # relayed while waiting for the answer
+        return granted
 
     def __remove_dead_connections(self):
-        for client_socket in self.input_sources:
+        for client_socket in list(self.clients):
             if client_socket.fileno() == -1:
-                self.__close_client_connection(client_socket)
+                self._close_client_connection(client_socket)
     
     def __build_response(self, client_socket, response_message):
         nickname = self.__get_client_nickname(client_socket)
@@ -108,98 +353,516 @@ class Server:
         response = response.encode(constants.COMMAND_ENCODING)
         return response
 
-    def __accept_client_connection(self):
-        client_socket, client_addr = self.socket.accept()
-        client_socket.setblocking(0)
-        self.input_sources.append(client_socket)
-        self.output_sources.append(client_socket) # Remove IRC
-        self.clients[client_socket] = Client(client_addr)
-        self.buffer[client_socket] = ""
-        self.logger.info(f'Accepted new connection with address {self.__get_client_addr(client_socket)}')
+    # Accept every pending connection on the listening socket
+    def __accept_client_connections(self):
+        while True:
+            try:
+                client_socket, client_addr = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.logger.warning(f'Failed to accept connection: {e}')
+                return
+            client_socket.setblocking(0)
+            self.poller.register(client_socket, Poller.READ)
+            self._register_client(client_socket, client_addr, LineFramer(scratch=self.recv_scratch), SendQueue(self.sendq_high, self.sendq_low))
 
-    def __close_client_connection(self, client_socket):
+    # Track state of a new connection. `client_socket` is any hashable connection handle.
+    # Connections handed over by an old server are not logged one by one
+    def _register_client(self, client_socket, client_addr, framer, send_queue=None, accepted=True):
+        flood = FloodGate(*self.flood_limits, time.monotonic()) if self.flood_limits[0] or self.flood_limits[2] else None
+        self.clients[client_socket] = Client(client_addr, framer, send_queue, flood)
+        if accepted:
+            self.metrics.connections_accepted += 1
+            self.logger.info('Accepted new connection with address %s', self.__get_client_addr(client_socket))
+        self.__schedule_check(client_socket, self.registration_timeout or self.ping_interval)
+
+    # Drop state of a closed connection. Returns the client address
+    def _forget_client(self, client_socket):
         addr = self.__get_client_addr(client_socket)
-        self.input_sources.remove(client_socket)
-        self.output_sources.remove(client_socket)
+        self.__leave_channels(client_socket)
+        if client_socket in self.network.links:
+            self.__close_link(client_socket, 'Link closed')
+        elif self.__owns_nickname(client_socket):
+            self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{self.__get_client_nickname(client_socket)} {commands.QUIT} {constants.COMMAND_MESSAGE_DELIM}Connection closed')
         self.__remove_nickname(client_socket)
-        self.clients.pop(client_socket, 'OK')
-        self.buffer.pop(client_socket, 'OK')
+        client = self.clients.pop(client_socket, None)
+        if client is not None and client.timer is not None:
+            self.timers.cancel(client.timer)
+        self.slow_consumers.discard(client_socket)
+        self.throttled.pop(client_socket, None)
+        return addr
+
+    # Close a connection. With `flush`, queued output gets one non-blocking write attempt first
+    def _close_client_connection(self, client_socket, flush=False):
+        self.poller.unregister(client_socket)
+        client = self.clients.get(client_socket)
+        addr = self._forget_client(client_socket)
+        send_queue = client.send_queue if client is not None else None
+        if send_queue is not None:
+            if flush and client.compressor is not None:
+                self.__compress_output(client)
+            self.queued_bytes -= send_queue.queued_bytes
+            try:
+                while flush and send_queue:
+                    send_queue.send(client_socket)
+            except OSError:
+                pass
         client_socket.close()
-        self.logger.info(f'Closed client connection with address {addr}')
+        self.logger.info('Closed client connection with address %s', addr)
     
-    # Register message in the buffer
-    def __register_request(self, client_socket, request):
-        self.buffer[client_socket] += request
-        self.logger.info(f'Received request {repr(request)} from client with address {self.__get_client_addr(client_socket)}')
+    # Queue response for the client and count it
+    def _send(self, client_socket, response):
+        self.metrics.messages_sent += 1
+        self.metrics.sent_bytes += len(response)
+        self._queue(client_socket, response)
+
+    # Queue response for the client. It is written at the end of the loop iteration,
+    # write interest is only requested for output the socket does not take right away
+    def _queue(self, client_socket, response):
+        client = self.clients.get(client_socket)
+        if client is None or client_socket in self.slow_consumers:
+            return
+        send_queue = client.send_queue
+        was_empty = not send_queue
+        if not send_queue.push(response):
+            self._handle_slow_consumer(client_socket, send_queue.queued_bytes)
+            return
+        self.queued_bytes += len(response)
+        if was_empty:
+            self.flushing.append(client_socket)
+
+    # Client stayed above the send queue high watermark
+    def _handle_slow_consumer(self, client_socket, queued_bytes):
+        if self.sendq_policy == 'drop':
+            self.metrics.dropped_messages += 1
+            self.logger.warning(f'Dropped message for slow client {self.__get_client_addr(client_socket)} with {queued_bytes} queued bytes')
+        else:
+            self.slow_consumers.add(client_socket)
+            self.logger.warning(f'Evicting slow client {self.__get_client_addr(client_socket)} with {queued_bytes} queued bytes')
+
+    # Close slow consumers outside of any fan-out loop
+    def __evict_slow_consumers(self):
+        for client_socket in list(self.slow_consumers):
+            self.metrics.evictions += 1
+            self._close_client_connection(client_socket)
+
+    # Write as much pending output as the socket accepts, wait for it to become writable for the rest
+    def __flush_outbound(self, client_socket):
+        client = self.clients[client_socket]
+        send_queue = client.send_queue
+        if client.compressor is not None:
+            self.__compress_output(client)
+        try:
+            while send_queue:
+                self.queued_bytes -= send_queue.send(client_socket)
+        except (BlockingIOError, InterruptedError):
+            self.poller.want_write(client_socket, True)
+            return
+        except OSError as e:
+            self.logger.warning(f'Client connection error {e}. Closing connection from __flush_outbound__')
+            self._close_client_connection(client_socket)
+            return
+        self.poller.want_write(client_socket, False)
+
+    # Write the output queued for sockets that had none pending, once per loop iteration
+    def __flush_queued(self):
+        flushing, self.flushing = self.flushing, list()
+        for client_socket in flushing:
+            client = self.clients.get(client_socket)
+            if client is not None and client.send_queue:
+                self.__flush_outbound(client_socket)
+
+    # Split received data into complete requests
+    def __register_request(self, client_socket, received):
+        framer = self.clients[client_socket].framer
+        truncated_lines = framer.truncated_lines
+        requests = framer.lines()
+        self.logger.debug('Received %d bytes with %d complete requests from client with address %s', received, len(requests), self.__get_client_addr(client_socket))
+        if framer.truncated_lines != truncated_lines:
+            self.logger.warning(f'Truncated request longer than {constants.COMMAND_MAX_LENGTH} bytes from client with address {self.__get_client_addr(client_socket)}')
+        return requests
     
-    # Handle broadcast request
-    def __handle_broadcast(self, client_socket, request):
-        response_message = ServerUtil.get_broadcast_message(request)
+    # Queue the same encoded response for every local member of the channel except the sender.
+    # Counted once for the whole fan-out rather than per recipient. `keep` records it in the history
+    def __fan_out(self, channel, response, sender=None, keep=False):
+        if keep and self.history is not None:
+            self.history.record(channel, response)
+        members = self.channels.members(channel)
+        self.logger.debug('Sending broadcast %r to %d members of channel "%s"', response, len(members), channel)
+        for channel_member in members:
+            if channel_member is not sender:
+                self._queue(channel_member, response)
+        recipients = len(members) - (sender in members)
+        metrics = self.metrics
+        metrics.messages_sent += recipients
+        metrics.sent_bytes += recipients * len(response)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.__log_sampled_deliveries(members, response)
+        self.deliveries += len(members)
+
+    # Per-recipient DEBUG logs for one delivery out of LOG_DELIVERY_SAMPLE_RATE
+    def __log_sampled_deliveries(self, recipients, response):
+        sample_rate = constants.LOG_DELIVERY_SAMPLE_RATE
+        for recipient in islice(recipients, -self.deliveries % sample_rate, None, sample_rate):
+            self.logger.debug('Sampled delivery of %r to the client address %s', response, self.__get_client_addr(recipient))
+
+    # Deliver a channel line to the local members, the other workers and the linked servers
+    def __publish(self, channel, line, sender=None, keep=False):
+        response = f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING)
+        self.__fan_out(channel, response, sender, keep)
+        if self.bus is not None:
+            self.bus.relay(channel, response)
+        self.__forward_to_links(line)
+
+    # Deliver a line to the client or link a nickname is reached through.
+    # Returns False if the nickname is unknown on this server and its links
+    def __deliver_direct(self, nickname, line, source=None):
+        target = self.nicknames.get(ServerUtil.casefold_nickname(nickname))
+        if target is None:
+            target = self.network.link_of_user(nickname)
+        if target is None:
+            return False
+        if target is not source:
+            self.logger.debug('Sending direct message %r to the client address %s', line, self.__get_client_addr(target))
+            self._send(target, f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+        return True
+
+    # Deliver lines relayed by the other workers to channel members or a single nickname
+    def __deliver_relays(self):
+        for target, line in self.bus.take_pending():
+            if ServerUtil.is_channel(target):
+                self.__fan_out(target, f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING), keep=self.__is_history_line(target, line))
+            else:
+                self.__deliver_direct(target, line)
+
+    # Channel messages are kept in the history, JOIN and PART announcements are not.
+    # Lines to the global channel carry no command
+    def __is_history_line(self, channel, line):
+        return self.history is not None and (channel == constants.GLOBAL_CHANNEL or line.split(' ', 2)[1] in (commands.BROADCAST, commands.NOTICE))
+
+    # Queue the history of a channel to a client in a single write
+    def __replay_history(self, client_socket, channel):
+        if self.history is None:
+            return
+        lines = self.history.replay(channel)
+        if lines:
+            self.logger.debug('Replaying %d bytes of "%s" history to the client address %s', len(lines), channel, self.__get_client_addr(client_socket))
+            self.metrics.history_replays += 1
+            self._send(client_socket, lines)
+
+    # Registered clients are members of the global channel until they disconnect and get its history.
+    # PART #global is refused, so a registration is joined and counted once
+    def __join_global_channel(self, client_socket):
+        if self.__get_client_registration_status(client_socket) and not self.channels.is_member(client_socket, constants.GLOBAL_CHANNEL):
+            self.channels.join(client_socket, constants.GLOBAL_CHANNEL)
+            self.replies.join(constants.GLOBAL_CHANNEL, client_socket)
+            self.metrics.registrations += 1
+            self.__replay_history(client_socket, constants.GLOBAL_CHANNEL)
+
+    # Drop every membership of a closing client. Co-members see a PART for each
+    # named channel, which also reaches the members on other workers and servers
+    def __leave_channels(self, client_socket):
+        nickname = self.__get_client_nickname(client_socket)
+        for channel in self.channels.remove_member(client_socket):
+            self.replies.part(channel, client_socket)
+            if ServerUtil.casefold_channel(channel) != constants.GLOBAL_CHANNEL:
+                self.__publish(channel, f'{constants.COMMAND_PREFIX_DELIM}{nickname} {commands.PART} {channel}')
+
+    def _read_bus(self):
+        self.bus.read()
+        self.__deliver_relays()
+
+    # Handle PRIVMSG/NOTICE request. PRIVMSG to #global reaches every registered client
+    def __handle_broadcast(self, client_socket, message):
+        command, target, response_message = message.command, message.param(0), message.param(1)
         client_nickname = self.__get_client_nickname(client_socket)
         client_username = self.__get_client_username(client_socket)
-        
+
+        # No recipient
+        if not target:
+            self.logger.warning(f'{command} request without a recipient. Responding with "411 ERR_NORECIPIENT"')
+            response_message = f'{errors.ERR_NORECIPIENT_CODE} {errors.ERR_NORECIPIENT_MESSAGE} ({command})'
+        # No text
+        elif message.param_count() < 2:
+            self.logger.warning(f'{command} request without text. Responding with "412 ERR_NOTEXTTOSEND"')
+            response_message = f'{errors.ERR_NOTEXTTOSEND_CODE} {errors.ERR_NOTEXTTOSEND_MESSAGE}'
+        # Named channel or nickname
+        elif ServerUtil.casefold_channel(target) != constants.GLOBAL_CHANNEL or command == commands.NOTICE:
+            if ServerUtil.is_channel(target):
+                self.__handle_channel_message(client_socket, command, target, response_message)
+            else:
+                self.__handle_direct_message(client_socket, command, target, response_message)
+            return
         # No registered Nickname
-        if client_nickname not in self.nicknames or not client_nickname:
+        elif not self.__owns_nickname(client_socket):
             self.logger.warning(f'Client broadcast denided, no such NICK. Responding with "401 ERR_NOSUCHNICK"')
             response_message = f'{errors.ERR_NOSUCHNICK_CODE} {client_nickname} {errors.ERR_NOSUCHNICK_MESSAGE}'
         # No registered Username
         elif not client_username:
             self.logger.warning(f'Client broadcast denided, no such USER. Responding with "404 ERR_CANNOTSENDTOCHAN"')
             response_message = f'{errors.ERR_CANNOTSENDTOCHAN_CODE} {constants.GLOBAL_CHANNEL} {errors.ERR_CANNOTSENDTOCHAN_MESSAGE}'
-        # Execute broadcast
+        # Execute broadcast. The sender is a member of the global channel and gets its echo
+        # from the same fan-out, so the response is encoded once for everybody
         else:
             response = self.__build_response(client_socket, response_message)
-            for channel_member in self.output_sources:
-                if channel_member != client_socket and self.__get_client_registration_status(channel_member):
-                    self.logger.info(f'Sending broadcast {repr(response)} to the client address {self.__get_client_addr(channel_member)}')
-                    channel_member.sendall(response)
+            self.__fan_out(constants.GLOBAL_CHANNEL, response, keep=True)
+            if self.bus is not None:
+                self.bus.relay(constants.GLOBAL_CHANNEL, response)
+            self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{client_nickname} {commands.BROADCAST} {constants.GLOBAL_CHANNEL} {constants.COMMAND_MESSAGE_DELIM}{response_message}')
+            return
+        # NOTICE never triggers an error reply
+        if command == commands.NOTICE:
+            return
         response = self.__build_response(client_socket, response_message)
-        self.logger.info(f'Sending broadcast {repr(response)} to the original sender {self.__get_client_addr(client_socket)}')
-        client_socket.sendall(response)
-        
+        self.logger.info('Sending broadcast error %r to the original sender %s', response, self.__get_client_addr(client_socket))
+        self._send(client_socket, response)
+
+    # Handle PRIVMSG/NOTICE to a nickname. NOTICE never triggers an error reply
+    def __handle_direct_message(self, client_socket, command, target, text):
+        nickname = self.__get_client_nickname(client_socket)
+        # Client did not finish NICK/USER registration
+        if not self.__get_client_registration_status(client_socket):
+            self.logger.warning(f'Direct message from unregistered client. Responding with "451 ERR_NOTREGISTERED"')
+            response_message = f'{errors.ERR_NOTREGISTERED_CODE} {errors.ERR_NOTREGISTERED_MESSAGE}'
+        else:
+            line = f'{constants.COMMAND_PREFIX_DELIM}{nickname} {command} {target} {constants.COMMAND_MESSAGE_DELIM}{text}'
+            if self.__deliver_direct(target, line):
+                return
+            # Nickname may be registered on another worker, the bus drops it otherwise
+            if self.bus is not None:
+                self.bus.direct(target, f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+                return
+            self.logger.warning(f'No such nickname "{target}". Responding with "401 ERR_NOSUCHNICK"')
+            response_message = f'{errors.ERR_NOSUCHNICK_CODE} {target} {errors.ERR_NOSUCHNICK_MESSAGE}'
+        if command != commands.NOTICE:
+            self._send(client_socket, self.__build_response(client_socket, response_message))
+
+    # Handle PRIVMSG/NOTICE to a named channel. Only members may send, the sender gets no echo
+    def __handle_channel_message(self, client_socket, command, channel, text):
+        nickname = self.__get_client_nickname(client_socket)
+        # Client did not finish NICK/USER registration
+        if not self.__get_client_registration_status(client_socket):
+            self.logger.warning(f'Channel message from unregistered client. Responding with "451 ERR_NOTREGISTERED"')
+            response_message = f'{errors.ERR_NOTREGISTERED_CODE} {errors.ERR_NOTREGISTERED_MESSAGE}'
+        # Client is not on the channel
+        elif not self.channels.is_member(client_socket, channel):
+            self.logger.warning(f'Client "{nickname}" is not on channel "{channel}". Responding with "404 ERR_CANNOTSENDTOCHAN"')
+            response_message = f'{errors.ERR_CANNOTSENDTOCHAN_CODE} {channel} {errors.ERR_CANNOTSENDTOCHAN_MESSAGE}'
+        # Deliver to the channel members, under the name the channel was created with
+        else:
+            channel = self.channels.name(channel)
+            self.__publish(channel, f'{constants.COMMAND_PREFIX_DELIM}{nickname} {command} {channel} {constants.COMMAND_MESSAGE_DELIM}{text}', client_socket, keep=True)
+            return
+        if command != commands.NOTICE:
+            self._send(client_socket, self.__build_response(client_socket, response_message))
+
+    # Channel requests need a registered client and a channel parameter. Sends the error reply otherwise
+    def __check_channel_request(self, client_socket, message):
+        # Client did not finish NICK/USER registration
+        if not self.__get_client_registration_status(client_socket):
+            self.logger.warning(f'{message.command} from unregistered client. Responding with "451 ERR_NOTREGISTERED"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NOTREGISTERED_CODE} {errors.ERR_NOTREGISTERED_MESSAGE}'))
+            return False
+        # No channel given
+        if not message.param(0):
+            self.logger.warning(f'{message.command} request without a channel. Responding with "461 ERR_NEEDMOREPARAMS"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NEEDMOREPARAMS_CODE} {message.command} {errors.ERR_NEEDMOREPARAMS_MESSAGE}'))
+            return False
+        return True
+
+    # Handle JOIN request with a comma separated channel list
+    def __handle_join(self, client_socket, message):
+        nickname = self.__get_client_nickname(client_socket)
+        if not self.__check_channel_request(client_socket, message):
+            return
+        for channel in message.param(0).split(constants.CHANNEL_LIST_DELIM):
+            # Invalid channel name
+            if not ServerUtil.is_channel(channel):
+                self.logger.warning(f'Invalid channel name "{channel}". Responding with "403 ERR_NOSUCHCHANNEL"')
+                self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NOSUCHCHANNEL_CODE} {channel} {errors.ERR_NOSUCHCHANNEL_MESSAGE}'))
+            # Joining replays the channel history, then announces the client to every member, itself included.
+            # Channel names are case-insensitive, the channel keeps the name it was created with
+            elif self.channels.join(client_socket, channel):
+                channel = self.channels.name(channel)
+                self.logger.debug('Client "%s" joined channel "%s" with %d local members', nickname, channel, len(self.channels.members(channel)))
+                self.replies.join(channel, client_socket)
+                self.__replay_history(client_socket, channel)
+                self.__publish(channel, f'{constants.COMMAND_PREFIX_DELIM}{nickname} {commands.JOIN} {channel}')
+
+    # Handle PART request with a comma separated channel list
+    def __handle_part(self, client_socket, message):
+        nickname = self.__get_client_nickname(client_socket)
+        # No channel given
+        if not message.param(0):
+            self.logger.warning(f'PART request without a channel. Responding with "461 ERR_NEEDMOREPARAMS"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NEEDMOREPARAMS_CODE} {commands.PART} {errors.ERR_NEEDMOREPARAMS_MESSAGE}'))
+            return
+        for channel in message.param(0).split(constants.CHANNEL_LIST_DELIM):
+            # The global channel cannot be left
+            if ServerUtil.casefold_channel(channel) == constants.GLOBAL_CHANNEL:
+                self.logger.warning(f'Client "{nickname}" tried to leave "{channel}". Responding with "437 ERR_UNAVAILRESOURCE"')
+                self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_UNAVAILRESOURCE_CODE} {channel} {errors.ERR_UNAVAILRESOURCE_MESSAGE}'))
+            # Channel has no local members
+            elif not self.channels.members(channel):
+                self.logger.warning(f'PART from unknown channel "{channel}". Responding with "403 ERR_NOSUCHCHANNEL"')
+                self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NOSUCHCHANNEL_CODE} {channel} {errors.ERR_NOSUCHCHANNEL_MESSAGE}'))
+            # Client is not on the channel
+            elif not self.channels.is_member(client_socket, channel):
+                self.logger.warning(f'Client "{nickname}" is not on channel "{channel}". Responding with "442 ERR_NOTONCHANNEL"')
+                self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NOTONCHANNEL_CODE} {channel} {errors.ERR_NOTONCHANNEL_MESSAGE}'))
+            # Parting is announced to every member, the client included
+            else:
+                channel = self.channels.name(channel)
+                self.logger.debug('Client "%s" left channel "%s"', nickname, channel)
+                self.__publish(channel, f'{constants.COMMAND_PREFIX_DELIM}{nickname} {commands.PART} {channel}')
+                self.channels.part(client_socket, channel)
+                self.replies.part(channel, client_socket)
+
+    # Handle NAMES request with a comma separated channel list. Lists the members on this server
+    def __handle_names(self, client_socket, message):
+        if not self.__check_channel_request(client_socket, message):
+            return
+        for channel in message.param(0).split(constants.CHANNEL_LIST_DELIM):
+            self.logger.debug('Sending NAMES of channel "%s" to the client address %s', channel, self.__get_client_addr(client_socket))
+            self._send(client_socket, self.replies.names_block(self.channels.name(channel), self.channels.members(channel)))
+
+    # Handle WHO request for a channel. Lists the members on this server
+    def __handle_who(self, client_socket, message):
+        if not self.__check_channel_request(client_socket, message):
+            return
+        channel = message.param(0)
+        self.logger.debug('Sending WHO of channel "%s" to the client address %s', channel, self.__get_client_addr(client_socket))
+        self._send(client_socket, self.replies.who_block(self.channels.name(channel), self.channels.members(channel)))
+
+    # Handle LIST request, optionally with a comma separated channel list
+    def __handle_list(self, client_socket, message):
+        if not self.__get_client_registration_status(client_socket):
+            self.logger.warning(f'LIST from unregistered client. Responding with "451 ERR_NOTREGISTERED"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NOTREGISTERED_CODE} {errors.ERR_NOTREGISTERED_MESSAGE}'))
+            return
+        names = message.param(0).split(constants.CHANNEL_LIST_DELIM) if message.param(0) else None
+        self.logger.debug('Sending LIST of %d channels to the client address %s', len(names or self.channels), self.__get_client_addr(client_socket))
+        self._send(client_socket, self.replies.list_reply(self.channels, names))
+
+    # Handle CAP capability negotiation. Accepted before and after registration, it never holds registration back
+    def __handle_cap(self, client_socket, message):
+        subcommand = message.param(0).upper()
+        target = self.__get_client_nickname(client_socket) or '*'
+        client = self.clients[client_socket]
+        if subcommand == commands.CAP_LS:
+            self.__send_cap(client_socket, target, commands.CAP_LS, ' '.join(self.capabilities))
+        elif subcommand == commands.CAP_LIST:
+            self.__send_cap(client_socket, target, commands.CAP_LIST, compression.CAPABILITY if client.compressor is not None else '')
+        elif subcommand == commands.CAP_REQ:
+            requested = message.param(1).split()
+            # Compression cannot be turned off again, a stream that started stays compressed
+            if not requested or any(capability not in self.capabilities for capability in requested):
+                self.logger.info('Refused capabilities "%s" of the client %s', message.param(1), self.__get_client_addr(client_socket))
+                self.__send_cap(client_socket, target, commands.CAP_NAK, message.param(1))
+                return
+            self.__send_cap(client_socket, target, commands.CAP_ACK, ' '.join(requested))
+            if client.compressor is None:
+                self.__enable_compression(client_socket, client)
+        elif subcommand != commands.CAP_END:
+            self.logger.warning(f'Unknown CAP subcommand "{subcommand}". Responding with "410 ERR_INVALIDCAPCMD"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_INVALIDCAPCMD_CODE} {target} {subcommand} {errors.ERR_INVALIDCAPCMD_MESSAGE}'))
+
+    def __send_cap(self, client_socket, target, subcommand, capabilities):
+        self.__send_line(client_socket, f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.CAP} {target} {subcommand} {constants.COMMAND_MESSAGE_DELIM}{capabilities}')
+
+    # Compress everything sent after the output queued so far, which ends with the CAP ACK
+    def __enable_compression(self, client_socket, client):
+        if client.send_queue is not None:
+            client.send_queue.seal()
+        client.compressor = compression.new_compressor(self.compression_level or constants.COMPRESSION_LEVEL)
+        self.logger.info('Compressing the output of the client %s', self.__get_client_addr(client_socket))
+
+    # Replace the output queued since the last write by its compressed form
+    def __compress_output(self, client):
+        plain_bytes, compressed_bytes = client.send_queue.compress(client.compressor)
+        self.queued_bytes += compressed_bytes - plain_bytes
+        self.metrics.compression_input_bytes += plain_bytes
+        self.metrics.compression_output_bytes += compressed_bytes
+
+    # Handle PASS request. Only server links use a password, SERVER checks it
+    def __handle_pass(self, client_socket, message):
+        client = self.clients[client_socket]
+        if not message.param(0):
+            self.logger.warning(f'PASS request without a password. Responding with "461 ERR_NEEDMOREPARAMS"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NEEDMOREPARAMS_CODE} {commands.PASS} {errors.ERR_NEEDMOREPARAMS_MESSAGE}'))
+        elif client.nickname or client.username:
+            self.logger.warning(f'PASS request after NICK/USER. Responding with "462 ERR_ALREADYREGISTRED"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_ALREADYREGISTRED_CODE} {errors.ERR_ALREADYREGISTRED_MESSAGE}'))
+        else:
+            client.password = message.param(0)
+
+    # Handle QUIT request. Closing forgets the client's channels in O(channels joined)
+    def __handle_quit(self, client_socket, message):
+        nickname = self.__get_client_nickname(client_socket) or self.__get_client_addr(client_socket)
+        reason = message.param(0) or constants.QUIT_REASON
+        self.logger.info('Client "%s" quit: %s', nickname, reason)
+        self.__send_line(client_socket, f'{commands.ERROR} {constants.COMMAND_MESSAGE_DELIM}Closing Link: {nickname} (Quit: {reason})')
+        self._close_client_connection(client_socket, flush=True)
+
+    # Answer PING with PONG carrying the same token
+    def __handle_ping(self, client_socket, message):
+        if not message.param(0):
+            self.logger.warning(f'PING request without an origin. Responding with "409 ERR_NOORIGIN"')
+            self._send(client_socket, self.__build_response(client_socket, f'{errors.ERR_NOORIGIN_CODE} {errors.ERR_NOORIGIN_MESSAGE}'))
+            return
+        self.__send_line(client_socket, f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.PONG} {self.server_name} {constants.COMMAND_MESSAGE_DELIM}{message.param(0)}')
+
+    # Any received data already counts as activity, see __check_connection
+    def __handle_pong(self, client_socket, message):
+        pass
+
     # Handle nickname request
-    def __handle_nickname(self, client_socket, request):
-        nickname = ServerUtil.get_nick_nickname(request)
+    def __handle_nickname(self, client_socket, message):
+        nickname = message.param(0)
         response_message = ''
         # No nickname provided
         if not nickname:
             self.logger.warning('Nickname parameter was not found. Responding with "431 ERR_NONICKNAMEGIVEN"')
             response_message = f'{errors.ERR_NONICKNAMEGIVEN_CODE} {errors.ERR_NONICKNAMEGIVEN_MESSAGE}'
-        # Nickname length is beyond 9 chars
-        elif len(nickname) > 9:
-            self.logger.warning(f'Nickname "{nickname}"" is too long. Responding with "432 ERR_ERRONEUSNICKNAME"')
+        # Nickname is longer than 9 chars, looks like a channel or carries characters of targets and prefixes
+        elif not ServerUtil.is_nickname(nickname):
+            self.logger.warning(f'Nickname "{nickname}" is invalid. Responding with "432 ERR_ERRONEUSNICKNAME"')
             response_message = f'{errors.ERR_ERRONEUSNICKNAME_CODE} {nickname} {errors.ERR_ERRONEUSNICKNAME_MESSAGE}'
-        # User is trying to change nickname to already taken one
-        elif nickname in self.nicknames and self.__get_client_nickname(client_socket):
-            self.logger.warning(f'Cannot change! Nickname "{nickname}" is already in use. Responding with "433 ERR_NICKNAMEINUSE"')
-            response_message = f'{errors.ERR_NICKNAMEINUSE_CODE} {nickname} {errors.ERR_NICKNAMEINUSE_MESSAGE}'
-        # User is trying to register nickanme to already taken one
-        elif nickname in self.nicknames:
-            self.logger.warning(f'Cannot register! Nickname "{nickname}" collision. Responding with "436 ERR_NICKCOLLISION"')
-            response_message = f'{errors.ERR_NICKCOLLISION_CODE} {nickname} {errors.ERR_NICKCOLLISION_MESSAGE}'
+        # Nickname is already taken
+        elif not self.__claim_nickname(client_socket, nickname):
+            # User is trying to change nickname to already taken one
+            if self.__get_client_nickname(client_socket):
+                self.logger.warning(f'Cannot change! Nickname "{nickname}" is already in use. Responding with "433 ERR_NICKNAMEINUSE"')
+                response_message = f'{errors.ERR_NICKNAMEINUSE_CODE} {nickname} {errors.ERR_NICKNAMEINUSE_MESSAGE}'
+            # User is trying to register nickanme to already taken one
+            else:
+                self.logger.warning(f'Cannot register! Nickname "{nickname}" collision. Responding with "436 ERR_NICKCOLLISION"')
+                response_message = f'{errors.ERR_NICKCOLLISION_CODE} {nickname} {errors.ERR_NICKCOLLISION_MESSAGE}'
         # Register nickname
         else:
             old_nickname = self.__get_client_nickname(client_socket)
             # Client changing nickname
             if old_nickname:
-                self.__remove_nickname(client_socket)
-                self.logger.info(f'Successfully changed "{old_nickname}" nickname to "{nickname}" for the client {self.__get_client_addr(client_socket)}')
+                self.logger.info('Successfully changed "%s" nickname to "%s" for the client %s', old_nickname, nickname, self.__get_client_addr(client_socket))
             # Client registering fresh nickname
             else:
-                self.logger.info(f'Successfully registered nickname "{nickname}" for the client {self.__get_client_addr(client_socket)}')
-            self.nicknames.add(nickname)
-            self.clients[client_socket].register(nickname, commands.NICKNAME)
+                self.logger.info('Successfully registered nickname "%s" for the client %s', nickname, self.__get_client_addr(client_socket))
+            self.__index_nickname(client_socket, nickname)
+            self.replies.rename(client_socket, self.channels.channels_of(client_socket))
+            self.__propagate_nickname(client_socket, old_nickname)
+            self.__join_global_channel(client_socket)
             return
         response = self.__build_response(client_socket, response_message)
-        self.logger.info(f'Sending NICK command result to the client {repr(response)}')
-        client_socket.sendall(response)
+        self.logger.info('Sending NICK command result to the client %r', response)
+        self._send(client_socket, response)
 
     # Handle username request
-    def __handle_username(self, client_socket, request):
+    def __handle_username(self, client_socket, message):
         response_message = ''
-        # Not valid paramters count
-        if not ServerUtil.user_valid_params(request):
-            self.logger.warning(f'USER request {repr(request)} does not have enough paramteres. Responsing with "461 ERR_NEEDMOREPARAMS"')
+        # Not valid paramters count: USER <username> <hostname> <servername> <realname>
+        if message.param_count() < 4:
+            self.logger.warning(f'USER request {repr(message.to_line())} does not have enough paramteres. Responsing with "461 ERR_NEEDMOREPARAMS"')
             response_message = f'{errors.ERR_NEEDMOREPARAMS_CODE} {commands.USERNAME} {errors.ERR_NEEDMOREPARAMS_MESSAGE}'
         # Client tries to repeat username registration
         elif self.__get_client_username(client_socket):
@@ -207,80 +870,895 @@ class Server:
             response_message = f'{errors.ERR_ALREADYREGISTRED_CODE} {errors.ERR_ALREADYREGISTRED_MESSAGE}'
         # Register username. No response sent to the client
         else:
-            username = ServerUtil.get_user_username(request)
+            username = message.param(0)
             self.clients[client_socket].register(username, commands.USERNAME)
-            self.logger.info(f'Successfully registered username "{username}" for the client {self.__get_client_addr(client_socket)}')
+            self.logger.info('Successfully registered username "%s" for the client %s', username, self.__get_client_addr(client_socket))
+            self.__join_global_channel(client_socket)
+            if self.__get_client_nickname(client_socket):
+                self.__forward_to_links(self.__user_introduction(self.__get_client_nickname(client_socket), username))
             return
         response = self.__build_response(client_socket, response_message)
-        self.logger.info(f'Sending USER command result to the client {repr(response)}')
-        client_socket.sendall(response) 
-
-    # Process request in buffer
-    def __process_request(self, client_socket, buffered_request):
-        if constants.COMMAND_END_DELIM not in buffered_request:
-            self.logger.info(f'Request "{buffered_request}" does not contain CR-LF termination. Postponing processing!')
-            return
-
-        # Get request from buffer
-        request, request_delim = ServerUtil.get_request_from_buffer(buffered_request)
-        self.buffer[client_socket] = buffered_request[request_delim:] # update buffer
-
-        # Request processing
-        self.logger.info(f'Processing request {repr(request)} from client with address {self.__get_client_addr(client_socket)}')
-        command_type = ServerUtil.get_command_type(request)
-        if command_type == commands.NICKNAME:
-            self.__handle_nickname(client_socket, request)
-        elif command_type == commands.USERNAME:
-            self.__handle_username(client_socket, request)
+        self.logger.info('Sending USER command result to the client %r', response)
+        self._send(client_socket, response)
+
+    # Encode a line once and queue it on every link except the one it came from
+    def __forward_to_links(self, line, source=None):
+        if not self.network.links:
+            return
+        data = f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING)
+        for link_socket in self.network.links:
+            if link_socket is not source:
+                self._send(link_socket, data)
+
+    def __send_line(self, client_socket, line):
+        self._send(client_socket, f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+
+    def __user_introduction(self, nickname, username):
+        return f'{constants.COMMAND_PREFIX_DELIM}{nickname} {commands.USERNAME} {username} * * {constants.COMMAND_MESSAGE_DELIM}{username}'
+
+    # Tell the other servers about a local nickname registration or change
+    def __propagate_nickname(self, client_socket, old_nickname):
+        nickname = self.__get_client_nickname(client_socket)
+        if old_nickname:
+            self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{old_nickname} {commands.NICKNAME} {nickname}')
+            return
+        self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.NICKNAME} {nickname} 1')
+        username = self.__get_client_username(client_socket)
+        if username:
+            self.__forward_to_links(self.__user_introduction(nickname, username))
+
+    # Connect to the servers given with --link
+    def _connect_links(self):
+        for host, port in self.link_targets:
+            try:
+                link_socket = socket.create_connection((host, port), timeout=5)
+            except OSError as e:
+                self.logger.warning(f'Failed to link with server {host}:{port}: {e}')
+                continue
+            link_socket.setblocking(0)
+            self.poller.register(link_socket, Poller.READ)
+            self._register_client(link_socket, (host, port), LineFramer(scratch=self.recv_scratch), SendQueue(self.sendq_high, self.sendq_low))
+            self._start_link(link_socket)
+
+    # Open the SERVER handshake on a connection this server initiated
+    def _start_link(self, link_socket):
+        self.clients[link_socket].link_initiated = True
+        self.__introduce_network(link_socket)
+
+    # PASS and SERVER handshake followed by a burst of every known server and user
+    def __introduce_network(self, link_socket):
+        if self.link_password is not None:
+            self.__send_line(link_socket, f'{commands.PASS} {constants.COMMAND_MESSAGE_DELIM}{self.link_password}')
+        self.__send_line(link_socket, f'{commands.SERVER} {self.server_name} 1 {constants.COMMAND_MESSAGE_DELIM}{constants.SERVER_INFO}')
+        for server in self.network.servers.values():
+            if server.link is not link_socket:
+                self.__send_line(link_socket, f'{constants.COMMAND_PREFIX_DELIM}{server.uplink} {commands.SERVER} {server.name} {server.hopcount + 1} {constants.COMMAND_MESSAGE_DELIM}{server.info}')
+        for client_socket in self.nicknames.values():
+            client = self.clients[client_socket]
+            self.__send_line(link_socket, f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.NICKNAME} {client.nickname} 1')
+            if client.username:
+                self.__send_line(link_socket, self.__user_introduction(client.nickname, client.username))
+        for user in self.network.users.values():
+            if self.network.link_of_user(user.nickname) is not link_socket:
+                self.__send_line(link_socket, f'{constants.COMMAND_PREFIX_DELIM}{user.server_name} {commands.NICKNAME} {user.nickname} {user.hopcount + 1}')
+                if user.username:
+                    self.__send_line(link_socket, self.__user_introduction(user.nickname, user.username))
+
+    # Forget everything behind a closed link and tell the rest of the network
+    def __close_link(self, link_socket, reason):
+        name, removed_nicknames = self.network.remove_link(link_socket)
+        if name is None:
+            return
+        self.logger.warning(f'Link with server "{name}" closed ({reason}). Removed {len(removed_nicknames)} remote users')
+        self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.SQUIT} {name} {constants.COMMAND_MESSAGE_DELIM}{reason}', link_socket)
+
+    # Remove a nickname from the whole network (local client or remote user)
+    def __kill_nickname(self, nickname, reason, source=None):
+        local_client = self.nicknames.get(ServerUtil.casefold_nickname(nickname))
+        if local_client is not None:
+            self.__send_line(local_client, f'{errors.ERR_NICKCOLLISION_CODE} {nickname} {errors.ERR_NICKCOLLISION_MESSAGE}')
+            self.__close_with_error(local_client, reason)
+        elif self.network.remove_user(nickname) is None and source is not None:
+            return
+        self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.KILL} {nickname} {constants.COMMAND_MESSAGE_DELIM}{reason}', source)
+
+    def __nickname_in_use(self, nickname):
+        return ServerUtil.casefold_nickname(nickname) in self.nicknames or self.network.get_user(nickname) is not None
+
+    # Links this server initiated are trusted. Any other link has to send --link-password in PASS
+    # first, without one configured no inbound link is accepted. The password is dropped once checked
+    def __link_permitted(self, client):
+        password, client.password = client.password, None
+        if client.link_initiated:
+            return True
+        return self.link_password is not None and password is not None and hmac.compare_digest(password.encode(constants.COMMAND_ENCODING), self.link_password.encode(constants.COMMAND_ENCODING))
+
+    # SERVER from a connection that is not a link yet. A client that sent NICK or USER never becomes one
+    def __accept_link(self, link_socket, params):
+        client = self.clients[link_socket]
+        if client.nickname or client.username:
+            self.logger.warning(f'Refused SERVER from the registered client {self.__get_client_addr(link_socket)}')
+            self.__close_with_error(link_socket, constants.LINK_REFUSED_REASON)
+            return
+        if not self.__link_permitted(client):
+            if self.link_password is None:
+                self.logger.warning(f'Refused link from {self.__get_client_addr(link_socket)}: inbound links need --link-password')
+            else:
+                self.logger.warning(f'Refused link from {self.__get_client_addr(link_socket)}: missing or wrong link password')
+            self.__close_with_error(link_socket, constants.LINK_REFUSED_REASON)
+            return
+        if len(params) < 2 or not params[1].isdigit():
+            self.logger.warning(f'Invalid SERVER handshake {params} from {self.__get_client_addr(link_socket)}')
+            self._close_client_connection(link_socket)
+            return
+        name, hopcount, info = params[0], int(params[1]), params[2] if len(params) > 2 else ''
+        # A known name means the new link would close a loop in the spanning tree
+        if self.network.has_server(name):
+            self.logger.warning(f'Rejected link with server "{name}": already part of the network')
+            self._close_client_connection(link_socket)
+            return
+        self.network.add_link(link_socket, name, hopcount, info)
+        self.clients[link_socket].register(name, commands.SERVER)
+        self.logger.info(f'Linked with server "{name}" at {self.__get_client_addr(link_socket)}')
+        if not self.clients[link_socket].link_initiated:
+            self.__introduce_network(link_socket)
+        self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.SERVER} {name} {hopcount + 1} {constants.COMMAND_MESSAGE_DELIM}{info}', link_socket)
+
+    # Server introduced by a linked server
+    def __handle_remote_server(self, link_socket, prefix, params):
+        if len(params) < 2 or not params[1].isdigit():
+            return
+        name, hopcount, info = params[0], int(params[1]), params[2] if len(params) > 2 else ''
+        if self.network.has_server(name):
+            self.logger.warning(f'Server "{name}" introduced twice, closing the link to break the loop')
+            self._close_client_connection(link_socket)
+            return
+        self.network.add_server(name, hopcount, info, link_socket, prefix or self.network.links[link_socket])
+        self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{prefix} {commands.SERVER} {name} {hopcount + 1} {constants.COMMAND_MESSAGE_DELIM}{info}', link_socket)
+
+    # Remote user introduction (prefix is a server) or nickname change (prefix is a nickname)
+    def __handle_remote_nickname(self, link_socket, prefix, params):
+        if not params:
+            return
+        nickname = params[0]
+        if self.network.has_server(prefix):
+            hopcount = int(params[1]) if len(params) > 1 and params[1].isdigit() else 1
+            if self.__nickname_in_use(nickname):
+                self.__kill_nickname(nickname, 'Nickname collision')
+                return
+            self.network.add_user(nickname, prefix, hopcount)
+            self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{prefix} {commands.NICKNAME} {nickname} {hopcount + 1}', link_socket)
+        elif self.network.get_user(prefix) is not None:
+            # Changing only the case of the own nickname is not a collision
+            if self.__nickname_in_use(nickname) and self.network.get_user(nickname) is not self.network.get_user(prefix):
+                self.__kill_nickname(nickname, 'Nickname collision')
+                self.__kill_nickname(prefix, 'Nickname collision')
+                return
+            self.network.rename_user(prefix, nickname)
+            self.__forward_to_links(f'{constants.COMMAND_PREFIX_DELIM}{prefix} {commands.NICKNAME} {nickname}', link_socket)
+
+    # Process a request received over a server link
+    def __process_link_request(self, link_socket, message, request):
+        prefix, command, params = message.prefix, message.command, message.arguments()
+        if not self.clients[link_socket].is_link():
+            if command == commands.SERVER:
+                self.__accept_link(link_socket, params)
+            # The server this one connected to refused the link
+            elif command == commands.ERROR:
+                self.logger.warning(f'Link with {self.__get_client_addr(link_socket)} refused: {params[-1] if params else request}')
+                self._close_client_connection(link_socket)
+        elif command == commands.SERVER:
+            self.__handle_remote_server(link_socket, prefix, params)
+        elif command == commands.NICKNAME:
+            self.__handle_remote_nickname(link_socket, prefix, params)
+        elif command == commands.USERNAME:
+            if self.network.get_user(prefix) is not None and params:
+                self.network.get_user(prefix).username = params[0]
+                self.__forward_to_links(request, link_socket)
+        elif command in (commands.BROADCAST, commands.NOTICE):
+            if self.network.get_user(prefix) is None or len(params) < 2:
+                return
+            # Messages to a nickname follow the path to its server only
+            if not ServerUtil.is_channel(params[0]):
+                self.__deliver_direct(params[0], request, link_socket)
+                return
+            if ServerUtil.casefold_channel(params[0]) == constants.GLOBAL_CHANNEL and command == commands.BROADCAST:
+                self.__fan_out(params[0], f'{constants.COMMAND_PREFIX_DELIM}{prefix} {params[-1]}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING), keep=True)
+            else:
+                self.__fan_out(params[0], f'{request}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING), keep=True)
+            self.__forward_to_links(request, link_socket)
+        elif command in (commands.JOIN, commands.PART):
+            if self.network.get_user(prefix) is not None and params:
+                self.__fan_out(params[0], f'{request}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+                self.__forward_to_links(request, link_socket)
+        elif command == commands.QUIT:
+            if self.network.remove_user(prefix) is not None:
+                self.__forward_to_links(request, link_socket)
+        elif command == commands.SQUIT:
+            if params and params[0] in self.network.servers and params[0] not in self.network.links.values():
+                removed_nicknames = self.network.remove_server(params[0])
+                self.logger.warning(f'Server "{params[0]}" left the network. Removed {len(removed_nicknames)} remote users')
+                self.__forward_to_links(request, link_socket)
+        elif command == commands.KILL:
+            if params:
+                self.__kill_nickname(params[0], params[-1], link_socket)
+        elif command == commands.PING:
+            self.__send_line(link_socket, f'{constants.COMMAND_PREFIX_DELIM}{self.server_name} {commands.PONG} {self.server_name} {constants.COMMAND_MESSAGE_DELIM}{params[-1] if params else self.server_name}')
+        elif command == commands.ERROR:
+            self.logger.warning(f'Link error from server "{self.clients[link_socket].server_name}": {request}')
+            self._close_client_connection(link_socket)
+
+    # Process a single complete request received at `received_at` (perf_counter_ns)
+    def __process_request(self, client_socket, request, received_at):
+        self.logger.debug('Processing request %r from client with address %s', request, self.__get_client_addr(client_socket))
+        message = Message.parse(request)
+        client = self.clients[client_socket]
+        if message.command == commands.SERVER or client.is_link() or client.link_initiated:
+            self.__process_link_request(client_socket, message, request)
+        elif message.command in self.handlers:
+            self.handlers[message.command](client_socket, message)
+            self.latency_countdown -= 1
+            if not self.latency_countdown:
+                self.latency_countdown = constants.METRICS_LATENCY_SAMPLE_RATE
+                self.latency_samples.append((message.command, received_at))
+        # Unknown command
+        elif message.command:
+            self.logger.warning(f'Unknown command "{message.command}". Responding with "421 ERR_UNKNOWNCOMMAND"')
+            response = self.__build_response(client_socket, f'{errors.ERR_UNKNOWNCOMMAND_CODE} {message.command} {errors.ERR_UNKNOWNCOMMAND_MESSAGE}')
+            self._send(client_socket, response)
+
+    # Record the latency of the sampled requests, called once their output was written
+    def _record_latency_samples(self):
+        now = time.perf_counter_ns()
+        command_latency = self.metrics.command_latency
+        for command, received_at in self.latency_samples:
+            command_latency[command].record(now - received_at)
+        self.latency_samples.clear()
+
+    # Queue every complete request received so far until the client gets its turn
+    def _process_received(self, client_socket, received):
+        received_at = time.perf_counter_ns()
+        try:
+            requests = self.__register_request(client_socket, received)
+        except Exception:
+            self.__close_on_error(client_socket)
+            return
+        self.metrics.received_bytes += received
+        self.metrics.messages_received += len(requests)
+        client = self.clients[client_socket]
+        client.last_active = time.monotonic()
+        if not requests:
+            return
+        if client.requests is None:
+            client.requests = deque()
+        client.requests.extend(zip(requests, itertools.repeat(received_at)))
+        if not client.scheduled:
+            client.scheduled = True
+            self.runnable.append(client_socket)
+            self._schedule_turn()
+
+    # Process queued requests in rounds of up to `commands_per_turn` requests of every runnable
+    # client until the queues are empty or TURN_REQUEST_BUDGET is used up. Polling only between
+    # budgets keeps output flushes coalesced. A client with requests left over is not read from
+    # until it caught up, so a flood backs up in its own TCP connection instead of in the server
+    def _run_turn(self):
+        if self.wakeups:
+            self.__release_throttled(time.monotonic())
+        budget = constants.TURN_REQUEST_BUDGET
+        while self.runnable and budget > 0:
+            for _ in range(len(self.runnable)):
+                client_socket = self.runnable.popleft()
+                client = self.clients.get(client_socket)
+                if client is None:
+                    continue
+                queued = len(client.requests)
+                self.__process_queued(client_socket, client)
+                budget -= queued - len(client.requests)
+                if client_socket not in self.clients:
+                    continue
+                if client_socket in self.throttled:
+                    self.__set_reading(client_socket, client, False)
+                elif client.requests:
+                    self.runnable.append(client_socket)
+                else:
+                    client.requests = None
+                    client.scheduled = False
+                    self.__set_reading(client_socket, client, True)
+        for client_socket in self.runnable:
+            client = self.clients.get(client_socket)
+            if client is not None:
+                self.__set_reading(client_socket, client, False)
+
+    # Process the queued requests of a client within its share of the turn and its flood limits.
+    # Links get all their requests processed. A closing client cannot wait for flood delays
+    def __process_queued(self, client_socket, client, closing=False):
+        requests = client.requests
+        limit = len(requests) if closing or client.is_link() else min(self.commands_per_turn, len(requests))
+        now = time.monotonic() if client.flood is not None else 0
+        for _ in range(limit):
+            request, received_at = requests[0]
+            if client.flood is not None:
+                wait = client.flood.admit(len(request) + len(constants.COMMAND_END_DELIM), now)
+                if wait:
+                    self.metrics.flood_penalties += 1
+                    if self.flood_penalty == 'delay' and not closing:
+                        self.logger.debug('Delaying requests of flooding client with address %s by %.3f seconds', self.__get_client_addr(client_socket), wait)
+                        self.__throttle(client_socket, now + wait)
+                        return
+                    if self.flood_penalty == 'disconnect':
+                        self.__disconnect_flooder(client_socket)
+                        return
+                    self.logger.debug('Dropping request %r of flooding client with address %s', request, self.__get_client_addr(client_socket))
+                    requests.popleft()
+                    continue
+            requests.popleft()
+            try:
+                self.__process_request(client_socket, request, received_at)
+            except Exception:
+                self.__close_on_error(client_socket)
+            if client_socket not in self.clients:
+                return
+
+    # Input that fails to be processed only costs the connection it came from
+    def __close_on_error(self, client_socket):
+        self.logger.exception('Error processing input from client with address %s. Closing connection', self.__get_client_addr(client_socket))
+        if client_socket in self.clients:
+            self._close_client_connection(client_socket)
+
+    # The client closed its side. Process what it sent before the connection goes away
+    def _finish_requests(self, client_socket):
+        client = self.clients.get(client_socket)
+        if client is not None and client.requests:
+            self.__process_queued(client_socket, client, closing=True)
+
+    def __set_reading(self, client_socket, client, enabled):
+        if client.reading != enabled:
+            client.reading = enabled
+            self._set_reading(client_socket, enabled)
+
+    # Keep a flooding client out of the round-robin until its flood delay ends
+    def __throttle(self, client_socket, wake_at):
+        self.throttled[client_socket] = wake_at
+        heapq.heappush(self.wakeups, (wake_at, next(self.wakeup_sequence), client_socket))
+        self._schedule_wakeup(wake_at - time.monotonic())
+
+    def __release_throttled(self, now):
+        while self.wakeups and self.wakeups[0][0] <= now:
+            wake_at, _sequence, client_socket = heapq.heappop(self.wakeups)
+            if self.throttled.get(client_socket) == wake_at:
+                del self.throttled[client_socket]
+                self.runnable.append(client_socket)
+
+    # Tell the client why, then close its connection
+    def __close_with_error(self, client_socket, reason):
+        nickname = self.__get_client_nickname(client_socket) or self.__get_client_addr(client_socket)
+        self.logger.warning(f'Closing connection of "{nickname}": {reason}')
+        self._send(client_socket, f'{commands.ERROR} {constants.COMMAND_MESSAGE_DELIM}Closing Link: {nickname} ({reason}){constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+        self._close_client_connection(client_socket, flush=True)
+
+    def __disconnect_flooder(self, client_socket):
+        self.__close_with_error(client_socket, constants.FLOOD_QUIT_REASON)
+
+    def __schedule_check(self, client_socket, delay):
+        if delay:
+            self.clients[client_socket].timer = self.timers.schedule(delay, self.__check_connection, client_socket)
+            self._arm_timers()
+
+    # Timer of a connection, first run after the registration timeout. Closes the connection if it
+    # did not register in time or did not answer PING. Traffic never touches the timer: a connection
+    # that was active since is only re-armed
+    def __check_connection(self, client_socket):
+        client = self.clients.get(client_socket)
+        if client is None:
+            return
+        client.timer = None
+        now = time.monotonic()
+        if self.registration_timeout and not (client.registration_status() or client.is_link()):
+            self.metrics.timeouts += 1
+            self.__close_with_error(client_socket, constants.REGISTRATION_TIMEOUT_REASON)
+        elif client.ping_sent:
+            if client.last_active > client.ping_sent:
+                client.ping_sent = 0
+                self.__schedule_check(client_socket, client.last_active + self.ping_interval - now)
+            else:
+                self.metrics.timeouts += 1
+                self.__close_with_error(client_socket, f'{constants.PING_TIMEOUT_REASON}: {round(now - client.ping_sent)} seconds')
+        elif self.ping_interval:
+            idle = now - client.last_active
+            if idle < self.ping_interval:
+                self.__schedule_check(client_socket, self.ping_interval - idle)
+            else:
+                client.ping_sent = now
+                self.__send_line(client_socket, f'{commands.PING} {constants.COMMAND_MESSAGE_DELIM}{self.server_name}')
+                self.__schedule_check(client_socket, self.ping_timeout)
+
+    # The select loop runs a turn after every poll
+    def _schedule_turn(self):
+        pass
+
+    # The select loop polls with a timeout that ends at the next flood delay or timer wheel tick
+    def _schedule_wakeup(self, delay):
+        pass
+
+    # The select loop advances the timer wheel every iteration, see __poll_timeout
+    def _arm_timers(self):
+        pass
+
+    def __poll_timeout(self):
+        if self.runnable or self.flushing:
+            return 0
+        now = time.monotonic()
+        timeout = self.timers.timeout(now)
+        if self.wakeups:
+            wakeup = max(0, self.wakeups[0][0] - now)
+            timeout = wakeup if timeout is None else min(timeout, wakeup)
+        return timeout
+
+    def _set_reading(self, client_socket, enabled):
+        self.poller.want_read(client_socket, enabled)
+
+    # Read from a client socket. Errors and EOF close the connection
+    def __read_client(self, client_socket):
+        client = self.clients.get(client_socket)
+        if client is None:
+            return
+        try:
+            received = client.framer.recv_into(client_socket)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.logger.warning(f'Client connection error {e}. Closing connection from __read_client__')
+            self._close_client_connection(client_socket)
+            return
+        if received:
+            self._process_received(client_socket, received)
         else:
-            self.__handle_broadcast(client_socket, request)
-        
+            self.logger.warning('Client disconnected. Closing connection from __read_client__')
+            self._finish_requests(client_socket)
+            if client_socket in self.clients:
+                self._close_client_connection(client_socket)
 
     # Main event loop
     def run(self):
         while True:
-            read_sockets, write_sockets, err_sockets = select.select(self.input_sources, self.output_sources, self.input_sources)
+            ready = self.poller.poll(self.__poll_timeout())
+            polled_at = time.perf_counter_ns()
+            writable = list()
+            for ready_socket, events in ready:
+                if ready_socket == self.socket:
+                    self.__accept_client_connections()
+                    continue
+                if self.bus is not None and ready_socket == self.bus.socket:
+                    self._read_bus()
+                    continue
+                if ready_socket == self.handoff_socket:
+                    self.__hand_off()
+                    continue
+
+                # Handle readable socket
+                if events & Poller.READ:
+                    self.__read_client(ready_socket)
+
+                # Writable sockets are flushed after the turn, with the responses it queued
+                if events & Poller.WRITE:
+                    writable.append(ready_socket)
+
+            self.timers.advance(time.monotonic())
+            if self.runnable or self.wakeups:
+                self._run_turn()
+            # Handle writable socket. Only registered while it has pending output
+            for ready_socket in writable:
+                if ready_socket in self.clients:
+                    self.__flush_outbound(ready_socket)
+            if self.flushing:
+                self.__flush_queued()
+            if self.latency_samples:
+                self._record_latency_samples()
+            if self.slow_consumers:
+                self.__evict_slow_consumers()
+            # Events that became ready meanwhile waited up to this long
+            self.metrics.event_loop_lag.record(time.perf_counter_ns() - polled_at)
 
-            # Handle read sockets
-            for read_socket in read_sockets:
-                if read_socket == self.socket:
-                    self.__accept_client_connection()
-                else:
-                    request = read_socket.recv(4096).decode(constants.COMMAND_ENCODING)
-                    if request:
-                        self.__register_request(read_socket, request)
-                    else:
-                        self.logger.warning('Client disconnected. Closing connection from __read_sockets__')
-                        self.__close_client_connection(read_socket)
-            
-            # Handle write sockets
-            for write_socket in write_sockets:
-                buffered_request = self.buffer[write_socket] if write_socket in self.buffer else ''
-                if buffered_request:
-                    self.__process_request(write_socket, buffered_request)
-            
-            # Handle error sockets
-            for err_socket in err_sockets:
-                self.logger.warning('Closing connection from __err_sockets__')
-                self.__close_client_connection(err_socket)
-            
     # Prepare server
     def coldstart(self):
         self.__init_logger()
-        self.__listen()
-        self.__prepare_select()
+        handed_over = self.__take_over()
+        self.__load_history()
+        if handed_over is None:
+            self.__listen()
+        self.__start_metrics()
+        self._prepare_io()
+        if handed_over is not None:
+            self.__restore_clients(*handed_over)
+        self.__listen_handoff()
+        self._connect_links()
+
+    # Connect to a running server and take its listening socket and client connections over.
+    # Returns the client states and descriptors, None when no server is running.
+    # Waits until the old server exited, so its ports and files are released
+    def __take_over(self):
+        if self.handoff_path is None:
+            return None
+        peer = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        peer.settimeout(constants.HANDOFF_TIMEOUT)
+        try:
+            peer.connect(self.handoff_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            peer.close()
+            return None
+        started = time.perf_counter()
+        with peer:
+            state, fds = handoff.receive_state(peer)
+            received = time.perf_counter() - started
+            handoff.wait_closed(peer)
+        self.socket = socket.socket(fileno=fds[0])
+        self.socket.setblocking(0)
+        self.port = self.socket.getsockname()[1]
+        self.logger.info(f'Took over the listening socket on port {self.port} and {len(fds) - 1} connections in {received:.3f} seconds, '
+                         f'the old server exited after {time.perf_counter() - started:.3f} seconds')
+        return state['clients'], fds[1:]
+
+    # Rebuild the client connections handed over by the old server. Their queued requests
+    # are processed in the first turn and their pending output is queued again
+    def __restore_clients(self, states, fds):
+        started = time.perf_counter()
+        received_at = time.perf_counter_ns()
+        for state, fd in zip(states, fds):
+            client_socket = socket.socket(fileno=fd)
+            client_socket.setblocking(0)
+            self.poller.register(client_socket, Poller.READ)
+            self._register_client(client_socket, tuple(state['addr']), LineFramer(scratch=self.recv_scratch), SendQueue(self.sendq_high, self.sendq_low), accepted=False)
+            client = self.clients[client_socket]
+            if state['nickname']:
+                self.__index_nickname(client_socket, state['nickname'])
+            if state['username']:
+                client.register(state['username'], commands.USERNAME)
+            for channel in state['channels']:
+                self.channels.join(client_socket, channel)
+                self.replies.join(channel, client_socket)
+            requests = state['requests'] + client.framer.feed(state['input'].encode('latin-1'))
+            if requests:
+                client.requests = deque(zip(requests, itertools.repeat(received_at)))
+                client.scheduled = True
+                self.runnable.append(client_socket)
+            if state['output']:
+                self._queue(client_socket, state['output'].encode('latin-1'))
+            # The deflate stream goes on with a new compressor, the received output is already compressed
+            if state['compressed']:
+                self.__enable_compression(client_socket, client)
+        self._schedule_turn()
+        self.logger.info(f'Restored {len(states)} client connections with {len(self.nicknames)} nicknames in {time.perf_counter() - started:.3f} seconds')
+
+    # Listen for the next server process taking over. Only processes of the same user are served
+    def __listen_handoff(self):
+        if self.handoff_path is None:
+            return
+        try:
+            if stat.S_ISSOCK(os.stat(self.handoff_path).st_mode):
+                os.unlink(self.handoff_path)
+        except FileNotFoundError:
+            pass
+        self.handoff_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.handoff_socket.bind(self.handoff_path)
+        os.chmod(self.handoff_path, 0o600)
+        self.handoff_socket.listen(1)
+        self.handoff_socket.setblocking(0)
+        self.poller.register(self.handoff_socket, Poller.READ)
+        self.logger.info(f'Waiting for a server to hand over to on "{self.handoff_path}"')
+
+    # Registration state and pending buffers of a client connection, as sent to the new server.
+    # Output of a compressed connection is sent compressed
+    def __client_state(self, client_socket):
+        client = self.clients[client_socket]
+        if client.compressor is not None:
+            self.__compress_output(client)
+        return {
+            'addr': client.addr,
+            'nickname': client.nickname,
+            'username': client.username,
+            'channels': list(self.channels.channels_of(client_socket)),
+            'requests': [request for request, _received_at in client.requests or ()],
+            'input': client.framer.pending().decode('latin-1'),
+            'output': client.send_queue.pending().decode('latin-1'),
+            'compressed': client.compressor is not None,
+        }
+
+    # Hand the listening socket and every client connection to a new server process, then exit.
+    # Server links are not handed over, the new server connects to its link targets again
+    def __hand_off(self):
+        try:
+            peer, _address = self.handoff_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        pid, uid = handoff.peer_credentials(peer)
+        if uid != os.getuid():
+            self.logger.warning(f'Refused to hand over to process {pid} of user {uid}')
+            peer.close()
+            return
+        started = time.perf_counter()
+        peer.settimeout(constants.HANDOFF_TIMEOUT)
+        client_sockets = [client_socket for client_socket, client in self.clients.items() if not client.is_link()]
+        state = {'clients': [self.__client_state(client_socket) for client_socket in client_sockets]}
+        try:
+            handoff.send_state(peer, state, [self.socket.fileno()] + [client_socket.fileno() for client_socket in client_sockets])
+        except OSError as e:
+            self.logger.warning(f'Hand over to process {pid} failed: {e}. Continuing to serve')
+            peer.close()
+            return
+        self.logger.info(f'Handed the listening socket and {len(client_sockets)} connections over to process {pid} in {time.perf_counter() - started:.3f} seconds')
+        # Exit without touching the connections. Closing `peer` on exit tells the new server
+        self.handoff_peer = peer
+        sys.exit(0)
     
     # Close resources
     def shutdown(self, e):
         self.logger.info(f'Shutting down with error name {type(e).__name__} and message {e}')
         self.__remove_dead_connections()
+        if self.poller is not None:
+            self.poller.close()
         if self.socket is not None:
             self.socket.close()
 
-if __name__ == "__main__":
-    server = Server(sys.argv[1:])
+"""
+Description:
+
+Connection of a single client in the asyncio engine.
+Received data goes straight into the connection LineFramer (BufferedProtocol),
+while the transport buffers writes and reports flow control through
+pause_writing/resume_writing.
+
+"""
+class ClientProtocol(asyncio.BufferedProtocol):
+    __slots__ = ('server', 'transport', 'framer', 'paused')
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.framer = LineFramer(scratch=server.recv_scratch)
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.server.sendq_high, low=self.server.sendq_low)
+        self.server._register_client(self, transport.get_extra_info('peername'), self.framer)
+
+    def get_buffer(self, sizehint):
+        return self.framer.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self.framer.commit(nbytes)
+        self.server._process_received(self, nbytes)
+
+    def connection_lost(self, exc):
+        if exc is None:
+            self.server._finish_requests(self)
+        self.server._close_client_connection(self)
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+
+"""
+Description:
+
+IRC Server running on asyncio.
+Shares request handling with Server, connections are ClientProtocol objects.
+
+"""
+class AsyncServer(Server):
+    def __init__(self, args):
+        super().__init__(args)
+        self.listener = None
+        self.bus_closed = None # fails once the worker bus is gone
+        self.loop = None
+        self.turn = None # pending call_soon handle of the next round-robin turn
+        self.deflating = dict() # protocol -> output of a compressed connection queued during this loop iteration
+        self.deflate = None # pending call_soon handle of __flush_compressed
+        self.ticking = None # pending call_later handle of __tick_timers, only while timers are pending
+
+    def _prepare_io(self):
+        self.logger.info('Server is ready to accept connections using the asyncio engine')
+
+    # Links are connected from the event loop, see __serve
+    def _connect_links(self):
+        pass
+
+    async def __connect_links(self, loop):
+        for host, port in self.link_targets:
+            try:
+                _transport, protocol = await loop.create_connection(lambda: ClientProtocol(self), host, port)
+            except OSError as e:
+                self.logger.warning(f'Failed to link with server {host}:{port}: {e}')
+                continue
+            self._start_link(protocol)
+
+    # Closing the transport always flushes what it buffered
+    def _close_client_connection(self, protocol, flush=False):
+        if protocol not in self.clients:
+            return
+        chunks = self.deflating.pop(protocol, None)
+        if chunks:
+            self.__write_compressed(protocol, chunks)
+        addr = self._forget_client(protocol)
+        protocol.transport.close()
+        self.logger.info('Closed client connection with address %s', addr)
+
+    # Write through the transport. A paused transport means the client is over the high watermark.
+    # Output of a compressed connection is collected and compressed once at the end of the loop iteration
+    def _queue(self, protocol, response):
+        client = self.clients.get(protocol)
+        if client is None or protocol in self.slow_consumers or protocol.transport.is_closing():
+            return
+        if protocol.paused:
+            self._handle_slow_consumer(protocol, protocol.transport.get_write_buffer_size())
+            if protocol in self.slow_consumers:
+                self.metrics.evictions += 1
+                protocol.transport.abort()
+            return
+        if client.compressor is None:
+            protocol.transport.write(response)
+            return
+        chunks = self.deflating.get(protocol)
+        if chunks is None:
+            chunks = self.deflating[protocol] = list()
+        chunks.append(response)
+        if self.deflate is None:
+            self.deflate = self.loop.call_soon(self.__flush_compressed)
+
+    def __flush_compressed(self):
+        self.deflate = None
+        deflating, self.deflating = self.deflating, dict()
+        for protocol, chunks in deflating.items():
+            self.__write_compressed(protocol, chunks)
+
+    def __write_compressed(self, protocol, chunks):
+        client = self.clients.get(protocol)
+        if client is None or protocol.transport.is_closing():
+            return
+        plain = b''.join(chunks)
+        data = compression.compress(client.compressor, plain)
+        self.metrics.compression_input_bytes += len(plain)
+        self.metrics.compression_output_bytes += len(data)
+        protocol.transport.write(data)
+
+    def _schedule_turn(self):
+        if self.turn is None:
+            self.turn = self.loop.call_soon(self.__turn)
+
+    def _schedule_wakeup(self, delay):
+        self.loop.call_later(max(0, delay), self._schedule_turn)
+
+    # Output is written by the transports during the turn, compressed output right after it
+    def __turn(self):
+        self.turn = None
+        self._run_turn()
+        if self.deflate is not None:
+            self.deflate.cancel()
+            self.__flush_compressed()
+        if self.latency_samples:
+            self._record_latency_samples()
+        if self.runnable:
+            self._schedule_turn()
+
+    # Requests of a closing connection are processed outside of a turn
+    def _finish_requests(self, protocol):
+        super()._finish_requests(protocol)
+        if self.latency_samples:
+            self._record_latency_samples()
+
+    def _set_reading(self, protocol, enabled):
+        if enabled:
+            protocol.transport.resume_reading()
+        else:
+            protocol.transport.pause_reading()
+
+    # Called from the metrics thread, the client table may change meanwhile
+    def _queued_bytes(self):
+        return sum(protocol.transport.get_write_buffer_size() for protocol in list(self.clients))
+
+    # Record how late a periodic callback runs, then schedule the next probe
+    def __probe_loop_lag(self, loop, scheduled_at):
+        self.metrics.event_loop_lag.record(max(0, int((loop.time() - scheduled_at) * 1000000000)))
+        scheduled_at = loop.time() + constants.METRICS_LAG_PROBE_INTERVAL
+        loop.call_at(scheduled_at, self.__probe_loop_lag, loop, scheduled_at)
+
+    # Wake up at the next timer wheel tick unless already armed
+    def _arm_timers(self):
+        if self.ticking is None:
+            self.ticking = self.loop.call_later(self.timers.timeout(time.monotonic()), self.__tick_timers)
+
+    # Advance the timer wheel once per tick while it has pending timers
+    def __tick_timers(self):
+        self.ticking = None
+        self.timers.advance(time.monotonic())
+        if len(self.timers):
+            self._arm_timers()
+
+    def __read_bus(self):
+        try:
+            self._read_bus()
+        except ConnectionError as e:
+            asyncio.get_running_loop().remove_reader(self.bus.socket)
+            self.bus_closed.set_exception(e)
+
+    async def __serve(self):
+        loop = self.loop = asyncio.get_running_loop()
+        self.listener = await loop.create_server(lambda: ClientProtocol(self), sock=self.socket)
+        if self.metrics_address is not None:
+            self.__probe_loop_lag(loop, loop.time())
+        await self.__connect_links(loop)
+        if self.bus is None:
+            await self.listener.serve_forever()
+            return
+        self.bus_closed = loop.create_future()
+        loop.add_reader(self.bus.socket, self.__read_bus)
+        await self.bus_closed
+
+    # Main event loop
+    def run(self):
+        asyncio.run(self.__serve())
+
+    # Close resources
+    def shutdown(self, e):
+        self.logger.info(f'Shutting down with error name {type(e).__name__} and message {e}')
+        if self.socket is not None:
+            self.socket.close()
+
+ENGINES = {
+    'select': Server,
+    'asyncio': AsyncServer,
+}
+
+def serve(server):
     try:
         server.coldstart()
         server.run()
     except Exception as e:
-        server.shutdown(e)
\ No newline at end of file
+        server.shutdown(e)
+    finally:
+        if server.metrics_endpoint is not None:
+            server.metrics_endpoint.stop()
+        if server.history is not None:
+            server.history.close()
+        if server.log_pipeline is not None:
+            server.log_pipeline.stop()
+        # The connections belong to the new server, which waits for this process to be gone
+        if server.handoff_peer is not None:
+            os._exit(0)
+
+# Fork worker processes that share the port, then run the bus between them in this process
+def run_workers(argv, engine, workers, log_level):
+    hub_sockets, worker_pids = list(), list()
+    for worker_id in range(workers):
+        hub_socket, worker_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        worker_pid = os.fork()
+        if worker_pid == 0:
+            for other_socket in hub_sockets + [hub_socket]:
+                other_socket.close()
+            server = ENGINES[engine](argv)
+            server.worker_id = worker_id
+            server.bus = BusClient(worker_socket)
+            serve(server)
+            os._exit(0)
+        worker_socket.close()
+        hub_sockets.append(hub_socket)
+        worker_pids.append(worker_pid)
+
+    log_pipeline = LogPipeline('log-server.log', log_level)
+    log_pipeline.start()
+    # Log level toggles apply to every worker
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda _signum, _frame: [os.kill(worker_pid, signal.SIGUSR1) for worker_pid in worker_pids])
+    BusHub(hub_sockets).run()
+    for _ in range(workers):
+        os.wait()
+    log_pipeline.stop()
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.workers > 1:
+        run_workers(sys.argv[1:], args.engine, args.workers, args.log_level)
+    else:
+        serve(ENGINES[args.engine](sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,42 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+# The modules live at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVER_PATH = os.path.join(ROOT, 'server.py')
+START_TIMEOUT = 5 # seconds
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+# Real server on a free port, once per engine. Logs go to the test directory.
+# Fails the test if the server exited before the end of it
+@pytest.fixture(params=['select', 'asyncio'])
+def server(request, tmp_path):
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, SERVER_PATH, '--port', str(port), '--engine', request.param],
+                            cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            break
+        except ConnectionRefusedError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                raise
+            time.sleep(0.05)
+    yield port
+    exited = proc.poll()
+    proc.terminate()
+    proc.wait()
+    assert exited is None, f'server exited with status {exited} during the test'
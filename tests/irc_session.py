@@ -0,0 +1,61 @@
+import socket
+
+import commands
+import constants
+from compression import InboundStream
+from framing import LineFramer
+
+"""
+Description:
+
+Client connection of the socket tests. Lines are read through the same
+InboundStream and LineFramer as irc_client.py, so a session that sent
+CAP REQ :zlib reads the compressed stream like the real client does.
+
+"""
+class Session:
+    TIMEOUT = 5 # seconds to wait for an expected line
+
+    def __init__(self, port):
+        self.socket = socket.create_connection(('127.0.0.1', port), timeout=self.TIMEOUT)
+        self.inbound = InboundStream()
+        self.framer = LineFramer()
+        self.lines = list() # received lines not read yet
+        self.closed = False
+
+    def send(self, *lines):
+        self.socket.sendall(''.join(f'{line}{constants.COMMAND_END_DELIM}' for line in lines).encode(constants.COMMAND_ENCODING))
+
+    # Next line from the server, None once it closed the connection
+    def read_line(self):
+        while not self.lines and not self.closed:
+            data = self.socket.recv(constants.RECV_BUFFER_SIZE)
+            if not data:
+                self.closed = True
+                break
+            self.lines += self.framer.feed(self.inbound.decode(data))
+        return self.lines.pop(0) if self.lines else None
+
+    # Read up to the first line containing `text` and return it
+    def expect(self, text):
+        while (line := self.read_line()) is not None:
+            if text in line:
+                return line
+        raise AssertionError(f'connection closed before a line containing {text!r}')
+
+    # Wait until the server processed everything sent so far. Returns the lines received meanwhile
+    def sync(self):
+        self.send(f'{commands.PING} :sync')
+        received = list()
+        while (line := self.read_line()) is not None:
+            if f' {commands.PONG} ' in line and line.endswith(':sync'):
+                return received
+            received.append(line)
+        raise AssertionError('connection closed before PONG')
+
+    def register(self, nickname):
+        self.send(f'{commands.NICKNAME} {nickname}', f'{commands.USERNAME} {nickname} 0 * :{nickname}')
+        self.sync()
+
+    def close(self):
+        self.socket.close()
@@ -0,0 +1,33 @@
+import json
+import os
+import string
+
+from message import Message
+
+"""
+Description:
+
+Expected parses of parse_corpus.jsonl and generators of random well-formed
+messages for the parser tests.
+
+"""
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parse_corpus.jsonl')
+WORD_CHARS = string.ascii_letters + string.digits + '#&[]\\`^{}|-_.!@*,:é✓'
+TEXT_CHARS = WORD_CHARS + ' :'
+
+def corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as lines:
+        return [json.loads(line) for line in lines]
+
+def word(rng, first_chars=WORD_CHARS):
+    return rng.choice(first_chars.replace(':', '')) + ''.join(rng.choice(WORD_CHARS) for _ in range(rng.randrange(12)))
+
+def random_message(rng):
+    prefix = word(rng) if rng.random() < 0.5 else ''
+    command = rng.choice(['PRIVMSG', 'NOTICE', 'NICK', 'USER', 'JOIN', 'PART', 'SERVER', '001', '433'])
+    params = [word(rng) for _ in range(rng.randrange(Message.MAX_PARAMS))]
+    trailing = ''.join(rng.choice(TEXT_CHARS) for _ in range(rng.randrange(40))) if rng.random() < 0.7 else None
+    return Message(prefix, command, params, trailing)
+
+def random_garbage(rng):
+    return ''.join(rng.choice(TEXT_CHARS + '\t\x00\x07') for _ in range(rng.randrange(80)))
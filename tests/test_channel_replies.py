@@ -0,0 +1,60 @@
+from channel_replies import ChannelReplies, MAX_LINE_BYTES
+from channels import ChannelIndex
+
+NICKNAMES = dict()
+
+def describe(member):
+    return NICKNAMES[member], f'user{member}', 'localhost'
+
+def setup_function():
+    NICKNAMES.clear()
+    NICKNAMES.update({member: f'nick{member}' for member in range(200)})
+
+def names(block):
+    lines = block.decode().split('\r\n')
+    return [name for line in lines if ' 353 ' in line for name in line.split(' :', 1)[1].split()]
+
+def test_names_are_patched_on_join_part_and_rename():
+    replies = ChannelReplies('irc.test', describe)
+    channels = ChannelIndex()
+    for member in range(3):
+        channels.join(member, '#Chat')
+    assert names(replies.names_block('#Chat', channels.members('#chat'))) == ['nick0', 'nick1', 'nick2']
+    channels.join(3, '#chat')
+    replies.join('#chat', 3)
+    channels.part(0, '#CHAT')
+    replies.part('#CHAT', 0)
+    NICKNAMES[1] = 'renamed'
+    replies.rename(1, channels.channels_of(1))
+    assert names(replies.names_block('#chat', channels.members('#chat'))) == ['renamed', 'nick2', 'nick3']
+
+def test_names_lines_stay_within_the_limit():
+    replies = ChannelReplies('irc.test', describe)
+    members = set(range(200))
+    block = replies.names_block('#big', members)
+    lines = block.split(b'\r\n')
+    assert all(len(line) <= MAX_LINE_BYTES for line in lines)
+    assert sorted(names(block)) == sorted(f'nick{member}' for member in members)
+
+def test_empty_channel_only_ends_the_reply():
+    replies = ChannelReplies('irc.test', describe)
+    assert replies.names_block('#none', ()) == b':irc.test 366 #none :End of NAMES list\r\n'
+
+def test_who_reply():
+    replies = ChannelReplies('irc.test', describe)
+    block = replies.who_block('#x', [7])
+    assert block == (b':irc.test 352 #x user7 localhost irc.test nick7 H :0 user7\r\n'
+                     b':irc.test 315 #x :End of WHO list\r\n')
+
+def test_list_reply_is_cached_until_a_change():
+    replies = ChannelReplies('irc.test', describe)
+    channels = ChannelIndex()
+    channels.join(1, '#A')
+    channels.join(2, '#a')
+    block = replies.list_reply(channels)
+    assert b' 322 #A 2 :\r\n' in block
+    assert replies.list_reply(channels) is block
+    channels.join(3, '#b')
+    replies.join('#b', 3)
+    assert b' 322 #b 1 :\r\n' in replies.list_reply(channels)
+    assert b'#b' not in replies.list_reply(channels, ['#a'])
@@ -0,0 +1,39 @@
+import zlib
+
+import compression
+from compression import InboundStream
+
+def compressed(*lines):
+    return compression.compress(compression.new_compressor(6), b''.join(lines))
+
+def test_plain_without_request():
+    inbound = InboundStream()
+    assert inbound.decode(b':a PRIVMSG b :x\r\n') == b':a PRIVMSG b :x\r\n'
+    assert not inbound.compressed
+
+def test_stream_turns_compressed_after_ack_in_the_same_read():
+    inbound = InboundStream()
+    inbound.expect_ack()
+    ack = b':irc.test CAP * ACK :zlib\r\n'
+    data = b':irc.test NOTICE * :plain\r\n' + ack + compressed(b':a PRIVMSG b :packed\r\n')
+    assert inbound.decode(data) == b':irc.test NOTICE * :plain\r\n' + ack + b':a PRIVMSG b :packed\r\n'
+    assert inbound.compressed and not inbound.awaiting_ack
+
+def test_ack_split_across_reads():
+    inbound = InboundStream()
+    inbound.expect_ack()
+    assert inbound.decode(b':irc.test CAP * A') == b':irc.test CAP * A'
+    assert not inbound.compressed
+    assert inbound.decode(b'CK :zlib\r\n' + compressed(b'PING :x\r\n')) == b'CK :zlib\r\nPING :x\r\n'
+
+def test_nak_stays_plain():
+    inbound = InboundStream()
+    inbound.expect_ack()
+    assert inbound.decode(b':irc.test CAP * NAK :zlib\r\nPING :x\r\n') == b':irc.test CAP * NAK :zlib\r\nPING :x\r\n'
+    assert not inbound.compressed and not inbound.awaiting_ack
+
+def test_sync_flush_decodes_every_batch():
+    compressor = compression.new_compressor(6)
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    for batch in (b'PING :1\r\n', b'PING :2\r\n' * 10):
+        assert inflater.decompress(compression.compress(compressor, batch)) == batch
@@ -0,0 +1,25 @@
+from flood import FloodGate, TokenBucket
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(2, 4, 0)
+    for _ in range(4):
+        assert bucket.take(1, 0) == 0
+    assert bucket.take(1, 0) == 0.5
+    assert bucket.take(1, 0.5) == 0
+
+def test_gate_admits_a_burst_then_waits():
+    gate = FloodGate(1, 3, 0, 0, 0)
+    assert [gate.admit(10, 0) for _ in range(3)] == [0, 0, 0]
+    assert gate.admit(10, 0) == 1
+    assert gate.admit(10, 1) == 0
+
+def test_byte_bucket_returns_the_message_token():
+    gate = FloodGate(10, 2, 100, 100, 0)
+    assert gate.admit(90, 0) == 0
+    assert gate.admit(90, 0) > 0
+    assert gate.messages.tokens == 1
+    assert gate.admit(5, 0) == 0
+
+def test_zero_rates_disable_the_limits():
+    gate = FloodGate(0, 0, 0, 0, 0)
+    assert all(gate.admit(10000, 0) == 0 for _ in range(1000))
@@ -0,0 +1,48 @@
+from framing import LineFramer
+
+def test_lines_split_across_reads():
+    framer = LineFramer()
+    assert framer.feed(b'NICK al') == []
+    assert framer.feed(b'ice\r\nUSER a') == ['NICK alice']
+    assert framer.pending() == b'USER a'
+    assert framer.feed(b' 0 * :A\r\n\r\nJOIN #x\r\n') == ['USER a 0 * :A', 'JOIN #x']
+    assert len(framer) == 0
+
+def test_delimiter_split_across_reads():
+    framer = LineFramer()
+    assert framer.feed(b'PING :x\r') == []
+    assert framer.feed(b'\n') == ['PING :x']
+
+def test_oversized_line_is_truncated():
+    framer = LineFramer()
+    lines = framer.feed(b'A' * 1000 + b'\r\nPING :x\r\n')
+    assert lines == ['A' * LineFramer.MAX_LINE_BYTES, 'PING :x']
+    assert framer.truncated_lines == 1
+
+def test_oversized_partial_line_is_dropped_until_its_end():
+    framer = LineFramer()
+    assert framer.feed(b'B' * 600) == ['B' * LineFramer.MAX_LINE_BYTES]
+    assert framer.feed(b'B' * 600) == []
+    assert framer.feed(b'B\r\nPING :y\r\n') == ['PING :y']
+def test_multibyte_character_split_across_reads():
+    framer = LineFramer()
+    data = 'PRIVMSG #x :héllo ✓\r\n'.encode()
+    split = data.index('✓'.encode()) + 1
+    assert framer.feed(data[:split]) == []
+    assert framer.feed(data[split:]) == ['PRIVMSG #x :héllo ✓']
+
+def test_shared_scratch_buffer():
+    scratch = bytearray(64)
+    first, second = LineFramer(64, scratch), LineFramer(64, scratch)
+    assert first.feed(b'PING :a\r\nPING') == ['PING :a']
+    assert first.data is not scratch
+    assert second.feed(b'PONG :b\r\n') == ['PONG :b']
+    assert second.data is None
+    assert first.feed(b' :c\r\n') == ['PING :c']
+    assert first.data is None
+
+def test_burst_of_empty_lines():
+    assert LineFramer().feed(b'\r\n' * 300) == []
+    scratch = bytearray(LineFramer.MAX_LINE_BYTES * 2)
+    framer = LineFramer(len(scratch), scratch)
+    assert framer.feed(b'\r\n' * 300 + b'PING :x\r\n') == ['PING :x']
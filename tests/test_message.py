@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+import parse_cases
+from message import Message
+
+SEED = 1
+CASES = 5000
+CORPUS = parse_cases.corpus()
+
+@pytest.mark.parametrize('case', CORPUS, ids=[case['line'] for case in CORPUS])
+def test_corpus(case):
+    expected = Message(case['prefix'], case['command'], case['params'], case['trailing'])
+    assert Message.parse(case['line']) == expected
+
+def test_round_trip():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        message = parse_cases.random_message(rng)
+        assert Message.parse(message.to_line()) == message
+
+def test_garbage_never_raises():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        parsed = Message.parse(parse_cases.random_garbage(rng))
+        assert parsed.param_count() <= Message.MAX_PARAMS + 1
+        assert parsed.command == parsed.command.upper()
+
+def test_params():
+    message = Message.parse(':alice PRIVMSG #chat :hello there')
+    assert message.prefix == 'alice'
+    assert message.param(0) == '#chat'
+    assert message.param(1) == 'hello there'
+    assert message.param(2) == ''
+    assert message.param_count() == 2
+    assert message.arguments() == ['#chat', 'hello there']
+
+def test_extra_params_join_the_last_one():
+    message = Message.parse('CMD ' + ' '.join(str(i) for i in range(20)))
+    assert len(message.params) == Message.MAX_PARAMS
+    assert message.params[-1] == ' '.join(str(i) for i in range(Message.MAX_PARAMS - 1, 20))
@@ -0,0 +1,44 @@
+from scrollback import Scrollback
+
+def filled(count, capacity=100):
+    scrollback = Scrollback(capacity)
+    for i in range(count):
+        scrollback.append(f'message {i}')
+    return scrollback
+
+def test_ring_keeps_the_newest_messages():
+    scrollback = filled(10, capacity=4)
+    assert len(scrollback) == 4
+    assert scrollback.oldest == 6
+    assert scrollback.render(10, 80) == [f'message {i}' for i in range(6, 10)]
+
+def test_long_messages_wrap():
+    scrollback = Scrollback(10)
+    scrollback.append('abcdefghij')
+    assert scrollback.render(5, 4) == ['abcd', 'efgh', 'ij']
+
+def test_page_up_and_follow():
+    scrollback = filled(20)
+    assert scrollback.render(5, 80)[-1] == 'message 19'
+    scrollback.page_up(5, 80)
+    assert not scrollback.following
+    assert scrollback.render(5, 80) == [f'message {i}' for i in range(11, 16)]
+    assert scrollback.newer() == 4
+    scrollback.append('message 20')
+    assert scrollback.render(5, 80)[-1] == 'message 15'
+    scrollback.page_down(5, 80)
+    scrollback.page_down(5, 80)
+    assert scrollback.following
+    assert scrollback.render(5, 80)[-1] == 'message 20'
+
+def test_scrolling_stops_at_the_oldest_message():
+    scrollback = filled(8)
+    scrollback.scroll(100, 5, 80)
+    assert scrollback.render(5, 80) == [f'message {i}' for i in range(5)]
+
+def test_search():
+    scrollback = filled(20)
+    assert scrollback.search('MESSAGE 3')
+    assert scrollback.render(1, 80) == ['message 3']
+    assert not scrollback.search('message 19')
+    assert scrollback.render(1, 80) == ['message 3']
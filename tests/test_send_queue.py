@@ -0,0 +1,72 @@
+import zlib
+
+import compression
+from send_queue import SendQueue
+
+class Socket:
+    def __init__(self, limit=None):
+        self.limit = limit # bytes accepted per call, None for everything
+        self.sent = bytearray()
+
+    def send(self, data):
+        return self.sendmsg([data])
+
+    def sendmsg(self, buffers):
+        data = b''.join(buffers)
+        if self.limit is not None:
+            data = data[:self.limit]
+        self.sent += data
+        return len(data)
+
+def test_watermarks():
+    queue = SendQueue(10, 4)
+    assert queue.push(b'x' * 6)
+    assert queue.push(b'y' * 6)
+    assert queue.over_limit
+    assert not queue.push(b'z')
+    assert (queue.dropped_messages, queue.dropped_bytes) == (1, 1)
+    socket = Socket(limit=7)
+    queue.send(socket)
+    assert queue.over_limit
+    queue.send(socket)
+    assert not queue.over_limit
+    assert bytes(socket.sent) == b'x' * 6 + b'y' * 6
+    assert not queue
+    assert queue.chunks is None
+
+def test_partial_writes_keep_the_order():
+    queue = SendQueue(1000, 100)
+    for chunk in (b'abc', b'defg', b'h'):
+        queue.push(chunk)
+    socket = Socket(limit=2)
+    while queue:
+        queue.send(socket)
+    assert bytes(socket.sent) == b'abcdefgh'
+    assert queue.sent_bytes == 8
+
+def test_compress_keeps_sealed_chunks_plain():
+    queue = SendQueue(1 << 20, 1 << 10)
+    queue.push(b':server CAP * ACK :zlib\r\n')
+    queue.seal()
+    lines = [f':alice PRIVMSG #chat :line {i}\r\n'.encode() for i in range(50)]
+    for line in lines:
+        queue.push(line)
+    plain, compressed = queue.compress(compression.new_compressor(6))
+    assert plain == sum(map(len, lines))
+    assert compressed == len(queue.chunks[-1]) < plain
+    assert queue.sealed == len(queue.chunks) == 2
+    assert queue.compress(compression.new_compressor(6)) == (0, 0)
+    socket = Socket()
+    while queue:
+        queue.send(socket)
+    ack = b':server CAP * ACK :zlib\r\n'
+    assert socket.sent.startswith(ack)
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    assert inflater.decompress(bytes(socket.sent[len(ack):])) == b''.join(lines)
+
+def test_compress_can_end_the_over_limit_state():
+    queue = SendQueue(100, 50)
+    queue.push(b'a' * 120)
+    assert queue.over_limit
+    queue.compress(compression.new_compressor(9))
+    assert not queue.over_limit
@@ -0,0 +1,88 @@
+from irc_session import Session
+
+"""
+Description:
+
+Requests against a real server over a socket, on every engine.
+
+"""
+def test_commands_are_case_insensitive(server):
+    alice = Session(server)
+    alice.send('nick alice', 'user alice 0 * :Alice')
+    alice.sync()
+    alice.send('join #chat')
+    assert alice.expect('JOIN') == ':alice JOIN #chat'
+
+def test_unknown_command(server):
+    alice = Session(server)
+    alice.register('alice')
+    alice.send('FOO bar')
+    assert alice.expect('421') == ':alice 421 FOO :Unknown command'
+
+def test_burst_of_empty_lines(server):
+    flooder = Session(server)
+    flooder.send(*[''] * 300)
+    flooder.register('flooder')
+    alice = Session(server)
+    alice.register('alice')
+
+def test_join_and_part_use_rfc1459_casemapping(server):
+    alice, bob = Session(server), Session(server)
+    alice.register('alice')
+    bob.register('bob')
+    alice.send('JOIN #Chat[a]')
+    assert alice.expect('JOIN') == ':alice JOIN #Chat[a]'
+    bob.send('JOIN #CHAT{A}')
+    assert bob.expect('JOIN') == ':bob JOIN #Chat[a]'
+    assert alice.expect('JOIN') == ':bob JOIN #Chat[a]'
+    alice.send('PRIVMSG #chat{a} :hello')
+    assert bob.expect('PRIVMSG') == ':alice PRIVMSG #Chat[a] :hello'
+    bob.send('PART #cHAT{a]')
+    assert bob.expect('PART') == ':bob PART #Chat[a]'
+    assert alice.expect('PART') == ':bob PART #Chat[a]'
+    alice.send('PRIVMSG #Chat[a] :gone')
+    assert not [line for line in bob.sync() if 'gone' in line]
+
+def test_quit(server):
+    alice, bob = Session(server), Session(server)
+    alice.register('alice')
+    bob.register('bob')
+    alice.send('QUIT :bye')
+    assert alice.expect('ERROR') == 'ERROR :Closing Link: alice (Quit: bye)'
+    assert alice.read_line() is None
+    bob.send('PRIVMSG alice :are you there')
+    assert bob.expect('401') == ':bob 401 alice :No such nick/channel'
+
+def test_direct_privmsg_and_notice(server):
+    alice, bob = Session(server), Session(server)
+    alice.register('Alice[')
+    bob.register('bob')
+    bob.send('PRIVMSG alice{ :direct', 'NOTICE ALICE[ :note')
+    assert alice.expect('PRIVMSG') == ':bob PRIVMSG alice{ :direct'
+    assert alice.expect('NOTICE') == ':bob NOTICE ALICE[ :note'
+    bob.send('PRIVMSG nobody :x')
+    assert bob.expect('401') == ':bob 401 nobody :No such nick/channel'
+
+def test_cap_zlib(server):
+    alice, bob = Session(server), Session(server)
+    alice.send('CAP LS')
+    assert alice.expect(' CAP ').endswith(' CAP * LS :zlib')
+    alice.inbound.expect_ack()
+    alice.send('CAP REQ :zlib')
+    assert alice.expect(' CAP ').endswith(' CAP * ACK :zlib')
+    alice.register('alice')
+    bob.register('bob')
+    text = 'compressed ' * 40
+    bob.send(f'PRIVMSG alice :{text}')
+    assert alice.expect('PRIVMSG') == f':bob PRIVMSG alice :{text}'
+    assert alice.inbound.compressed
+
+def test_inbound_link_needs_the_link_password(server):
+    intruder = Session(server)
+    intruder.send('PASS :guess', 'SERVER evil 1 :x')
+    assert intruder.expect('ERROR').endswith('(Link refused)')
+    assert intruder.read_line() is None
+    mallory = Session(server)
+    mallory.register('mallory')
+    mallory.send('SERVER evil 1 :x')
+    assert mallory.expect('ERROR') == 'ERROR :Closing Link: mallory (Link refused)'
@@ -0,0 +1,70 @@
+from timer_wheel import TimerWheel
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def wheel():
+    clock = Clock()
+    return TimerWheel(1, clock), clock
+
+def test_timers_run_in_order_once_expired():
+    timers, clock = wheel()
+    fired = list()
+    timers.schedule(3, fired.append, 'c')
+    timers.schedule(1, fired.append, 'a')
+    timers.schedule(2, fired.append, 'b')
+    assert len(timers) == 3
+    clock.now += 1.5
+    timers.advance(clock.now)
+    assert fired == ['a']
+    clock.now += 5
+    timers.advance(clock.now)
+    assert fired == ['a', 'b', 'c']
+    assert len(timers) == 0
+    assert timers.timeout(clock.now) is None
+
+def test_cancel():
+    timers, clock = wheel()
+    fired = list()
+    timer = timers.schedule(1, fired.append, 'x')
+    timers.cancel(timer)
+    timers.cancel(timer)
+    assert len(timers) == 0
+    clock.now += 2
+    timers.advance(clock.now)
+    assert fired == []
+
+def test_long_delays_cascade_down():
+    timers, clock = wheel()
+    fired = list()
+    for delay in (70, 5000, 300000):
+        timers.schedule(delay, fired.append, delay)
+    for delay in (70, 5000, 300000):
+        clock.now += delay - (clock.now - 1000) - 1
+        timers.advance(clock.now)
+        assert delay not in fired
+        clock.now += 1
+        timers.advance(clock.now)
+        assert fired[-1] == delay
+
+def test_timeout_is_the_next_tick():
+    timers, clock = wheel()
+    timers.schedule(10, lambda: None)
+    timers.advance(clock.now)
+    clock.now += 0.25
+    assert timers.timeout(clock.now) == 0.75
+
+def test_timer_scheduled_from_a_callback():
+    timers, clock = wheel()
+    fired = list()
+    timers.schedule(1, lambda: timers.schedule(1, fired.append, 'again'))
+    clock.now += 1
+    timers.advance(clock.now)
+    assert len(timers) == 1
+    clock.now += 1
+    timers.advance(clock.now)
+    assert fired == ['again']
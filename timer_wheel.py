@@ -0,0 +1,106 @@
+import math
+import time
+
+"""
+Description:
+
+Timer scheduled on a TimerWheel. `expires` is in wheel ticks.
+
+"""
+class Timer:
+    __slots__ = ('expires', 'callback', 'args', 'slot')
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.slot = None # set of the wheel slot holding the timer, None once run or cancelled
+
+"""
+Description:
+
+Hierarchical timer wheel. Level 0 has one slot per tick; every higher level has
+slots SLOTS times wider. A timer goes into the slot of the lowest level that
+covers its expiry time. When level 0 wraps around, the next slot of level 1 is
+redistributed to the lower levels, and so on. Scheduling and cancelling are O(1).
+Advancing one tick is O(1) plus the expired and cascaded timers, no matter how
+many timers are pending. Delays beyond the top level are clamped to its range.
+
+"""
+class TimerWheel:
+    BITS = 6
+    SLOTS = 1 << BITS
+    MASK = SLOTS - 1
+    LEVELS = 4 # 2^24 ticks
+
+    def __init__(self, tick, clock=time.monotonic):
+        self.tick = tick # seconds
+        self.clock = clock
+        self.ticks = int(clock() / tick) # next tick to process
+        self.levels = [[set() for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        self.pending = 0
+
+    def __len__(self):
+        return self.pending
+
+    def __insert(self, timer):
+        delta = timer.expires - self.ticks
+        if delta < 0:
+            slot = self.levels[0][self.ticks & self.MASK]
+        else:
+            if delta >= 1 << (self.BITS * self.LEVELS):
+                timer.expires = self.ticks + (1 << (self.BITS * self.LEVELS)) - 1
+            level = 0
+            while delta >= 1 << (self.BITS * (level + 1)) and level < self.LEVELS - 1:
+                level += 1
+            slot = self.levels[level][(timer.expires >> (self.BITS * level)) & self.MASK]
+        slot.add(timer)
+        timer.slot = slot
+
+    # Call `callback(*args)` at the first tick at least `delay` seconds from now
+    def schedule(self, delay, callback, *args):
+        timer = Timer(max(self.ticks, math.ceil((self.clock() + delay) / self.tick)), callback, args)
+        self.__insert(timer)
+        self.pending += 1
+        return timer
+
+    def cancel(self, timer):
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+            self.pending -= 1
+
+    # Move the timers of a higher level slot down. Returns the slot index
+    def __cascade(self, level):
+        index = (self.ticks >> (self.BITS * level)) & self.MASK
+        slots = self.levels[level]
+        timers, slots[index] = slots[index], set()
+        for timer in timers:
+            self.__insert(timer)
+        return index
+
+    # Run every timer that expired up to `now`. An empty wheel skips ahead at once
+    def advance(self, now):
+        target = int(now / self.tick)
+        if not self.pending:
+            self.ticks = max(self.ticks, target + 1)
+            return
+        while self.ticks <= target:
+            index = self.ticks & self.MASK
+            level = 1
+            while index == 0 and level < self.LEVELS:
+                index = self.__cascade(level)
+                level += 1
+            expired = self.levels[0][self.ticks & self.MASK]
+            self.ticks += 1
+            while expired:
+                timer = expired.pop()
+                timer.slot = None
+                self.pending -= 1
+                timer.callback(*timer.args)
+
+    # Seconds until the next tick is due, None without pending timers
+    def timeout(self, now):
+        if not self.pending:
+            return None
+        return max(0, self.ticks * self.tick - now)
@@ -1,5 +1,6 @@
+import string
+
 import constants
-import commands
 
 """
 Description:
@@ -8,44 +9,33 @@ Helper class that encapsulates utilities for the server that do not depend on a
 
 """
 class ServerUtil:
+    # RFC 1459 casemapping: {}|^ are the lower case forms of []\~
+    NICKNAME_CASEMAP = str.maketrans(string.ascii_uppercase + '[]\\~', string.ascii_lowercase + '{}|^')
 
-    # Get command type from any message
-    @staticmethod
-    def get_command_type(request):
-        request_split = request.split()
-        command_type = request_split[1] if constants.COMMAND_PREFIX_DELIM in request_split[0] else request_split[0]
-        return command_type
-
-    # Extract message from the PRIVMSG request
+    # Key of a nickname in case-insensitive lookups
     @staticmethod
-    def get_broadcast_message(request):
-        message = request[request.find(constants.COMMAND_MESSAGE_DELIM, 1) + 1:request.index(constants.COMMAND_END_DELIM)]
-        return message.strip()
+    def casefold_nickname(nickname):
+        return nickname.translate(ServerUtil.NICKNAME_CASEMAP)
 
-    # Extract message from the NICK request
+    # Key of a channel name in case-insensitive lookups, with the casemapping of nicknames
     @staticmethod
-    def get_nick_nickname(request):
-        nickname_index = request.index(commands.NICKNAME) + len(commands.NICKNAME)
-        nickname = request[nickname_index:request.find(' ', nickname_index + 1)]
-        return nickname.strip()
+    def casefold_channel(channel):
+        return channel.translate(ServerUtil.NICKNAME_CASEMAP)
 
-    # Extract message from the USER request
+    # Nicknames are at most 9 characters, never start like a channel name and carry no spaces, commas, *, ! or @
     @staticmethod
-    def get_user_username(request):
-        username_index = request.index(commands.USERNAME) + len(commands.USERNAME) # username start
-        username = request[username_index:request.find(' ', username_index + 1)]
-        return username.strip()
-
-    # Verify username message has enough params
+    def is_nickname(name):
+        return (
+            0 < len(name) <= constants.NICKNAME_MAX_LENGTH
+            and name[0] not in constants.CHANNEL_PREFIXES
+            and not any(char in name for char in constants.NICKNAME_INVALID_CHARS)
+        )
+
+    # Channel names start with # or & and carry no spaces, commas or BELL
     @staticmethod
-    def user_valid_params(request):
-        request_split = request.split()
-        return len(request_split) >= 5
-
-    # Get next request from the buffer
-    @staticmethod
-    def get_request_from_buffer(buffered_request):
-        request_delim = buffered_request.index(constants.COMMAND_END_DELIM) + len(constants.COMMAND_END_DELIM)
-        request = buffered_request[:request_delim]
-        return request, request_delim
-
+    def is_channel(name):
+        return (
+            1 < len(name) <= constants.CHANNEL_MAX_LENGTH
+            and name[0] in constants.CHANNEL_PREFIXES
+            and not any(char in name for char in ' ,\x07')
+        )
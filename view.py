@@ -8,14 +8,32 @@
 import asyncio
 import curses
 import logging
+import os
 import pathlib
+import queue
+import signal
+import sys
 
+import constants
 import patterns
+from scrollback import Scrollback
 
-logging.basicConfig(filename='view.log', filemode='w+', level=logging.DEBUG)
 logger = logging.getLogger()
 
 
+"""
+Description:
+
+Curses user interface. The asyncio loop wakes the view when stdin is readable,
+so it never polls. Messages are added from any thread: they are queued, and the
+loop thread writes them and redraws the terminal at most once per
+UI_FRAME_INTERVAL with a single doupdate(), however many arrived meanwhile.
+Curses is only ever called from the loop thread.
+Messages are kept in a bounded Scrollback and the message window only shows
+its viewport: PageUp and PageDown scroll, End follows new messages again and
+`/search text` jumps to the next older message containing the text.
+
+"""
 class View(patterns.Publisher):
 
     def __init__(self, **kwargs):
@@ -23,6 +41,15 @@ class View(patterns.Publisher):
         # Kwargs extraction
         self.input_text = list()
         self.title = kwargs.get('title', None)
+        self.loop = None
+        self.messages = queue.SimpleQueue() # lines waiting to be drawn
+        self.draw_requested = False # a draw is on its way, producers need not wake the loop
+        self.draw_handle = None
+        self.last_draw = 0
+        self.closed = None # future set when the view stops
+        self.scrollback = Scrollback()
+        self.search_text = '' # last searched text, repeated by a bare /search
+        self.status = '' # shown in the title bar
 
     def __enter__(self):
         self.stdscr = curses.initscr()
@@ -46,6 +73,8 @@ class View(patterns.Publisher):
         self._setup_title_win()
         self._setup_msg_win()
         self._setup_input_win()
+        self._welcome_banner()
+        self._render_messages()
         self.refresh()
         self._input_chrs = str() # Used to store intermediary inputs
         return self
@@ -62,20 +91,28 @@ class View(patterns.Publisher):
         self.title_win_dim = (1, self.width)
         self.title_win = curses.newwin(*self.title_win_dim, *self.title_win_begin)
         if self.title is None:
-            title = "COMP445 - IRC Client"
-        self.title = title.center(self.width-2)
+            self.title = "COMP445 - IRC Client"
         self.title_win.bkgd(curses.color_pair(2) | curses.A_BOLD)
-        self.title_win.addstr(self.title)
+        self._render_title()
         self.title_win.refresh()
 
+    # Title centered, the status on the right
+    def _render_title(self):
+        width = self.title_win_dim[1]
+        text = self.title.center(width - 2)
+        if self.status:
+            status = f' {self.status} '[:width - 2]
+            text = text[:width - 2 - len(status)] + status
+        self.title_win.erase()
+        self.title_win.addstr(0, 0, text)
+        self.title_win.noutrefresh()
+
     def _setup_msg_win(self):
         self.msg_win_begin = (1,0)
         self.msg_win_dim = (self.height - 2, self.width)
         self.msg_win = curses.newwin(*self.msg_win_dim, *self.msg_win_begin)
         self.msg_win.bkgd(curses.color_pair(1)|curses.A_ITALIC)
-        self.msg_win.scrollok(True)
         self.msg_win.refresh()
-        self._welcome_banner()
 
     def _welcome_banner(self):
         banner_file = pathlib.Path('banner.txt')
@@ -95,13 +132,16 @@ class View(patterns.Publisher):
         self.input_win = curses.newwin(*self.input_win_dim, *self.input_win_begin)
         self.input_win.bkgd(curses.color_pair(3))
         self.input_win.nodelay(True)
+        self.input_win.keypad(True) # PageUp, PageDown, End and resizes arrive as single keys
         self.input_win.refresh()
 
+    # Copy changed windows to the screen with one terminal update
     def refresh(self):
         if hasattr(self, 'msg_win'):
-            self.msg_win.refresh()
+            self.msg_win.noutrefresh()
         if hasattr(self, 'input_win'):
-            self.input_win.refresh()
+            self.input_win.noutrefresh()
+        curses.doupdate()
 
     def get_input(self) -> bytes:
         k = self.input_win.getstr()
@@ -111,22 +151,121 @@ class View(patterns.Publisher):
         self.refresh()
         return k
 
+    # Safe to call from any thread, the message is drawn by the loop thread
     def add_msg(self, user: str, msg: str):
-        self.put_msg(f"[{user}]: {msg}\n")
+        self.messages.put(f"[{user}]: {msg}")
+        if not self.draw_requested and self.loop is not None:
+            self.draw_requested = True
+            self.loop.call_soon_threadsafe(self._schedule_draw)
 
+    # Loop thread only. Drawn to the screen on the next draw
     def put_msg(self, msg):
-        self.msg_win.addstr(msg)
-        self.msg_win.refresh()
+        self.scrollback.append(msg.rstrip('\n'))
+
+    # Draw soon, from the loop thread
+    def _request_draw(self):
+        self.draw_requested = True
+        self._schedule_draw()
+
+    # Draw once the frame interval since the last draw has passed
+    def _schedule_draw(self):
+        if self.draw_handle is None:
+            delay = max(0, self.last_draw + constants.UI_FRAME_INTERVAL - self.loop.time())
+            self.draw_handle = self.loop.call_later(delay, self._draw)
+
+    # Move queued messages to the scrollback and update the terminal once
+    def _draw(self):
+        self.draw_handle = None
+        # Cleared before draining, so a message queued from now on requests another draw
+        self.draw_requested = False
+        while True:
+            try:
+                self.put_msg(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        # A failed search stays shown until the next key
+        if not self.status.startswith(constants.UI_SEARCH):
+            self.status = '' if self.scrollback.following else f'{self.scrollback.newer()} newer, End to follow'
+        self._render_title()
+        self._render_messages()
+        self.refresh()
+        self.last_draw = self.loop.time()
+
+    # Write the rows of the scrollback viewport, the cost depends on the window height only
+    def _render_messages(self):
+        height, width = self.msg_win.getmaxyx()
+        self.msg_win.erase()
+        for y, row in enumerate(self.scrollback.render(height, width)):
+            try:
+                self.msg_win.addstr(y, 0, row)
+            except curses.error:
+                # Writing the bottom-right cell moves the cursor out of the window
+                pass
+        self.msg_win.noutrefresh()
+
+    # Show the next older message containing `text`, or the last searched text again
+    def _search(self, text):
+        self.search_text = text or self.search_text
+        self.status = ''
+        if self.search_text and not self.scrollback.search(self.search_text):
+            self.status = f'{constants.UI_SEARCH} "{self.search_text}": no older match'
+        self._request_draw()
+
+    # SIGWINCH does not make stdin readable, so the new size is applied here instead of waiting for KEY_RESIZE
+    def _on_winch(self):
+        columns, lines = os.get_terminal_size(sys.stdin.fileno())
+        curses.resizeterm(lines, columns)
+        self._resize()
 
+    # Fit the windows to a new terminal size. Messages are wrapped again as they come into view
+    def _resize(self):
+        self.height, self.width = self.stdscr.getmaxyx()
+        if self.height < 3:
+            return
+        curses.update_lines_cols()
+        self.title_win_dim = (1, self.width)
+        self.msg_win_dim = (self.height - 2, self.width)
+        self.input_win_dim = (1, self.width)
+        self.input_win_begin = (self.height - 1, 0)
+        self.title_win.resize(*self.title_win_dim)
+        self.msg_win.resize(*self.msg_win_dim)
+        self.input_win.resize(*self.input_win_dim)
+        self.input_win.mvwin(*self.input_win_begin)
+        self.stdscr.clear()
+        self.stdscr.noutrefresh()
+        self._request_draw()
+
+    # Keys that move the viewport or follow a resize. Returns False for any other key
+    def _handle_key(self, ch):
+        height, width = self.msg_win.getmaxyx()
+        if ch == curses.KEY_PPAGE:
+            self.scrollback.page_up(height, width)
+        elif ch == curses.KEY_NPAGE:
+            self.scrollback.page_down(height, width)
+        elif ch == curses.KEY_END:
+            self.scrollback.follow()
+        elif ch == curses.KEY_RESIZE:
+            self._resize()
+        else:
+            return False
+        self.status = ''
+        self._request_draw()
+        return True
+
+    # Returns False once no more input is waiting
     def _input_getch(self):
         ch = self.input_win.getch()
         if ch == -1:
             # nothing inputed
-            return
+            return False
         logger.debug(f"Character int: {ch}")
+        if self._handle_key(ch):
+            return True
+        if ch == curses.KEY_BACKSPACE:
+            ch = 127
         if ch < 9 or ch > 2**7:
             # non-ascii chars
-            return
+            return True
         elif ch == 127:
             # Delete char from input box
             # and from _input_chrs
@@ -138,7 +277,10 @@ class View(patterns.Publisher):
             # Notify listener
             pass
             logger.debug(f"Input line: {self._input_chrs}")
-            self.notify(self._input_chrs)
+            if self._input_chrs.startswith(constants.UI_SEARCH):
+                self._search(self._input_chrs[len(constants.UI_SEARCH):].strip())
+            else:
+                self.notify(self._input_chrs)
             self._input_chrs = str()
             # Clear window
             self.input_win.clear()
@@ -147,18 +289,34 @@ class View(patterns.Publisher):
             self.input_win.addch(ch)
             # for debugging
             #self.add_msg('chr', f"{ch} - " + chr(ch))
+        return True
+
+    # stdin is readable: handle every key typed so far
+    def _on_input(self):
+        try:
+            while self._input_getch():
+                pass
+        except KeyboardInterrupt:
+            # KeyboardInterrupt signifies the end of the view
+            logger.debug(f"KeyboardInterrupt detected within the view")
+            if not self.closed.done():
+                self.closed.set_result(None)
 
     async def run(self):
         """
-        Loops and watches input_win 
-        for user input and
-        messages to write to msg_win
+        Waits for user input on stdin and
+        draws queued messages to msg_win
+        until the user quits
         """
-        while True:
-            try:
-                self._input_getch()
-                await asyncio.sleep(0.05)
-            except KeyboardInterrupt:
-                # KeyboardInterrupt signifies the end of the view
-                logger.debug(f"KeyboardInterrupt detected within the view")
-                raise
+        self.loop = asyncio.get_running_loop()
+        self.closed = self.loop.create_future()
+        # Draw what arrived before the loop started
+        self.draw_requested = True
+        self._schedule_draw()
+        self.loop.add_reader(sys.stdin.fileno(), self._on_input)
+        self.loop.add_signal_handler(signal.SIGWINCH, self._on_winch)
+        try:
+            await self.closed
+        finally:
+            self.loop.remove_signal_handler(signal.SIGWINCH)
+            self.loop.remove_reader(sys.stdin.fileno())
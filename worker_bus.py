@@ -0,0 +1,208 @@
+import logging
+import socket
+
+import constants
+from framing import LineFramer
+from poller import Poller
+from send_queue import SendQueue
+from util_server import ServerUtil
+
+"""
+Description:
+
+Local bus between the worker processes of a multi-process server.
+The hub runs in the parent process, owns the global nickname registry and relays
+fan-out lines between workers. Workers talk to it over Unix socket pairs using
+CR-LF framed commands:
+
+    CLAIM <nickname>    ->  GRANT <nickname> | DENY <nickname>
+    RELEASE <nickname>
+    RELAY <channel> <irc line>  ->  forwarded to every other worker
+    DIRECT <nickname> <irc line>  ->  RELAY <nickname> <irc line> to the owning worker
+
+Nicknames are compared with RFC 1459 casemapping.
+
+"""
+BUS_CLAIM = 'CLAIM'
+BUS_GRANT = 'GRANT'
+BUS_DENY = 'DENY'
+BUS_RELEASE = 'RELEASE'
+BUS_RELAY = 'RELAY'
+BUS_DIRECT = 'DIRECT'
+
+BUS_DELIM = constants.COMMAND_END_DELIM.encode(constants.COMMAND_ENCODING)
+BUS_RELAY_PREFIX = f'{BUS_RELAY} '.encode(constants.COMMAND_ENCODING)
+
+# Bus lines carry a full IRC line plus the bus command
+class BusFramer(LineFramer):
+    MAX_LINE_BYTES = 2 * constants.COMMAND_MAX_LENGTH
+
+    def __init__(self):
+        super().__init__(64 * 1024)
+
+"""
+Description:
+
+Worker side of the bus. Writes are blocking (the hub never stops reading),
+nickname claims wait synchronously for the hub's answer.
+Relayed (target, line) pairs are collected in `pending` until the server
+delivers them to its local channel members or to the local target nickname.
+
+"""
+class BusClient:
+    def __init__(self, sock, claim_timeout=1.0):
+        self.socket = sock
+        self.claim_timeout = claim_timeout
+        self.framer = BusFramer()
+        self.pending = list() # relayed (channel or nickname, IRC line) pairs not yet delivered
+        self.replies = dict() # nickname -> granted, answers to outstanding claims
+
+    def __write(self, data):
+        self.socket.sendall(data)
+
+    # Ask the hub for a nickname. Returns True once it is registered globally
+    def claim(self, nickname):
+        self.__write(f'{BUS_CLAIM} {nickname}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+        self.replies[nickname] = None
+        self.socket.settimeout(self.claim_timeout)
+        try:
+            while self.replies[nickname] is None:
+                self.read()
+        except socket.timeout:
+            logging.getLogger().warning(f'Bus did not answer the claim for nickname "{nickname}" in time')
+            return False
+        finally:
+            self.socket.settimeout(None)
+        return self.replies.pop(nickname)
+
+    def release(self, nickname):
+        self.__write(f'{BUS_RELEASE} {nickname}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+
+    # Forward an encoded (CR-LF terminated) IRC line for a channel to the other workers
+    def relay(self, channel, response):
+        self.__write(BUS_RELAY_PREFIX + f'{channel} '.encode(constants.COMMAND_ENCODING) + response)
+
+    # Forward an encoded (CR-LF terminated) IRC line to the worker owning a nickname
+    def direct(self, nickname, response):
+        self.__write(f'{BUS_DIRECT} {nickname} '.encode(constants.COMMAND_ENCODING) + response)
+
+    # Read available bus lines. Raises ConnectionError once the hub is gone
+    def read(self):
+        if not self.framer.recv_into(self.socket):
+            raise ConnectionError('Worker bus closed')
+        for line in self.framer.lines():
+            command, _, params = line.partition(' ')
+            if command == BUS_RELAY:
+                target, _, relayed_line = params.partition(' ')
+                self.pending.append((target, relayed_line))
+            elif command in (BUS_GRANT, BUS_DENY):
+                if params in self.replies:
+                    self.replies[params] = command == BUS_GRANT
+                elif command == BUS_GRANT:
+                    # Answer arrived after the claim timed out
+                    self.release(params)
+
+    # Relayed lines received so far
+    def take_pending(self):
+        pending, self.pending = self.pending, list()
+        return pending
+
+"""
+Description:
+
+Parent side of the bus. Non-blocking event loop that relays between workers
+and keeps the nickname -> worker registry. Exits once every worker is gone.
+
+"""
+class BusHub:
+    def __init__(self, worker_sockets):
+        self.logger = logging.getLogger()
+        self.poller = Poller()
+        self.workers = dict() # socket -> BusFramer
+        self.outbound = dict() # socket -> SendQueue
+        self.nicknames = dict() # casefolded nickname -> owning worker socket
+        for worker_socket in worker_sockets:
+            worker_socket.setblocking(0)
+            self.poller.register(worker_socket, Poller.READ)
+            self.workers[worker_socket] = BusFramer()
+            self.outbound[worker_socket] = SendQueue(64 * 1024 * 1024, 16 * 1024 * 1024)
+
+    def __send(self, worker_socket, data):
+        send_queue = self.outbound[worker_socket]
+        was_empty = not send_queue
+        if not send_queue.push(data):
+            self.logger.warning(f'Bus dropped {len(data)} bytes for an overloaded worker')
+            return
+        if was_empty:
+            self.poller.want_write(worker_socket, True)
+
+    def __flush(self, worker_socket):
+        send_queue = self.outbound[worker_socket]
+        try:
+            while send_queue:
+                send_queue.send(worker_socket)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.__remove_worker(worker_socket)
+            return
+        self.poller.want_write(worker_socket, False)
+
+    def __remove_worker(self, worker_socket):
+        self.poller.unregister(worker_socket)
+        self.workers.pop(worker_socket)
+        self.outbound.pop(worker_socket)
+        for nickname in [nickname for nickname, owner in self.nicknames.items() if owner is worker_socket]:
+            del self.nicknames[nickname]
+        worker_socket.close()
+        self.logger.warning(f'Worker left the bus, {len(self.workers)} workers remaining')
+
+    def __handle(self, worker_socket, line):
+        command, _, params = line.partition(' ')
+        if command == BUS_RELAY:
+            data = f'{line}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING)
+            for other_worker in self.workers:
+                if other_worker is not worker_socket:
+                    self.__send(other_worker, data)
+        elif command == BUS_DIRECT:
+            # Unknown nicknames are dropped silently
+            owner = self.nicknames.get(ServerUtil.casefold_nickname(params.partition(' ')[0]))
+            if owner is not None and owner is not worker_socket:
+                self.__send(owner, f'{BUS_RELAY} {params}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+        elif command == BUS_CLAIM:
+            key = ServerUtil.casefold_nickname(params)
+            granted = key not in self.nicknames
+            if granted:
+                self.nicknames[key] = worker_socket
+            reply = BUS_GRANT if granted else BUS_DENY
+            self.__send(worker_socket, f'{reply} {params}{constants.COMMAND_END_DELIM}'.encode(constants.COMMAND_ENCODING))
+        elif command == BUS_RELEASE:
+            key = ServerUtil.casefold_nickname(params)
+            if self.nicknames.get(key) is worker_socket:
+                del self.nicknames[key]
+        else:
+            self.logger.warning(f'Unknown bus command {repr(line)}')
+
+    def __read(self, worker_socket):
+        framer = self.workers[worker_socket]
+        try:
+            received = framer.recv_into(worker_socket)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            received = 0
+        if not received:
+            self.__remove_worker(worker_socket)
+            return
+        for line in framer.lines():
+            self.__handle(worker_socket, line)
+
+    def run(self):
+        self.logger.info(f'Worker bus is online with {len(self.workers)} workers')
+        while self.workers:
+            for ready_socket, events in self.poller.poll():
+                if events & Poller.READ and ready_socket in self.workers:
+                    self.__read(ready_socket)
+                if events & Poller.WRITE and ready_socket in self.outbound:
+                    self.__flush(ready_socket)
+        self.poller.close()